@@ -0,0 +1,160 @@
+"""
+Analisis mendalam berbasis Google Gemini
+Dipakai bersama oleh app.py, app_cloud.py dan job batch
+"""
+import os
+
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+# Endpoint alternatif, mis. stand-in lokal dari gemini_stub.py (http://127.0.0.1:8089)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+# Naikkan setiap kali isi template prompt diubah agar cache laporan lama tidak dipakai
+PROMPT_VERSION = "v1"
+
+
+def configure_api(api_key, endpoint=GEMINI_API_ENDPOINT):
+    """Configure the Gemini client; returns False when no key is given"""
+    if not api_key:
+        return False
+    # Import berat ditunda sampai analisis pertama agar startup aplikasi cepat
+    import google.generativeai as genai
+    if endpoint:
+        # Transport REST agar endpoint http:// (stand-in lokal) bisa dipakai
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+    else:
+        genai.configure(api_key=api_key)
+    return True
+
+
+def build_prompt(detection_result, confidence):
+    """Build the Gemini prompt for a detection result"""
+    if detection_result == "KOROSI":
+        prompt = f"""Anda adalah ahli material dan korosi. Gambar ini telah dideteksi mengandung KOROSI dengan tingkat kepercayaan {confidence:.2f}%.
+
+Lakukan analisis visual mendalam dan berikan laporan terstruktur yang mencakup:
+
+1. **Deteksi Perubahan Warna**: 
+   - Identifikasi area dengan perubahan warna yang tidak normal
+   - Jelaskan jenis warna yang terlihat (merah/coklat/hijau/putih)
+   - Interpretasi jenis korosi berdasarkan warna
+
+2. **Identifikasi Produk Korosi**:
+   - Jenis produk korosi yang terlihat (karat, kerak, endapan)
+   - Lokasi dan distribusi produk korosi
+   - Estimasi material yang terkorosi
+
+3. **Pitting (Korosi Sumuran)**:
+   - Ada/tidaknya lubang-lubang kecil pada permukaan
+   - Tingkat keparahan pitting jika ada
+   - Area yang paling terdampak
+
+4. **Kerusakan Lapisan Pelindung**:
+   - Kondisi coating/cat pada permukaan
+   - Area yang mengalami pengelupasan atau retakan
+   - Tingkat paparan logam dasar
+
+5. **Deformasi dan Kerusakan Struktural**:
+   - Perubahan bentuk fisik yang terlihat
+   - Tonjolan, lekukan, atau deformasi lain
+   - Potensi dampak pada integritas struktur
+
+6. **Rekomendasi Tindakan**:
+   - Tingkat urgensi penanganan (Rendah/Sedang/Tinggi/Kritis)
+   - Langkah-langkah penanganan yang disarankan
+   - Metode pencegahan untuk masa depan
+
+Berikan analisis yang detail, profesional, dan mudah dipahami."""
+    else:
+        prompt = f"""Anda adalah ahli material dan korosi. Gambar ini telah dideteksi TIDAK mengandung korosi dengan tingkat kepercayaan {confidence:.2f}%.
+
+Lakukan verifikasi visual dan berikan laporan yang mencakup:
+
+1. **Kondisi Permukaan**:
+   - Deskripsi kondisi permukaan secara umum
+   - Warna dan tekstur yang terlihat
+   - Ada/tidaknya tanda-tanda awal degradasi
+
+2. **Penilaian Lapisan Pelindung**:
+   - Kondisi coating/cat jika ada
+   - Integritas lapisan pelindung
+   - Area yang perlu perhatian khusus
+
+3. **Faktor Risiko**:
+   - Identifikasi area yang berpotensi rentan korosi
+   - Faktor lingkungan yang perlu diperhatikan
+   - Tanda-tanda peringatan dini jika ada
+
+4. **Rekomendasi Pemeliharaan**:
+   - Saran perawatan preventif
+   - Frekuensi inspeksi yang disarankan
+   - Langkah-langkah perlindungan tambahan
+
+Berikan analisis yang objektif dan konstruktif."""
+
+    return prompt
+
+
+def encode_image(image):
+    """Encode a PIL image as a Gemini image part (downscaled JPEG/WebP under the byte budget)"""
+    from payload import optimize_image
+    return optimize_image(image).part()
+
+
+def generate_analysis(image, detection_result, confidence, model_name=GEMINI_MODEL_NAME, model=None, timeout=None,
+                      payload=None):
+    """Generate the deep-analysis report; raises on API errors
+
+    `model` can be any object with a compatible generate_content, e.g. the
+    local stand-in from gemini_stub. `payload` is an already encoded
+    payload.Payload (e.g. from the payload cache); otherwise the image is
+    encoded here.
+    """
+    if model is None:
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name)
+    request_options = {"timeout": timeout} if timeout else None
+    response = model.generate_content(
+        [build_prompt(detection_result, confidence), payload.part() if payload else encode_image(image)],
+        request_options=request_options,
+    )
+    return response.text
+
+
+def stream_analysis(image, detection_result, confidence, model_name=GEMINI_MODEL_NAME, model=None, timeout=None,
+                    payload=None, cancel=None):
+    """Yield the deep-analysis report as text chunks while it is generated; raises on API errors
+
+    Stops quietly once cancel (a threading.Event) is set. Stopping early or
+    closing the generator cancels the underlying HTTP/gRPC stream.
+    """
+    if model is None:
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name)
+    request_options = {"timeout": timeout} if timeout else None
+    response = model.generate_content(
+        [build_prompt(detection_result, confidence), payload.part() if payload else encode_image(image)],
+        request_options=request_options,
+        stream=True,
+    )
+    produced = False
+    finished = False
+    try:
+        for chunk in response:
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk tanpa teks, mis. hanya berisi finish_reason
+                continue
+            if text:
+                produced = True
+                yield text
+        finished = True
+    finally:
+        if not finished:
+            # Stream SDK (REST / gRPC) punya cancel(); tanpa ini koneksi tetap terbuka sampai di-GC
+            iterator = getattr(response, "_iterator", None)
+            if hasattr(iterator, "cancel"):
+                iterator.cancel()
+    if not produced:
+        raise RuntimeError("Gemini tidak mengembalikan teks (kemungkinan diblokir filter keamanan)")
@@ -1,11 +1,31 @@
 import streamlit as st
-import tensorflow as tf
-import numpy as np
-from PIL import Image
-import io
-import google.generativeai as genai
 import os
-import requests  # Ganti urllib dengan requests
+import tempfile
+import time
+
+import metrics
+from ai_analysis import GEMINI_MODEL_NAME, PROMPT_VERSION, configure_api, stream_analysis
+from cache import PayloadCache, PredictionCache, ReportCache, content_hash, model_version
+from inference import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MODEL_PATH,
+    INFERENCE_BACKEND,
+    INFERENCE_WORKERS,
+    TFLITE_MODEL_PATH,
+    load_model_from_path,
+    predict_corrosion,
+    predict_corrosion_batch,
+    start_background_import,
+)
+from model_download import download_model
+from model_registry import MODEL_REGISTRY_DIR, ModelRegistry
+from near_duplicates import NEAR_DUPLICATE_DISTANCE, NearDuplicateIndex
+from payload import PAYLOAD_FORMATS, PAYLOAD_MAX_BYTES, PAYLOAD_MAX_SIDE, UPLINK_MBPS, optimize_image
+from prefilter import PREFILTER, load_cascade
+from report_export import ZipSink, export_records
+from preprocessing import ImageTooLargeError, open_image
+from tiling import predict_tiles, render_heatmap_overlay
+from video import DEFAULT_DEDUP_THRESHOLD, DEFAULT_STRIDE, VIDEO_EXTENSIONS, inspect_video
 
 # Konfigurasi halaman
 st.set_page_config(
@@ -14,195 +34,577 @@ st.set_page_config(
     layout="wide"
 )
 
+# Mulai import TensorFlow di background selagi UI dirender
+start_background_import()
+
+@st.cache_resource
+def start_metrics_exporter():
+    """Expose /metrics on METRICS_PORT (once per process) when configured"""
+    return metrics.start_metrics_server()
+
+start_metrics_exporter()
+
 # Konfigurasi Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")  # Ganti dengan API key Anda
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+
+# Konfigurasi model
+MODEL_URL = os.getenv("MODEL_URL", "https://www.dropbox.com/scl/fi/y1vur4zdwhlik4pw2r73s/saved_model.keras?dl=1")
+MODEL_SHA256 = os.getenv("MODEL_SHA256", "")  # Opsional: checksum untuk verifikasi download
 
 # Load model
 @st.cache_resource
 def load_model():
     """Load trained corrosion detection model"""
     try:
-        model_url = "https://www.dropbox.com/scl/fi/y1vur4zdwhlik4pw2r73s/saved_model.keras?dl=1"
-        model_path = "saved_model.keras"
+        # Registry berversi: versi baru ditukar watcher di background, tanpa restart
+        if MODEL_REGISTRY_DIR:
+            st.info(f"🔄 Loading model registry {MODEL_REGISTRY_DIR}...")
+            registry = ModelRegistry(MODEL_REGISTRY_DIR).start()
+            st.success(f"✅ Model {registry.current().describe()} loaded successfully!")
+            return registry
+        
+        # Backend TFLite memakai file .tflite lokal, tidak perlu download model Keras
+        if INFERENCE_BACKEND == "tflite":
+            st.info("🔄 Loading TFLite model...")
+            model = load_model_from_path(TFLITE_MODEL_PATH)
+            st.success("✅ TFLite model loaded successfully!")
+            return model
         
-        # Download model jika belum ada atau file terlalu kecil
-        if not os.path.exists(model_path) or os.path.getsize(model_path) < 10_000_000:  # Minimal 10 MB
+        model_path = DEFAULT_MODEL_PATH
+        
+        # Download model jika belum ada; file baru muncul setelah lengkap & terverifikasi
+        if not os.path.exists(model_path):
             st.info("📥 Downloading model from Dropbox...")
+            progress_bar = st.progress(0)
             
-            # Hapus file lama jika ada
-            if os.path.exists(model_path):
-                os.remove(model_path)
+            def show_progress(downloaded, total):
+                if total:
+                    progress = int((downloaded / total) * 100)
+                    progress_bar.progress(progress, text=f"Downloading: {progress}%")
             
-            # Download dengan requests (support redirect)
             try:
-                response = requests.get(model_url, allow_redirects=True, stream=True)
-                response.raise_for_status()
-                
-                # Ambil total size dari header
-                total_size = int(response.headers.get('content-length', 0))
-                
-                # Download dengan progress
-                with open(model_path, 'wb') as f:
-                    if total_size == 0:
-                        f.write(response.content)
-                    else:
-                        downloaded = 0
-                        progress_bar = st.progress(0)
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                progress = int((downloaded / total_size) * 100)
-                                progress_bar.progress(progress, text=f"Downloading: {progress}%")
-                        progress_bar.empty()
-                
-                file_size = os.path.getsize(model_path)
-                st.success(f"✅ Model downloaded! Size: {file_size / (1024*1024):.2f} MB")
-                
-                # Validasi ukuran file
-                if file_size < 10_000_000:
-                    st.error(f"❌ File terlalu kecil ({file_size / (1024*1024):.2f} MB)! Download mungkin gagal.")
-                    os.remove(model_path)
-                    return None
-                    
+                download_model(MODEL_URL, model_path, sha256=MODEL_SHA256 or None, progress_callback=show_progress)
             except Exception as download_error:
                 st.error(f"❌ Error downloading model: {download_error}")
-                if os.path.exists(model_path):
-                    os.remove(model_path)
                 return None
+            finally:
+                progress_bar.empty()
+            
+            file_size = os.path.getsize(model_path)
+            st.success(f"✅ Model downloaded! Size: {file_size / (1024*1024):.2f} MB")
         
         # Load model
         st.info("🔄 Loading model...")
-        model = tf.keras.models.load_model(model_path)
+        model = load_model_from_path(model_path)
         st.success("✅ Model loaded successfully!")
         return model
         
     except Exception as e:
+        metrics.ERRORS.inc(stage="model_load")
         st.error(f"❌ Error loading model: {e}")
         st.info("💡 Tips:\n- Pastikan link Dropbox valid\n- Coba hapus file 'saved_model.keras' dan refresh\n- Periksa koneksi internet")
         return None
 
-def preprocess_image(image):
-    """Preprocess image for model prediction"""
-    # Resize ke ukuran yang diharapkan model (128x128)
-    img = image.resize((128, 128))
-    # Convert ke array
-    img_array = np.array(img)
-    # Normalize ke 0-1
-    img_array = img_array / 255.0
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+@st.cache_resource
+def get_prediction_cache():
+    """Prediction cache shared by all sessions; the SQLite tier is shared across processes"""
+    if MODEL_REGISTRY_DIR:
+        # Versi diberikan per prediksi, karena registry bisa menukar model kapan saja
+        return PredictionCache(None)
+    model_path = TFLITE_MODEL_PATH if INFERENCE_BACKEND == "tflite" else DEFAULT_MODEL_PATH
+    return PredictionCache(model_version(model_path))
 
-def predict_corrosion(model, image):
-    """Predict if image contains corrosion"""
-    processed_img = preprocess_image(image)
-    prediction = model.predict(processed_img, verbose=0)
-    
-    # Binary classification dengan sigmoid
-    prob = prediction[0][0]
-    predicted_class = 1 if prob > 0.5 else 0
-    confidence = prob if prob > 0.5 else 1 - prob
-    
-    # Class 0: CORROSION, Class 1: NOCORROSION (sesuaikan dengan training Anda)
-    label = "KOROSI" if predicted_class == 0 else "TIDAK ADA KOROSI"
+@st.cache_resource
+def get_prefilter(model_version):
+    """Calibrated color/texture cascade for this model version (PREFILTER=1), or None
+
+    Cached per version: after a hot-swap a cascade fit to the old CNN is not used.
+    """
+    return load_cascade(model_version=model_version) if PREFILTER else None
+
+@st.cache_resource
+def get_near_duplicate_index():
+    """Perceptual-hash index shared by all sessions (NEAR_DUPLICATE_DISTANCE > 0), or None"""
+    return NearDuplicateIndex() if NEAR_DUPLICATE_DISTANCE > 0 else None
+
+def resolve_cache_key(image, image_bytes, digest=None):
+    """Cache key of an image: the content hash of a near-identical earlier image when the index is on
+
+    Returns (key, distance); distance is None unless a near-duplicate was found.
+    """
+    near_duplicates = get_near_duplicate_index()
+    if near_duplicates is None:
+        return image_bytes, None
+    with metrics.stage("phash"):
+        key, distance = near_duplicates.resolve(image, digest or content_hash(image_bytes))
+    metrics.NEAR_DUPLICATES.inc(result="new" if distance is None else "match")
+    return key, distance
+
+def serving_model(model):
+    """(model, cache version) to predict with; under a registry one active version is read once
+
+    Prediction and cache key must use the same snapshot, otherwise a hot-swap
+    between them stores one model's result under another's version.
+    """
+    if isinstance(model, ModelRegistry):
+        model = model.current()
+        return model, model.cache_version
+    return model, None
+
+def predict_with_cache(model, image, image_key):
+    """Predict using the shared cache; returns (label, confidence, from_cache)
+
+    image_key is the raw image bytes or a precomputed cache key (see resolve_cache_key).
+    """
+    prediction_cache = get_prediction_cache()
+    model, version = serving_model(model)
+    version = version or prediction_cache.version
+    cascade = get_prefilter(version)
+    if cascade is not None:
+        # Hasil cascade bergantung pada threshold-nya, jadi ikut menjadi bagian key cache
+        version = f"{version}+{cascade.version}"
+    cached = prediction_cache.get_prediction(image_key, version)
+    metrics.count_cache("prediction", cached is not None)
+    if cached is not None:
+        return cached[0], cached[1], True
     
-    return label, confidence * 100
+    label, confidence = predict_corrosion(model, image, cascade)
+    prediction_cache.set_prediction(image_key, label, confidence, version)
+    return label, confidence, False
+
+@st.cache_resource
+def get_report_cache():
+    """Gemini report cache shared by all sessions (TTL + size eviction)"""
+    return ReportCache()
+
+@st.cache_resource
+def get_payload_cache():
+    """Encoded Gemini image payloads shared by all sessions"""
+    return PayloadCache()
+
+def get_payload(image, image_key):
+    """Downscaled JPEG/WebP payload for Gemini, encoded once per image"""
+    payload_cache = get_payload_cache()
+    cache_key = payload_cache.key(image_key, PAYLOAD_MAX_SIDE, PAYLOAD_MAX_BYTES, PAYLOAD_FORMATS)
+    payload = payload_cache.get(cache_key)
+    metrics.count_cache("payload", payload is not None)
+    if payload is None:
+        with metrics.stage("payload_encode"):
+            payload = optimize_image(image)
+        payload_cache.set(cache_key, payload)
+    return payload
+
+def render_payload_stats(payload):
+    """Show payload size and the encode/upload time saved versus the old full-size PNG"""
+    encode_saved, upload_saved = payload.savings()
+    st.caption(
+        f"📦 Payload gambar: {payload.format.upper()} {payload.size[0]}x{payload.size[1]} "
+        f"(kualitas {payload.quality}), {len(payload.data) / 1024:.0f} KB vs ±{payload.baseline_bytes / 1024 ** 2:.1f} MB PNG — "
+        f"hemat ±{encode_saved:.2f} s encode dan ±{upload_saved:.1f} s upload @ {UPLINK_MBPS:g} Mbps"
+    )
 
-def analyze_corrosion_with_ai(image, detection_result, confidence):
-    """Analyze corrosion details using Gemini AI"""
+def analyze_corrosion_with_ai(image, detection_result, confidence, image_key):
+    """Stream the Gemini deep analysis into the page; returns (analysis, from_cache, payload, ttft)
+
+    Partial text is rendered as chunks arrive. Any rerun (new upload or the
+    cancel button) stops the script at the next render, which closes the
+    stream; only complete reports are cached.
+    """
     
     if not GEMINI_API_KEY:
-        return "⚠️ API Key Gemini tidak ditemukan. Silakan set GEMINI_API_KEY di environment variables."
+        analysis = "⚠️ API Key Gemini tidak ditemukan. Silakan set GEMINI_API_KEY di environment variables."
+        st.markdown(analysis)
+        return analysis, False, None, None
+    
+    report_cache = get_report_cache()
+    cache_key = report_cache.key(image_key, detection_result, confidence, PROMPT_VERSION, GEMINI_MODEL_NAME)
+    cached = report_cache.get(cache_key)
+    metrics.count_cache("report", cached is not None)
+    if cached is not None:
+        st.markdown(cached)
+        return cached, True, None, None
+    
+    payload = get_payload(image, image_key)
+    timing = {}
+    status = st.empty()
+    status.caption("⏳ Menunggu token pertama dari Gemini...")
+    
+    def chunks():
+        start = time.perf_counter()
+        for text in stream_analysis(image, detection_result, confidence, payload=payload):
+            if "ttft" not in timing:
+                timing["ttft"] = time.perf_counter() - start
+                metrics.STAGE_SECONDS.observe(timing["ttft"], stage="gemini_ttft")
+                status.empty()
+            yield text
     
     try:
-        # Convert PIL image to bytes
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # Prepare image for Gemini
-        image_parts = [
-            {
-                "mime_type": "image/png",
-                "data": img_byte_arr
-            }
-        ]
-        
-        # Create prompt based on detection result
-        if detection_result == "KOROSI":
-            prompt = f"""Anda adalah ahli material dan korosi. Gambar ini telah dideteksi mengandung KOROSI dengan tingkat kepercayaan {confidence:.2f}%.
-
-Lakukan analisis visual mendalam dan berikan laporan terstruktur yang mencakup:
-
-1. **Deteksi Perubahan Warna**: 
-   - Identifikasi area dengan perubahan warna yang tidak normal
-   - Jelaskan jenis warna yang terlihat (merah/coklat/hijau/putih)
-   - Interpretasi jenis korosi berdasarkan warna
-
-2. **Identifikasi Produk Korosi**:
-   - Jenis produk korosi yang terlihat (karat, kerak, endapan)
-   - Lokasi dan distribusi produk korosi
-   - Estimasi material yang terkorosi
-
-3. **Pitting (Korosi Sumuran)**:
-   - Ada/tidaknya lubang-lubang kecil pada permukaan
-   - Tingkat keparahan pitting jika ada
-   - Area yang paling terdampak
-
-4. **Kerusakan Lapisan Pelindung**:
-   - Kondisi coating/cat pada permukaan
-   - Area yang mengalami pengelupasan atau retakan
-   - Tingkat paparan logam dasar
-
-5. **Deformasi dan Kerusakan Struktural**:
-   - Perubahan bentuk fisik yang terlihat
-   - Tonjolan, lekukan, atau deformasi lain
-   - Potensi dampak pada integritas struktur
-
-6. **Rekomendasi Tindakan**:
-   - Tingkat urgensi penanganan (Rendah/Sedang/Tinggi/Kritis)
-   - Langkah-langkah penanganan yang disarankan
-   - Metode pencegahan untuk masa depan
-
-Berikan analisis yang detail, profesional, dan mudah dipahami."""
-        else:
-            prompt = f"""Anda adalah ahli material dan korosi. Gambar ini telah dideteksi TIDAK mengandung korosi dengan tingkat kepercayaan {confidence:.2f}%.
-
-Lakukan verifikasi visual dan berikan laporan yang mencakup:
-
-1. **Kondisi Permukaan**:
-   - Deskripsi kondisi permukaan secara umum
-   - Warna dan tekstur yang terlihat
-   - Ada/tidaknya tanda-tanda awal degradasi
+        configure_api(GEMINI_API_KEY)
+        with metrics.stage("gemini"):
+            analysis = st.write_stream(chunks())
+    except Exception as e:
+        metrics.ERRORS.inc(stage="gemini")
+        analysis = f"❌ Error dalam analisis AI: {str(e)}\n\nPastikan API Key Gemini valid dan memiliki akses ke Gemini API."
+        status.empty()
+        st.markdown(analysis)
+        return analysis, False, payload, None
+    
+    status.empty()
+    # Hanya laporan yang berhasil dibuat (tidak dibatalkan) yang disimpan ke cache
+    report_cache.set(cache_key, analysis)
+    return analysis, False, payload, timing.get("ttft")
 
-2. **Penilaian Lapisan Pelindung**:
-   - Kondisi coating/cat jika ada
-   - Integritas lapisan pelindung
-   - Area yang perlu perhatian khusus
+def render_tiled_heatmap(model, upload):
+    """Render tiled high-resolution inference as a corrosion heatmap overlay (computed once per upload)"""
+    if upload["heatmap"] is None:
+        with st.spinner("Memproses tile resolusi tinggi..."):
+            work_image, heatmap, stats = predict_tiles(model, upload["image"])
+            upload["heatmap"] = (render_heatmap_overlay(work_image, heatmap), stats)
+    overlay, stats = upload["heatmap"]
+    
+    st.image(
+        overlay,
+        caption="Heatmap probabilitas korosi per region (merah = probabilitas tinggi)",
+        use_container_width=True
+    )
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Jumlah Tile", stats["tiles"])
+    col2.metric("Probabilitas Maks", f"{stats['max_prob'] * 100:.1f}%")
+    col3.metric("Area Terindikasi", f"{stats['corroded_area']:.1f}%")
+    col4.metric("Waktu Proses", f"{stats['seconds']:.2f} s")
 
-3. **Faktor Risiko**:
-   - Identifikasi area yang berpotensi rentan korosi
-   - Faktor lingkungan yang perlu diperhatikan
-   - Tanda-tanda peringatan dini jika ada
+def get_upload_state(uploaded_file):
+    """Decoded image and results of the current upload, kept in session state across reruns
 
-4. **Rekomendasi Pemeliharaan**:
-   - Saran perawatan preventif
-   - Frekuensi inspeksi yang disarankan
-   - Langkah-langkah perlindungan tambahan
+    Keyed by the SHA-256 of the upload: button clicks, toggles and downloads
+    reuse the decoded image, prediction, heatmap and report instead of
+    decoding and running the CNN again. Raises ImageTooLargeError.
+    """
+    upload = st.session_state.get("upload")
+    if upload is not None and upload["file_id"] == uploaded_file.file_id:
+        return upload
+    
+    image_bytes = uploaded_file.getvalue()
+    key = content_hash(image_bytes)
+    if upload is not None and upload["key"] == key:
+        # File yang sama diupload ulang: hasil sebelumnya tetap berlaku
+        upload["file_id"] = uploaded_file.file_id
+        return upload
+    
+    # Decode diukur terpisah dari preprocess (open_image hanya membaca header)
+    with metrics.stage("decode"):
+        image = open_image(image_bytes)
+        image.load()
+    # Foto burst yang hampir identik memakai prediksi & laporan gambar sebelumnya
+    cache_key, distance = resolve_cache_key(image, image_bytes, key)
+    upload = {
+        "file_id": uploaded_file.file_id,
+        "key": key,
+        "cache_key": cache_key,
+        "near_duplicate": distance,
+        "name": uploaded_file.name,
+        "bytes": image_bytes,
+        "image": image,
+        "prediction": None,
+        "heatmap": None,
+        "analysis": None,
+        "analysis_requested": False,
+    }
+    st.session_state["upload"] = upload
+    return upload
 
-Berikan analisis yang objektif dan konstruktif."""
+@st.fragment
+def render_detection_panel(model, upload):
+    """Uploaded image, detection result and heatmap; the heatmap toggle reruns only this panel"""
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        st.subheader("📷 Gambar yang Diupload")
+        # Byte asli ditampilkan apa adanya, tanpa encode ulang gambar 12 MP setiap rerun
+        st.image(upload["bytes"], use_container_width=True)
+    
+    with col2:
+        st.subheader("🎯 Hasil Deteksi")
         
-        # Generate response using Gemini
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content([prompt, image_parts[0]])
+        if upload["prediction"] is None:
+            with st.spinner("Menganalisis gambar..."):
+                upload["prediction"] = predict_with_cache(model, upload["image"], upload["cache_key"])
+            if upload["prediction"][2] and upload["near_duplicate"] is not None:
+                metrics.NEAR_DUPLICATE_REUSES.inc(kind="prediction")
+        label, confidence, from_cache = upload["prediction"]
         
-        return response.text
+        if label == "KOROSI":
+            st.error(f"### ⚠️ {label}")
+            st.metric("Tingkat Kepercayaan", f"{confidence:.2f}%")
+            st.warning("Korosi terdeteksi pada gambar!")
+        else:
+            st.success(f"### ✅ {label}")
+            st.metric("Tingkat Kepercayaan", f"{confidence:.2f}%")
+            st.info("Tidak ada korosi yang terdeteksi pada gambar.")
         
+        if from_cache and upload["near_duplicate"] is not None:
+            st.caption(f"♻️ Hasil dipakai ulang dari foto yang hampir identik (beda {upload['near_duplicate']} bit pHash)")
+        elif from_cache:
+            st.caption("⚡ Hasil diambil dari cache prediksi")
+    
+    # Mode tiled untuk foto drone resolusi tinggi
+    if st.toggle("🗺️ Heatmap resolusi tinggi (tiled)", help="Klasifikasi tile 128x128 yang tumpang tindih untuk melokalisasi korosi"):
+        render_tiled_heatmap(model, upload)
+
+@st.fragment
+def render_analysis_panel(upload):
+    """Deep-analysis report of the current upload; the download button reruns only this panel"""
+    if upload["analysis_requested"]:
+        # Dikosongkan sebelum streaming agar rerun karena pembatalan tidak memulai ulang analisis
+        upload["analysis_requested"] = False
+        label, confidence, _ = upload["prediction"]
+        upload["analysis"] = analyze_corrosion_with_ai(upload["image"], label, confidence, upload["cache_key"])
+        if upload["analysis"][1] and upload["near_duplicate"] is not None:
+            metrics.NEAR_DUPLICATE_REUSES.inc(kind="report")
+    elif upload["analysis"] is not None:
+        st.markdown(upload["analysis"][0])
+    
+    if upload["analysis"] is None:
+        return
+    analysis, from_cache, payload, ttft = upload["analysis"]
+    
+    if from_cache and upload["near_duplicate"] is not None:
+        st.caption("♻️ Laporan dipakai ulang dari foto yang hampir identik")
+    elif from_cache:
+        st.caption("⚡ Laporan diambil dari cache analisis AI")
+    if ttft is not None:
+        st.caption(f"⏱️ Token pertama dalam {ttft:.2f} s")
+    if payload is not None:
+        render_payload_stats(payload)
+    
+    # Download analysis
+    st.download_button(
+        label="📥 Download Laporan Analisis",
+        data=analysis,
+        file_name="laporan_analisis_korosi.txt",
+        mime="text/plain"
+    )
+
+def render_batch_inspection(model):
+    """Render multi-image batch inspection mode"""
+    uploaded_files = st.file_uploader(
+        "Upload beberapa gambar (JPG, JPEG, PNG)",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        help="Upload banyak gambar objek logam untuk diinspeksi sekaligus"
+    )
+    
+    batch_size = st.slider(
+        "Ukuran Batch",
+        min_value=1,
+        max_value=128,
+        value=DEFAULT_BATCH_SIZE,
+        help="Jumlah gambar yang diproses model dalam satu forward pass"
+    )
+    
+    if not uploaded_files:
+        return
+    
+    if not st.button("🚀 Jalankan Inspeksi Batch", type="primary", use_container_width=True):
+        st.info(f"📁 {len(uploaded_files)} gambar siap diinspeksi.")
+        return
+    
+    prediction_cache = get_prediction_cache()
+    model, version = serving_model(model)
+    rows = []
+    pending = []
+    # Gambar lain dengan key yang sama (duplikat / foto burst) memakai hasil gambar pertama
+    followers = {}
+    
+    # Gambar yang sudah pernah diprediksi diambil langsung dari cache
+    for f in uploaded_files:
+        image_bytes = f.getvalue()
+        key, distance = image_bytes, None
+        if NEAR_DUPLICATE_DISTANCE > 0:
+            try:
+                # Salinan terpisah: hash memakai draft decode yang mengubah objek gambar
+                key, distance = resolve_cache_key(open_image(image_bytes), image_bytes)
+            except ImageTooLargeError:
+                pass
+        cached = prediction_cache.get_prediction(key, version)
+        metrics.count_cache("prediction", cached is not None)
+        if cached is not None:
+            if distance is not None:
+                metrics.NEAR_DUPLICATE_REUSES.inc(kind="prediction")
+            rows.append({"File": f.name, "Hasil": cached[0], "Kepercayaan (%)": round(cached[1], 2),
+                         "Cache": "⚡" if distance is None else "♻️"})
+        elif key in followers:
+            followers[key].append((f.name, distance))
+        else:
+            followers[key] = []
+            pending.append((f.name, image_bytes, key))
+    cache_hits = len(rows)
+    
+    progress_bar = st.progress(0)
+    table = st.empty()
+    if rows:
+        table.dataframe(rows, use_container_width=True)
+    
+    # Gambar yang melebihi MAX_IMAGE_PIXELS dilewati sebelum di-decode
+    images = []
+    for name, image_bytes, key in list(pending):
+        try:
+            images.append(open_image(image_bytes))
+        except ImageTooLargeError as e:
+            metrics.ERRORS.inc(stage="decode")
+            pending.remove((name, image_bytes, key))
+            for skipped in [name] + [follower for follower, _ in followers[key]]:
+                st.warning(f"⚠️ {skipped} dilewati: {e}")
+    
+    # Isi tabel hasil setiap kali satu batch selesai (draft decode: gambar tidak ditampilkan)
+    for start, batch_results in predict_corrosion_batch(model, images, batch_size, draft=True):
+        for offset, (label, confidence) in enumerate(batch_results):
+            name, image_bytes, key = pending[start + offset]
+            prediction_cache.set_prediction(key, label, confidence, version)
+            rows.append({"File": name, "Hasil": label, "Kepercayaan (%)": round(confidence, 2), "Cache": ""})
+            for follower, distance in followers[key]:
+                if distance is not None:
+                    metrics.NEAR_DUPLICATE_REUSES.inc(kind="prediction")
+                rows.append({"File": follower, "Hasil": label, "Kepercayaan (%)": round(confidence, 2), "Cache": "♻️"})
+        progress_bar.progress(len(rows) / len(uploaded_files), text=f"Memproses: {len(rows)}/{len(uploaded_files)} gambar")
+        table.dataframe(rows, use_container_width=True)
+    
+    progress_bar.empty()
+    
+    corroded = sum(1 for row in rows if row["Hasil"] == "KOROSI")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Gambar", len(rows))
+    col2.metric("⚠️ Korosi", corroded)
+    col3.metric("✅ Tidak Ada Korosi", len(rows) - corroded)
+    col4.metric("⚡ Dari Cache", cache_hits)
+    
+    # ZIP (CSV, JSONL, HTML berhalaman + thumbnail) baru dibuat saat tombol diklik, di file sementara
+    files = {f.name: f for f in uploaded_files}
+    
+    def build_export():
+        archive = tempfile.TemporaryFile()
+        sink = ZipSink(archive)
+        records = ({"path": row["File"], "label": row["Hasil"], "confidence": row["Kepercayaan (%)"],
+                    "source": files[row["File"]].getvalue()} for row in rows)
+        export_records(records, sink)
+        sink.close()
+        archive.seek(0)
+        return archive
+    
+    st.download_button(
+        label="📦 Export Hasil (CSV, JSONL, HTML)",
+        data=build_export,
+        file_name="inspeksi_korosi.zip",
+        mime="application/zip",
+        on_click="ignore",
+        use_container_width=True
+    )
+
+def render_video_inspection(model):
+    """Render video / frame-sequence inspection as a corrosion probability timeline"""
+    uploaded_video = st.file_uploader(
+        "Upload video inspeksi atau gambar animasi (MP4, AVI, MOV, MKV, GIF)",
+        type=[ext.lstrip(".") for ext in VIDEO_EXTENSIONS] + ["gif"],
+        help="Rekaman robot crawler; video membutuhkan paket opencv-python-headless"
+    )
+    
+    col1, col2 = st.columns(2)
+    stride = col1.slider("Ambil Setiap N Frame", min_value=1, max_value=30, value=DEFAULT_STRIDE)
+    dedup_threshold = col2.slider(
+        "Ambang Frame Duplikat",
+        min_value=0.0,
+        max_value=20.0,
+        value=DEFAULT_DEDUP_THRESHOLD,
+        help="Selisih rata-rata piksel (0-255) di bawah nilai ini dianggap frame duplikat; 0 = nonaktif"
+    )
+    
+    if uploaded_video is None:
+        return
+    
+    if not st.button("🎬 Jalankan Inspeksi Video", type="primary", use_container_width=True):
+        return
+    
+    timeline = []
+    status = st.empty()
+    
+    def report(stats):
+        status.caption(f"🎞️ {stats['sampled']} frame diproses ({stats['duplicates']} duplikat dilewati)")
+    
+    # OpenCV membutuhkan path file, jadi upload ditulis ke file sementara
+    suffix = os.path.splitext(uploaded_video.name)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(uploaded_video.getvalue())
+    try:
+        with st.spinner("Menganalisis frame video..."):
+            stats = inspect_video(model, tmp.name, timeline.append, stride=stride,
+                                  dedup_threshold=dedup_threshold, progress_callback=report)
+    except ImportError as e:
+        st.error(f"❌ {e}")
+        return
     except Exception as e:
-        return f"❌ Error dalam analisis AI: {str(e)}\n\nPastikan API Key Gemini valid dan memiliki akses ke Gemini API."
+        st.error(f"❌ Video tidak dapat diproses: {str(e)}")
+        return
+    finally:
+        os.remove(tmp.name)
+    status.empty()
+    
+    if not timeline:
+        st.warning("⚠️ Tidak ada frame yang bisa dibaca dari file ini.")
+        return
+    
+    st.line_chart(
+        {"Detik": [row["time"] for row in timeline], "Probabilitas Korosi": [row["probability"] for row in timeline]},
+        x="Detik",
+        y="Probabilitas Korosi"
+    )
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Frame Diprediksi", stats["predicted"])
+    col2.metric("Duplikat Dilewati", stats["duplicates"])
+    col3.metric("⚠️ Frame Korosi", stats["corroded"])
+    col4.metric("Kecepatan", f"{stats['realtime_factor']:.1f}x realtime")
+
+def render_performance_panel():
+    """Per-stage latency, cache hit rate, label distribution and errors of this server process"""
+    load_times = metrics.MODEL_LOAD_SECONDS.values()
+    if load_times:
+        st.metric("Waktu Load Model", f"{max(load_times.values()):.2f} s")
+    
+    rows = metrics.stage_summary()
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.caption("Belum ada data latency.")
+    
+    for cache, (hits, total) in sorted(metrics.cache_hit_rates().items()):
+        st.caption(f"⚡ Cache {cache}: {hits}/{total} hit ({hits / total:.0%})")
+    labels = metrics.totals_by(metrics.PREDICTIONS, "label")
+    if labels:
+        st.caption("🏷️ " + ", ".join(f"{label}: {count}" for label, count in sorted(labels.items())))
+    prefiltered = metrics.totals_by(metrics.PREFILTER, "result")
+    if prefiltered:
+        decided = prefiltered.get("corroded", 0) + prefiltered.get("clean", 0)
+        total = decided + prefiltered.get("ambiguous", 0)
+        audit = metrics.totals_by(metrics.PREFILTER_AUDIT, "result")
+        audited = sum(audit.values())
+        agreement = f", audit CNN {audit.get('agree', 0)}/{audited} sama" if audited else ""
+        st.caption(f"🎨 Prefilter: {decided}/{total} gambar tanpa CNN ({decided / total:.0%}){agreement}")
+    lookups = metrics.totals_by(metrics.NEAR_DUPLICATES, "result")
+    if lookups:
+        reuses = metrics.totals_by(metrics.NEAR_DUPLICATE_REUSES, "kind")
+        st.caption(f"♻️ Near-duplicate: {lookups.get('match', 0)}/{sum(lookups.values())} gambar cocok, dipakai ulang "
+                   f"{reuses.get('prediction', 0)} prediksi dan {reuses.get('report', 0)} laporan AI")
+    errors = metrics.totals_by(metrics.ERRORS, "stage")
+    if errors:
+        st.caption("❌ Error: " + ", ".join(f"{stage}: {count}" for stage, count in sorted(errors.items())))
+    
+    st.download_button(
+        label="📥 Metrics (Prometheus)",
+        data=metrics.REGISTRY.render(),
+        file_name="metrics.prom",
+        mime="text/plain"
+    )
 
 # Main app
 def main():
@@ -237,6 +639,13 @@ def main():
         - ⚠️ Deformasi Struktural
         - 📋 Rekomendasi Tindakan
         """)
+        
+        st.divider()
+        
+        with st.expander("🔧 System Status"):
+            st.caption(f"⚙️ Proses inferensi: {INFERENCE_WORKERS or 1}")
+            if st.toggle("📈 Tampilkan performa", help="Latency per stage, cache hit dan distribusi label proses ini"):
+                render_performance_panel()
     
     # Load model
     model = load_model()
@@ -246,6 +655,25 @@ def main():
         st.info("📁 Letakkan file `saved_model.keras` di direktori yang sama dengan app.py")
         return
     
+    if isinstance(model, ModelRegistry):
+        # Dibaca setiap rerun: berubah begitu watcher menukar versi
+        st.caption(f"🏷️ Versi model: {model.current().describe()}")
+    
+    # Mode inspeksi
+    mode = st.radio(
+        "Mode Inspeksi",
+        ["📷 Gambar Tunggal", "🗂️ Batch (Multi Gambar)", "🎥 Video / Sekuens Frame"],
+        horizontal=True
+    )
+    
+    if mode == "🗂️ Batch (Multi Gambar)":
+        render_batch_inspection(model)
+        return
+    
+    if mode == "🎥 Video / Sekuens Frame":
+        render_video_inspection(model)
+        return
+    
     # File uploader
     uploaded_file = st.file_uploader(
         "Upload gambar (JPG, JPEG, PNG)",
@@ -254,49 +682,31 @@ def main():
     )
     
     if uploaded_file is not None:
-        # Display uploaded image
-        col1, col2 = st.columns([1, 1])
+        try:
+            upload = get_upload_state(uploaded_file)
+        except ImageTooLargeError as e:
+            metrics.ERRORS.inc(stage="decode")
+            st.error(f"❌ {e}")
+            st.stop()
         
-        with col1:
-            st.subheader("📷 Gambar yang Diupload")
-            image = Image.open(uploaded_file)
-            st.image(image, use_container_width=True)
-        
-        with col2:
-            st.subheader("🎯 Hasil Deteksi")
-            
-            # Predict
-            with st.spinner("Menganalisis gambar..."):
-                label, confidence = predict_corrosion(model, image)
-            
-            # Display result
-            if label == "KOROSI":
-                st.error(f"### ⚠️ {label}")
-                st.metric("Tingkat Kepercayaan", f"{confidence:.2f}%")
-                st.warning("Korosi terdeteksi pada gambar!")
-            else:
-                st.success(f"### ✅ {label}")
-                st.metric("Tingkat Kepercayaan", f"{confidence:.2f}%")
-                st.info("Tidak ada korosi yang terdeteksi pada gambar.")
+        render_detection_panel(model, upload)
         
         st.divider()
         
         # AI Analysis
         st.subheader("🤖 Analisis AI Mendalam")
         
+        # Tombol di luar fragment: kliknya memicu rerun penuh yang murah (hasil deteksi dari
+        # session state) dan, tidak seperti rerun fragment, bisa menghentikan stream yang berjalan
         if st.button("🔍 Lakukan Analisis Mendalam", type="primary", use_container_width=True):
-            with st.spinner("AI sedang menganalisis gambar secara detail..."):
-                analysis = analyze_corrosion_with_ai(image, label, confidence)
-            
-            st.markdown(analysis)
-            
-            # Download analysis
-            st.download_button(
-                label="📥 Download Laporan Analisis",
-                data=analysis,
-                file_name="laporan_analisis_korosi.txt",
-                mime="text/plain"
-            )
+            upload["analysis"] = None
+            upload["analysis_requested"] = True
+        cancel_slot = st.empty()
+        if upload["analysis_requested"]:
+            cancel_slot.button("⏹️ Batalkan analisis", key="cancel_analysis")
+        
+        render_analysis_panel(upload)
+        cancel_slot.empty()
 
 if __name__ == "__main__":
     main()
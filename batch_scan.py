@@ -0,0 +1,323 @@
+"""
+Batch scanner headless (tanpa Streamlit) untuk direktori gambar besar
+
+Contoh:
+    python batch_scan.py /data/survey_drone --output hasil.csv
+    python batch_scan.py /data/survey_drone --output hasil.jsonl --batch-size 64 --workers 8
+    python batch_scan.py /data/survey_drone --output hasil.csv --inference-workers auto
+    python batch_scan.py /data/survey_drone --output hasil.csv --rescan
+    python batch_scan.py /data/tangki_03 --output hasil.csv --asset tangki_03 --no-store
+    python batch_scan.py /data/survey_drone --output hasil.csv --prefilter
+
+Hasil dicatat di results_store.py (RESULTS_DB); scan berikutnya hanya
+memproses file baru / berubah atau yang belum diprediksi versi model ini.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from PIL import UnidentifiedImageError
+
+from cache import content_hash, model_version
+from inference import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MODEL_PATH,
+    IMAGE_SIZE,
+    INFERENCE_WORKERS,
+    image_to_array,
+    inflight_batches,
+    label_probabilities,
+    load_model_from_path,
+    parse_workers,
+    submit_batch,
+)
+import metrics
+from prefilter import PREFILTER, load_cascade
+from preprocessing import open_image
+from results_store import RESULTS_DB, ResultsStore, asset_for
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+OUTPUT_FIELDS = ["path", "label", "confidence", "error"]
+
+
+def iter_image_paths(root):
+    """Yield image paths under root lazily, without listing the whole tree"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError as e:
+            print(f"⚠️  Tidak bisa membaca {directory}: {e}", file=sys.stderr)
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        # Urutan deterministik: subdirektori diproses sesuai abjad
+        stack.extend(reversed(subdirs))
+
+
+def decode_image(path, store=None, version=None):
+    """Decode and resize one image file; runs inside the thread pool
+
+    Returns (path, array, error, info). With a results store the file is
+    hashed first (info gets content_hash/size/mtime_ns); content already
+    predicted by this model version comes back as info["result"] instead
+    of being decoded again.
+    """
+    info = {}
+    try:
+        if store is None:
+            with open_image(path) as image:
+                # Draft mode: JPEG langsung di-decode pada skala kecil
+                return path, image_to_array(image, draft=True), None, info
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        info.update(content_hash=content_hash(data), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        if version is not None:
+            # File dipindah / di-touch / duplikat: isi sama sudah pernah diprediksi
+            stored = store.find_by_hash(info["content_hash"], version)
+            if stored is not None:
+                info["result"] = stored
+                return path, None, None, info
+        with open_image(data) as image:
+            return path, image_to_array(image, draft=True), None, info
+    except UnidentifiedImageError:
+        # Pesan sama seperti saat dibuka dari path, bukan repr BytesIO
+        return path, None, f"cannot identify image file {path!r}", info
+    except Exception as e:
+        return path, None, str(e), info
+
+
+def iter_decoded(paths, executor, max_inflight, decode=decode_image, lookup=None):
+    """Decode paths in the pool, keeping at most max_inflight images in memory
+
+    lookup(path) may return a ready (path, array, error, info) tuple for a
+    file that needs no work at all; it then skips the pool entirely.
+    """
+    pending = deque()
+    for path in paths:
+        known = lookup(path) if lookup is not None else None
+        if known is not None:
+            future = Future()
+            future.set_result(known)
+            pending.append(future)
+        else:
+            pending.append(executor.submit(decode, path))
+        if len(pending) >= max_inflight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_batches(decoded, batch_size):
+    """Group decoded images into (items, batch) pairs; failures and stored results pass through alone"""
+    batch = np.empty((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    items = []
+    for path, array, error, info in decoded:
+        if array is None:
+            yield [(path, error, info)], None
+            continue
+        batch[len(items)] = array
+        items.append((path, None, info))
+        if len(items) == batch_size:
+            yield items, batch
+            items = []
+    if items:
+        yield items, batch[:len(items)]
+
+
+def make_unchanged_lookup(store, version, root):
+    """lookup(path) returning the stored result when size and mtime match the record (no file read)"""
+    known = store.known_files(version, root)
+
+    def lookup(path):
+        record = known.get(os.path.abspath(path))
+        if record is None:
+            return None
+        size, mtime_ns, label, confidence, error = record
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return None
+        return path, None, None, {"result": (label, confidence, error), "unchanged": True}
+    return lookup
+
+
+def open_writer(output, fmt, fields=OUTPUT_FIELDS):
+    """Return a write_row(dict) function that streams rows to the output file"""
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        return writer.writerow
+
+    def write_jsonl(row):
+        output.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return write_jsonl
+
+
+def scan(model, paths, write_row, batch_size=DEFAULT_BATCH_SIZE, workers=4, prefetch=2,
+         store=None, version=None, root=".", asset=None, rescan=False, cascade=None):
+    """Run the decode/predict pipeline and stream each result to write_row
+
+    With a ResultsStore every result is recorded under `version`, and
+    (unless rescan) files recorded earlier for the same version are
+    reused instead of predicted again. With a prefilter cascade obvious
+    images are labelled without the CNN.
+    """
+    stats = {"images": 0, "errors": 0, "corroded": 0, "skipped": 0}
+    start_time = time.perf_counter()
+    # Dengan worker pool beberapa batch berjalan sekaligus; urutan output tetap dijaga
+    pending = deque()
+
+    def record(path, info, label=None, confidence=None, error=None):
+        if store is not None and not info.get("unchanged"):
+            return {"asset": asset or asset_for(path, root), "path": path, "model_version": version,
+                    "content_hash": info.get("content_hash"), "size": info.get("size"),
+                    "mtime_ns": info.get("mtime_ns"), "label": label, "confidence": confidence, "error": error}
+        return None
+
+    def finish(items, future):
+        rows = []
+        if future is None:
+            path, error, info = items[0]
+            if "result" in info:
+                label, confidence, error = info["result"]
+                stats["skipped"] += 1
+            else:
+                label = confidence = None
+            if error:
+                write_row({"path": path, "label": "", "confidence": "", "error": error})
+                stats["errors"] += 1
+            else:
+                write_row({"path": path, "label": label, "confidence": round(confidence, 2), "error": ""})
+                if label == "KOROSI":
+                    stats["corroded"] += 1
+            rows.append(record(path, info, label, confidence, error))
+        else:
+            for (path, _, info), (label, confidence) in zip(items, label_probabilities(future.result())):
+                write_row({"path": path, "label": label, "confidence": round(confidence, 2), "error": ""})
+                stats["images"] += 1
+                if label == "KOROSI":
+                    stats["corroded"] += 1
+                rows.append(record(path, info, label, confidence))
+
+            elapsed = time.perf_counter() - start_time
+            print(f"\r🔄 {stats['images']} gambar diprediksi, {stats['skipped']} dilewati "
+                  f"({stats['images'] / elapsed:.1f} img/s)", end="", file=sys.stderr, flush=True)
+        if store is not None:
+            store.record([row for row in rows if row is not None])
+
+    decode = decode_image
+    lookup = None
+    if store is not None:
+        decode = partial(decode_image, store=store, version=None if rescan else version)
+        if not rescan:
+            lookup = make_unchanged_lookup(store, version, root)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Decode berjalan di depan model sejauh `prefetch` batch
+        decoded = iter_decoded(paths, executor, max_inflight=batch_size * prefetch, decode=decode, lookup=lookup)
+        for items, batch in iter_batches(decoded, batch_size):
+            pending.append((items, None if batch is None else submit_batch(model, batch, cascade)))
+            while len(pending) > inflight_batches(model):
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+
+    stats["seconds"] = time.perf_counter() - start_time
+    print(file=sys.stderr)
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan direktori gambar untuk deteksi korosi (tanpa Streamlit)")
+    parser.add_argument("input_dir", help="Direktori gambar yang akan discan (rekursif)")
+    parser.add_argument("-o", "--output", required=True, help="File output (.csv atau .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Format output (default: dari ekstensi file)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path model Keras")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Ukuran batch model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Jumlah thread decode")
+    parser.add_argument("--prefetch", type=int, default=2, help="Jumlah batch yang di-decode di depan model")
+    parser.add_argument("--inference-workers", type=parse_workers, default=INFERENCE_WORKERS,
+                        help="Jumlah proses inferensi (auto = jumlah core, 0 = satu proses)")
+    parser.add_argument("--store", default=RESULTS_DB, help="Database hasil inspeksi (SQLite)")
+    parser.add_argument("--no-store", action="store_true", help="Jangan catat / pakai ulang hasil sebelumnya")
+    parser.add_argument("--rescan", action="store_true", help="Prediksi ulang semua file (hasil tetap dicatat)")
+    parser.add_argument("--asset", help="Nama aset untuk semua file (default: folder teratas di bawah input_dir)")
+    parser.add_argument("--prefilter", action="store_true", default=PREFILTER,
+                        help="Label gambar yang jelas lewat prefilter warna/tekstur (lihat prefilter.py)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = args.format or ("jsonl" if args.output.lower().endswith(".jsonl") else "csv")
+
+    if not os.path.isdir(args.input_dir):
+        print(f"❌ Direktori tidak ditemukan: {args.input_dir}", file=sys.stderr)
+        return 1
+
+    print(f"🔄 Loading model: {args.model}", file=sys.stderr)
+    model = load_model_from_path(args.model, workers=args.inference_workers)
+    if args.inference_workers:
+        # Batch pool harus muat di slot shared memory
+        args.batch_size = min(args.batch_size, model.batch_size)
+
+    cascade = load_cascade(model_version=model_version(args.model)) if args.prefilter else None
+
+    store = version = scan_id = None
+    if not args.no_store:
+        store = ResultsStore(args.store)
+        version = model_version(args.model)
+        if cascade is not None:
+            # Hasil bergantung juga pada threshold prefilter
+            version = f"{version}+{cascade.version}"
+        scan_id = store.start_scan(args.input_dir, version)
+
+    with open(args.output, "w", newline="", encoding="utf-8") as output:
+        write_row = open_writer(output, fmt)
+        stats = scan(
+            model,
+            iter_image_paths(args.input_dir),
+            write_row,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            prefetch=args.prefetch,
+            store=store,
+            version=version,
+            root=args.input_dir,
+            asset=args.asset,
+            rescan=args.rescan,
+            cascade=cascade,
+        )
+
+    if store is not None:
+        store.finish_scan(scan_id, stats)
+        store.close()
+    print(f"✅ Selesai: {stats['images']} gambar diprediksi, {stats['skipped']} tidak berubah, "
+          f"{stats['corroded']} korosi, {stats['errors']} error dalam {stats['seconds']:.1f} detik", file=sys.stderr)
+    if cascade is not None:
+        prefiltered = metrics.totals_by(metrics.PREFILTER, "result")
+        decided = prefiltered.get("corroded", 0) + prefiltered.get("clean", 0)
+        print(f"🎨 Prefilter: {decided} dari {decided + prefiltered.get('ambiguous', 0)} gambar tanpa CNN",
+              file=sys.stderr)
+    print(f"📄 Hasil disimpan ke {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
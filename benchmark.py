@@ -0,0 +1,279 @@
+"""
+Benchmark suite reproducible untuk pipeline inferensi
+
+Stage yang diukur:
+- preprocess_image (decode JPEG + preprocess)
+- predict_corrosion pada beberapa ukuran batch
+- waktu load model (interpreter baru, cold)
+- latency end-to-end per gambar (bytes -> label)
+
+Tanpa --model dipakai model MobileNetV2 sintetis berbobot acak dengan
+bentuk yang sama seperti model asli, sehingga benchmark bisa jalan
+offline tanpa saved_model.keras.
+
+Contoh:
+    python benchmark.py run --output hasil_benchmark.json
+    python benchmark.py run --save-baseline benchmark_baseline.json
+    python benchmark.py run --baseline benchmark_baseline.json --tolerance 0.2
+    python benchmark.py compare hasil_benchmark.json benchmark_baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from cache import CACHE_DIR
+from inference import IMAGE_SIZE, load_model_from_path, predict_batch, predict_corrosion, preprocess_image
+from preprocessing import make_sample_jpeg, open_image
+
+SYNTHETIC_MODEL_PATH = os.path.join(CACHE_DIR, "benchmark", "synthetic_model.keras")
+DEFAULT_BATCH_SIZES = (1, 8, 32, 64)
+DEFAULT_REPEATS = 30
+DEFAULT_LOAD_REPEATS = 3
+# Ukuran foto sintetis untuk stage preprocess & end-to-end
+SAMPLE_SIZE = (1600, 1200)
+# Median lebih lambat dari baseline melebihi toleransi ini dianggap regresi
+DEFAULT_TOLERANCE = 0.15
+
+# Dijalankan di interpreter baru agar load model benar-benar cold
+MODEL_LOAD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import tensorflow
+tensorflow_import = time.perf_counter() - start
+import inference
+start = time.perf_counter()
+inference.load_model_from_path(sys.argv[1])
+print(json.dumps({"tensorflow_import": tensorflow_import, "model_load": time.perf_counter() - start}))
+"""
+
+
+def build_synthetic_model(path=SYNTHETIC_MODEL_PATH, seed=0):
+    """Save a randomly initialized MobileNetV2 classifier with the production input/output shape"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    base = tf.keras.applications.MobileNetV2(input_shape=IMAGE_SIZE + (3,), include_top=False, weights=None)
+    x = tf.keras.layers.GlobalAveragePooling2D()(base.output)
+    output = tf.keras.layers.Dense(1, activation="sigmoid")(x)
+    model = tf.keras.Model(base.input, output)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp.keras"
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def summarize(samples_ms, items=1):
+    """Latency statistics (ms) for a list of timings; items = images per call (None for one-off stages)"""
+    samples = np.asarray(samples_ms)
+    median = float(np.median(samples))
+    return {
+        "median_ms": round(median, 3),
+        "p90_ms": round(float(np.percentile(samples, 90)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "per_image_ms": round(median / items, 3) if items else None,
+        "images_per_sec": round(items * 1000 / median, 1) if items and median else None,
+        "samples": len(samples),
+    }
+
+
+def time_calls(fn, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def sample_jpeg_bytes(size=SAMPLE_SIZE, seed=0):
+    buffer = io.BytesIO()
+    make_sample_jpeg(buffer, size, seed=seed)
+    return buffer.getvalue()
+
+
+def bench_preprocess(jpeg_bytes, repeats):
+    def run():
+        with open_image(jpeg_bytes) as image:
+            preprocess_image(image)
+    return summarize(time_calls(run, repeats))
+
+
+def bench_predict(model, batch_size, repeats):
+    batch = np.random.default_rng(0).random((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    return summarize(time_calls(lambda: predict_batch(model, batch), repeats), items=batch_size)
+
+
+def bench_end_to_end(model, jpeg_bytes, repeats):
+    def run():
+        with open_image(jpeg_bytes) as image:
+            predict_corrosion(model, image)
+    return summarize(time_calls(run, repeats))
+
+
+def bench_model_load(model_path, repeats):
+    """Cold model load (and TensorFlow import) measured in fresh interpreters"""
+    load_ms, import_ms = [], []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", MODEL_LOAD_SCRIPT, model_path],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            env={**os.environ, "TF_CPP_MIN_LOG_LEVEL": "3"},
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Load model gagal: {result.stderr.strip().splitlines()[-1:]}")
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        load_ms.append(timings["model_load"] * 1000)
+        import_ms.append(timings["tensorflow_import"] * 1000)
+    return summarize(load_ms, items=None), summarize(import_ms, items=None)
+
+
+def environment_info(model_path, synthetic):
+    import tensorflow as tf
+    from PIL import __version__ as pillow_version
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tensorflow": tf.__version__,
+        "numpy": np.__version__,
+        "pillow": pillow_version,
+        "model": "synthetic-mobilenetv2" if synthetic else os.path.basename(model_path),
+    }
+
+
+def run(model_path=None, batch_sizes=DEFAULT_BATCH_SIZES, repeats=DEFAULT_REPEATS, load_repeats=DEFAULT_LOAD_REPEATS):
+    """Run all stages and return the results document"""
+    synthetic = model_path is None
+    if synthetic:
+        model_path = SYNTHETIC_MODEL_PATH
+        if not os.path.exists(model_path):
+            print("🔧 Membuat model sintetis...", file=sys.stderr)
+            build_synthetic_model(model_path)
+
+    results = {}
+    print("⏱️ model_load", file=sys.stderr)
+    results["model_load"], results["tensorflow_import"] = bench_model_load(model_path, load_repeats)
+
+    model = load_model_from_path(model_path)
+    jpeg_bytes = sample_jpeg_bytes()
+
+    print("⏱️ preprocess_image", file=sys.stderr)
+    results["preprocess_image"] = bench_preprocess(jpeg_bytes, repeats)
+    for batch_size in batch_sizes:
+        print(f"⏱️ predict_batch_{batch_size}", file=sys.stderr)
+        results[f"predict_batch_{batch_size}"] = bench_predict(model, batch_size, repeats)
+    print("⏱️ end_to_end", file=sys.stderr)
+    results["end_to_end"] = bench_end_to_end(model, jpeg_bytes, repeats)
+
+    return {"environment": environment_info(model_path, synthetic), "results": results}
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare median latencies; returns rows of (stage, baseline_ms, current_ms, change, regressed)"""
+    rows = []
+    for stage, result in current["results"].items():
+        base = baseline["results"].get(stage)
+        if base is None:
+            continue
+        change = result["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0.0
+        rows.append((stage, base["median_ms"], result["median_ms"], change, change > tolerance))
+    return rows
+
+
+def print_results(document):
+    print(f"📊 Benchmark ({document['environment']['model']}, TF {document['environment']['tensorflow']}, "
+          f"{document['environment']['cpu_count']} CPU)")
+    print(f"{'stage':<22}{'median ms':>12}{'p90 ms':>12}{'ms/gambar':>12}{'gambar/s':>12}")
+    for stage, result in document["results"].items():
+        per_image = f"{result['per_image_ms']:.2f}" if result["per_image_ms"] is not None else "-"
+        throughput = f"{result['images_per_sec']:.1f}" if result["images_per_sec"] is not None else "-"
+        print(f"{stage:<22}{result['median_ms']:>12.2f}{result['p90_ms']:>12.2f}{per_image:>12}{throughput:>12}")
+
+
+def print_comparison(rows, tolerance):
+    print(f"\n🔍 Dibandingkan dengan baseline (toleransi {tolerance:.0%})")
+    print(f"{'stage':<22}{'baseline':>12}{'sekarang':>12}{'perubahan':>12}")
+    for stage, base_ms, current_ms, change, regressed in rows:
+        status = "❌" if regressed else "✅"
+        print(f"{stage:<22}{base_ms:>12.2f}{current_ms:>12.2f}{change:>+11.1%} {status}")
+
+
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(document, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline inferensi korosi")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Jalankan benchmark")
+    run_parser.add_argument("--model", help="Path model (default: model MobileNetV2 sintetis)")
+    run_parser.add_argument("--batch-sizes", default=",".join(map(str, DEFAULT_BATCH_SIZES)))
+    run_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument("--load-repeats", type=int, default=DEFAULT_LOAD_REPEATS)
+    run_parser.add_argument("-o", "--output", help="Simpan hasil sebagai JSON")
+    run_parser.add_argument("--baseline", help="Bandingkan dengan JSON baseline; exit 1 jika ada regresi")
+    run_parser.add_argument("--save-baseline", help="Simpan hasil sebagai baseline baru")
+    run_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+
+    compare_parser = subparsers.add_parser("compare", help="Bandingkan dua file hasil")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "compare":
+        document, baseline = load_json(args.current), load_json(args.baseline)
+    else:
+        batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+        document = run(args.model, batch_sizes, args.repeats, args.load_repeats)
+        baseline = load_json(args.baseline) if args.baseline else None
+        for path in (args.output, args.save_baseline):
+            if path:
+                save_json(document, path)
+                print(f"📄 Hasil disimpan ke {path}", file=sys.stderr)
+
+    print_results(document)
+    if baseline is None:
+        return 0
+
+    rows = compare(document, baseline, args.tolerance)
+    print_comparison(rows, args.tolerance)
+    if baseline["environment"].get("cpu_count") != document["environment"].get("cpu_count"):
+        print("⚠️  Baseline diukur pada mesin dengan jumlah CPU berbeda", file=sys.stderr)
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"❌ Regresi: {', '.join(regressions)}")
+        return 1
+    print("✅ Tidak ada regresi")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Cache berlapis (memori LRU + SQLite di disk) untuk hasil prediksi
+dan laporan analisis AI
+
+Tier SQLite dipakai bersama oleh semua sesi Streamlit dan proses lain
+(batch scanner, inference server) yang menunjuk ke file yang sama.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+DEFAULT_MEMORY_ENTRIES = 4096
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+DEFAULT_REPORT_TTL = int(os.getenv("REPORT_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_REPORT_BYTES = 64 * 1024 * 1024
+REPORT_CONFIDENCE_BUCKET = 5
+DEFAULT_PAYLOAD_ENTRIES = 64
+# SUM(size) mahal pada tabel besar, jadi batas ukuran dicek tiap N penulisan
+EVICT_CHECK_INTERVAL = 64
+
+
+def content_hash(data):
+    """SHA-256 hex digest of raw bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_digest(image_bytes):
+    """Content hash used in cache keys; a precomputed digest (str) is used as-is"""
+    # Digest dari luar: mis. gambar kanonik dari index near-duplicate
+    return image_bytes if isinstance(image_bytes, str) else content_hash(image_bytes)
+
+
+def file_hash(path):
+    """SHA-256 hex digest of a file, read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_version(model_path):
+    """Version string of a model file (MODEL_VERSION env overrides the file hash)"""
+    version = os.getenv("MODEL_VERSION")
+    if version:
+        return version
+    return file_hash(model_path)[:16]
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU keyed by string, with optional TTL in seconds"""
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            expires_at, value = self._data[key]
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        """Store value; expires_at (epoch seconds) caps its lifetime below the LRU's own ttl"""
+        if self.ttl:
+            expires_at = min(time.time() + self.ttl, expires_at or float("inf"))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Persistent JSON key/value store with size-based LRU eviction and optional TTL"""
+
+    def __init__(self, path, max_bytes=DEFAULT_DISK_BYTES, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL: banyak proses bisa membaca bersamaan selagi satu proses menulis
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                created_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+        # File cache lama belum punya kolom created_at
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cache)")]
+        if "created_at" not in columns:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """(value, expires_at or None) for key, or None when missing or expired"""
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            expires_at = row[1] + self.ttl if self.ttl else None
+            if expires_at is not None and expires_at < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0]), expires_at
+
+    def set(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(key) + len(encoded.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, accessed_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Hapus entri yang paling lama tidak diakses sampai di bawah batas
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class TieredCache:
+    """Memory tier in front of a disk tier; disk hits are promoted to memory"""
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        entry = self.disk.get_entry(key)
+        if entry is not None:
+            self.stats["disk_hits"] += 1
+            # Sisa umur baris di disk ikut dibawa: promosi tidak memperpanjang TTL
+            value, expires_at = entry
+            self.memory.set(key, value, expires_at)
+            return value
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+
+class PredictionCache(TieredCache):
+    """Cache of (label, confidence) keyed by image bytes hash and model version"""
+
+    def __init__(self, version, path=None, max_bytes=DEFAULT_DISK_BYTES, max_entries=DEFAULT_MEMORY_ENTRIES):
+        path = path or os.path.join(CACHE_DIR, "predictions.sqlite")
+        super().__init__(LRUCache(max_entries), SQLiteCache(path, max_bytes))
+        self.version = version
+
+    def key(self, image_bytes, version=None):
+        # version: versi model per panggilan (registry model yang bisa di-hot-swap)
+        return f"{version or self.version}:{image_digest(image_bytes)}"
+
+    def get_prediction(self, image_bytes, version=None):
+        """Return cached (label, confidence) or None"""
+        value = self.get(self.key(image_bytes, version))
+        return tuple(value) if value is not None else None
+
+    def set_prediction(self, image_bytes, label, confidence, version=None):
+        self.set(self.key(image_bytes, version), [label, float(confidence)])
+
+
+class ReportCache(TieredCache):
+    """Cache of Gemini reports keyed by image, label, confidence bucket, prompt version and model"""
+
+    def __init__(self, path=None, ttl=DEFAULT_REPORT_TTL, max_bytes=DEFAULT_REPORT_BYTES, max_entries=256):
+        path = path or os.path.join(CACHE_DIR, "reports.sqlite")
+        super().__init__(LRUCache(max_entries, ttl=ttl), SQLiteCache(path, max_bytes, ttl=ttl))
+
+    def key(self, image_bytes, detection_result, confidence, prompt_version, model_name):
+        # Confidence dibulatkan ke bucket agar selisih kecil tetap memakai laporan yang sama
+        bucket = int(confidence // REPORT_CONFIDENCE_BUCKET) * REPORT_CONFIDENCE_BUCKET
+        return f"{model_name}:{prompt_version}:{detection_result}:{bucket}:{image_digest(image_bytes)}"
+
+
+class PayloadCache(LRUCache):
+    """In-memory cache of encoded Gemini image payloads keyed by image and encoder settings"""
+
+    def __init__(self, max_entries=DEFAULT_PAYLOAD_ENTRIES):
+        super().__init__(max_entries)
+
+    def key(self, image_bytes, max_side, max_bytes, formats):
+        return f"{max_side}:{max_bytes}:{','.join(formats)}:{image_digest(image_bytes)}"
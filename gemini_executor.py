@@ -0,0 +1,268 @@
+"""
+Executor konkuren untuk analisis Gemini pada job batch
+
+Fitur: konkurensi terbatas, rate limit token bucket, retry dengan
+exponential backoff (hanya untuk error sementara), timeout per request
+dan hedged request opsional.
+
+Contoh (input dari batch_scan.py):
+    python gemini_executor.py hasil.jsonl --output laporan.jsonl --concurrency 8 --rpm 60
+    python gemini_executor.py hasil.jsonl --output laporan.jsonl --stub --hedge-after 1.5
+"""
+import argparse
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RPM = 15
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_TIMEOUT = 60.0
+# Status HTTP yang layak dicoba ulang: timeout, rate limit dan gangguan sementara di server
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """Whether a failed call is transient (timeout, 429, 5xx, connection error) and worth retrying
+
+    API key / permission errors, invalid arguments, safety blocks and bugs
+    such as TypeError fail the same way on every attempt.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # google.api_core.exceptions (dan error stub) membawa status HTTP di .code
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    try:
+        import requests
+    except ImportError:
+        return False
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, rate_per_sec, capacity=None):
+        self.rate = rate_per_sec
+        self.capacity = capacity or max(1.0, rate_per_sec)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class GeminiExecutor:
+    """Run many generate_fn calls concurrently under a shared rate limit"""
+
+    def __init__(self, generate_fn=None, concurrency=DEFAULT_CONCURRENCY, requests_per_minute=DEFAULT_RPM,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=1.0, backoff_max=30.0,
+                 timeout=DEFAULT_TIMEOUT, hedge_after=None):
+        if generate_fn is None:
+            from ai_analysis import generate_analysis
+            generate_fn = generate_analysis
+        self.generate_fn = generate_fn
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.bucket = TokenBucket(requests_per_minute / 60.0)
+
+        self._tasks = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="gemini-task")
+        # Pool terpisah untuk panggilan API agar hedge & timeout tidak memblokir slot task
+        self._calls = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix="gemini-call")
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _call(self, args, kwargs):
+        self.bucket.acquire()
+        self._count("calls")
+        return self._calls.submit(self.generate_fn, *args, timeout=self.timeout, **kwargs)
+
+    def _attempt(self, args, kwargs):
+        """One attempt, optionally hedged; returns the first successful result"""
+        futures = [self._call(args, kwargs)]
+        # Deadline dimulai setelah token rate limit didapat: antre di limiter bukan timeout API
+        deadline = time.monotonic() + self.timeout
+        pending = set(futures)
+        hedged = self.hedge_after is None
+        last_error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_time = remaining if hedged else min(remaining, self.hedge_after)
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins")
+                    return future.result()
+                last_error = future.exception()
+
+            if not hedged and not done:
+                # Request pertama lambat: kirim duplikat dan ambil yang selesai duluan
+                hedged = True
+                self._count("hedges")
+                hedge = self._call(args, kwargs)
+                futures.append(hedge)
+                pending.add(hedge)
+
+        if pending:
+            self._count("timeouts")
+            raise TimeoutError(f"Gemini tidak merespon dalam {self.timeout:.0f} detik")
+        raise last_error
+
+    def _run(self, args, kwargs=None):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._attempt(args, kwargs or {})
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                # Exponential backoff dengan full jitter
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+
+    def submit(self, image, detection_result, confidence):
+        """Queue one analysis; returns a Future of the report text"""
+        return self._tasks.submit(self._run, (image, detection_result, confidence))
+
+    def submit_file(self, path, detection_result, confidence):
+        """Queue one analysis of an image file; it is decoded and encoded in the task, not by the caller
+
+        generate_fn must accept payload= (as ai_analysis.generate_analysis does).
+        """
+        return self._tasks.submit(self._run_file, path, detection_result, confidence)
+
+    def _run_file(self, path, detection_result, confidence):
+        from payload import optimize_image
+        from preprocessing import open_image
+        # Payload (downscale + encode) dibuat sekali per gambar, dipakai ulang oleh retry & hedge;
+        # hanya gambar yang sedang diproses yang di-decode penuh
+        with open_image(path) as image:
+            payload = optimize_image(image)
+        return self._run((None, detection_result, confidence), {"payload": payload})
+
+    def shutdown(self):
+        self._tasks.shutdown(wait=True)
+        self._calls.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_flagged(results_path):
+    """Yield rows labelled KOROSI from a batch_scan JSONL output"""
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            if row.get("label") == "KOROSI":
+                yield row
+
+
+def run_batch(executor, rows, write_row, max_inflight=32):
+    """Analyze rows concurrently, writing each report in input order as it completes"""
+
+    def submit(row):
+        # Gambar dibuka di task: file hilang / rusak sejak scan dicatat sebagai error, job tetap berjalan
+        return executor.submit_file(row["path"], row["label"], float(row["confidence"]))
+
+    def finish(row, future):
+        try:
+            report, error = future.result(), ""
+        except Exception as e:
+            report, error = "", str(e)
+        write_row({"path": row["path"], "label": row["label"], "confidence": row["confidence"],
+                   "report": report, "error": error})
+
+    # Jendela terbatas agar gambar yang menunggu giliran tidak menumpuk di memori
+    pending = deque()
+    completed = 0
+    for row in rows:
+        pending.append((row, submit(row)))
+        if len(pending) >= max_inflight:
+            finish(*pending.popleft())
+            completed += 1
+            print(f"\r🤖 {completed} analisis selesai", end="", file=sys.stderr, flush=True)
+    while pending:
+        finish(*pending.popleft())
+        completed += 1
+        print(f"\r🤖 {completed} analisis selesai", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return completed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analisis Gemini konkuren untuk gambar berlabel KOROSI")
+    parser.add_argument("results", help="Output JSONL dari batch_scan.py")
+    parser.add_argument("-o", "--output", required=True, help="File JSONL laporan")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Batas request per menit (kuota API)")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Timeout per request (detik)")
+    parser.add_argument("--hedge-after", type=float, help="Kirim request duplikat jika belum selesai setelah N detik")
+    parser.add_argument("--stub", action="store_true", help="Gunakan stand-in lokal, bukan Gemini API")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from ai_analysis import configure_api, generate_analysis
+    if args.stub:
+        from gemini_stub import StubGenerativeModel
+        generate_fn = functools.partial(generate_analysis, model=StubGenerativeModel(error_rate=0.05))
+    else:
+        if not configure_api(os.getenv("GEMINI_API_KEY", "")):
+            print("❌ GEMINI_API_KEY belum di-set (gunakan --stub untuk uji lokal)", file=sys.stderr)
+            return 1
+        generate_fn = generate_analysis
+
+    executor = GeminiExecutor(
+        generate_fn,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        timeout=args.timeout,
+        hedge_after=args.hedge_after,
+    )
+
+    start = time.perf_counter()
+    with open(args.output, "w", encoding="utf-8") as output:
+        def write_row(row):
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+        completed = run_batch(executor, iter_flagged(args.results), write_row, max_inflight=args.concurrency * 4)
+    executor.shutdown()
+
+    print(f"✅ {completed} analisis dalam {time.perf_counter() - start:.1f} detik", file=sys.stderr)
+    print(f"   Statistik: {executor.stats}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Stand-in lokal untuk Gemini generate_content (tanpa jaringan / kuota API)
+
+Dua cara pakai:
+- In-process: StubGenerativeModel sebagai pengganti genai.GenerativeModel
+- HTTP: server yang meniru REST API generateContent dan
+  streamGenerateContent, sehingga SDK asli bisa diarahkan ke sini lewat
+  GEMINI_API_ENDPOINT
+
+Latency yang disimulasikan = time-to-first-token (latency_ms + jitter)
+ditambah waktu generasi teks bila --chars-per-sec diisi.
+
+Contoh:
+    python gemini_stub.py serve --port 8089 --latency-ms 800 --jitter-ms 400 --distribution lognormal
+    python gemini_stub.py serve --port 8089 --latency-ms 1500 --chars-per-sec 250
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 GEMINI_API_KEY=stub streamlit run app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DISTRIBUTIONS = ("fixed", "exponential", "lognormal")
+FILLER = "Analisis visual menunjukkan kondisi permukaan yang perlu dipantau. "
+GENERATE_PATH = re.compile(r"^/v1(?:beta)?/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)")
+# Ukuran potongan teks per chunk stream (kira-kira beberapa token)
+STREAM_CHUNK_CHARS = 40
+
+
+class StubResponse:
+    """Minimal object with the .text attribute used from Gemini responses"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class StubBehavior:
+    """Random latency, failures and response text shared by the in-process and HTTP stand-ins
+
+    latency = latency_ms + a draw with mean jitter_ms from the distribution:
+    "exponential" (long tail), "lognormal" (heavier tail, sigma 1) or "fixed".
+    With chars_per_sec the text is additionally "generated" at that rate
+    (0 = the whole text is available immediately after the latency).
+    """
+
+    def __init__(self, latency_ms=800.0, jitter_ms=400.0, error_rate=0.0, response_chars=3000,
+                 distribution="exponential", rate_limit_rate=0.0, seed=None, chars_per_sec=0.0):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution harus salah satu dari {DISTRIBUTIONS}")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.response_chars = response_chars
+        self.distribution = distribution
+        self.chars_per_sec = chars_per_sec
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _jitter_ms(self):
+        if not self.jitter_ms or self.distribution == "fixed":
+            return 0.0
+        if self.distribution == "lognormal":
+            # sigma 1; mu dipilih agar rata-rata = jitter_ms
+            return self._random.lognormvariate(math.log(self.jitter_ms) - 0.5, 1.0)
+        return self._random.expovariate(1 / self.jitter_ms)
+
+    def draw(self):
+        """Return (delay_seconds, outcome) with outcome "ok", "error" or "rate_limited" """
+        with self._lock:
+            self.calls += 1
+            delay = (self.latency_ms + self._jitter_ms()) / 1000
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return delay, "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, "error"
+        return delay, "ok"
+
+    def text(self, model_name, prompt):
+        header = f"## Laporan Analisis ({model_name})\n\n"
+        body = (prompt[:200] + "\n\n") if prompt else ""
+        text = header + body
+        if len(text) < self.response_chars:
+            text += FILLER * (-(-(self.response_chars - len(text)) // len(FILLER)))
+        return text[:self.response_chars]
+
+    def generation_seconds(self, chars):
+        return chars / self.chars_per_sec if self.chars_per_sec else 0.0
+
+    def chunks(self, text):
+        """Yield text in stream-sized pieces, sleeping to simulate the generation rate"""
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            piece = text[start:start + STREAM_CHUNK_CHARS]
+            if start:
+                time.sleep(self.generation_seconds(len(piece)))
+            yield piece
+
+
+class StubAPIError(RuntimeError):
+    """Stub API error carrying the HTTP status in .code, like google.api_core exceptions"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class StubGenerativeModel:
+    """Mimics genai.GenerativeModel.generate_content with configurable latency and errors"""
+
+    def __init__(self, model_name="gemini-stub", latency_ms=800.0, jitter_ms=400.0, error_rate=0.0,
+                 response_chars=3000, seed=None, distribution="exponential", rate_limit_rate=0.0, chars_per_sec=0.0):
+        self.model_name = model_name
+        self.behavior = StubBehavior(latency_ms, jitter_ms, error_rate, response_chars, distribution,
+                                     rate_limit_rate, seed, chars_per_sec)
+
+    @property
+    def calls(self):
+        return self.behavior.calls
+
+    def generate_content(self, contents, request_options=None, stream=False):
+        delay, outcome = self.behavior.draw()
+
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"stub timeout setelah {timeout:.1f}s")
+
+        time.sleep(delay)
+        if outcome == "rate_limited":
+            raise StubAPIError(429, "Resource has been exhausted (stub)")
+        if outcome == "error":
+            raise StubAPIError(503, "Service Unavailable (stub)")
+
+        prompt = contents[0] if contents else ""
+        text = self.behavior.text(self.model_name, prompt)
+        if stream:
+            # Seperti SDK: iterable chunk dengan atribut .text
+            return (StubResponse(piece) for piece in self.behavior.chunks(text))
+        time.sleep(self.behavior.generation_seconds(len(text)))
+        return StubResponse(text)
+
+
+def make_handler(behavior):
+    """Request handler imitating the REST generateContent endpoint"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_stream(self, model_name, text, prompt):
+            # streamGenerateContent (REST, tanpa alt=sse): satu array JSON yang dikirim bertahap
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, piece in enumerate(behavior.chunks(text)):
+                    chunk = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]}
+                    self._write_chunk((("[" if i == 0 else ",\r\n") + json.dumps(chunk)).encode("utf-8"))
+                final = {
+                    "candidates": [{"content": {"parts": [{"text": ""}], "role": "model"}, "finishReason": "STOP",
+                                    "index": 0}],
+                    "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+                    "modelVersion": model_name,
+                }
+                self._write_chunk((",\r\n" + json.dumps(final) + "]").encode("utf-8"))
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client membatalkan stream di tengah jalan
+                self.close_connection = True
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "calls": behavior.calls})
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+        def do_POST(self):
+            match = GENERATE_PATH.match(self.path)
+            # Body (termasuk gambar) selalu dibaca penuh agar biaya upload ikut terukur
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            if match is None:
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                return
+            try:
+                request = json.loads(raw or b"{}")
+                parts = request["contents"][0]["parts"]
+                prompt = next((part["text"] for part in parts if "text" in part), "")
+            except (ValueError, KeyError, IndexError):
+                self._send_json(400, {"error": {"code": 400, "message": "invalid request", "status": "INVALID_ARGUMENT"}})
+                return
+
+            delay, outcome = behavior.draw()
+            time.sleep(delay)
+            if outcome == "rate_limited":
+                self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (stub)",
+                                                "status": "RESOURCE_EXHAUSTED"}})
+                return
+            if outcome == "error":
+                self._send_json(503, {"error": {"code": 503, "message": "Service Unavailable (stub)",
+                                                "status": "UNAVAILABLE"}})
+                return
+
+            text = behavior.text(match.group("model"), prompt)
+            if match.group("method") == "streamGenerateContent":
+                self._send_stream(match.group("model"), text, prompt)
+                return
+            time.sleep(behavior.generation_seconds(len(text)))
+            self._send_json(200, {
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }],
+                "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_server(behavior, host="127.0.0.1", port=8089):
+    """Start the HTTP stand-in in a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(behavior))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="gemini-stub").start()
+    return server
+
+
+def add_behavior_args(parser):
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Latency dasar per request")
+    parser.add_argument("--jitter-ms", type=float, default=400.0, help="Rata-rata latency tambahan acak")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="exponential")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraksi request yang gagal 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraksi request yang gagal 429")
+    parser.add_argument("--response-chars", type=int, default=3000, help="Panjang teks laporan")
+    parser.add_argument("--chars-per-sec", type=float, default=0.0,
+                        help="Kecepatan generasi teks setelah token pertama (0 = langsung)")
+    parser.add_argument("--seed", type=int)
+
+
+def behavior_from_args(args):
+    return StubBehavior(args.latency_ms, args.jitter_ms, args.error_rate, args.response_chars,
+                        args.distribution, args.rate_limit_rate, args.seed, args.chars_per_sec)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in lokal Gemini generateContent")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Jalankan server HTTP stand-in")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8089)
+    add_behavior_args(serve_parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(behavior_from_args(args)))
+    server.daemon_threads = True
+    print(f"🧪 Gemini stand-in di http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms:.0f}+{args.distribution}({args.jitter_ms:.0f}) ms, "
+          f"error {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%}, "
+          f"{args.chars_per_sec or '∞'} karakter/detik)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
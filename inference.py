@@ -0,0 +1,282 @@
+"""
+Inti inferensi model deteksi korosi
+Dipakai bersama oleh app.py, app_cloud.py dan mode batch
+"""
+import importlib
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+from preprocessing import IMAGE_SIZE, BatchBuffer, prepare_image, to_float32
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MODEL_PATH = "saved_model.keras"
+
+# Backend inferensi: "keras" (default) atau "tflite"
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", "saved_model.tflite")
+# Kompilasi XLA untuk fungsi inferensi Keras (opsional, dikompilasi ulang per ukuran batch)
+INFERENCE_XLA = os.getenv("INFERENCE_XLA", "0").lower() in ("1", "true", "yes")
+# Ukuran batch yang di-warm-up saat load: gambar tunggal dan batch penuh
+WARMUP_BATCH_SIZES = (1, DEFAULT_BATCH_SIZE)
+
+
+def available_cpus():
+    """CPU cores this process may run on (respects affinity / container cpusets)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parse_workers(value):
+    """Worker count from an env/CLI value: "auto" = available CPU cores, 0 = single process"""
+    if str(value).strip().lower() == "auto":
+        return available_cpus()
+    return int(value or 0)
+
+
+# Jumlah proses worker inferensi (worker_pool.py); 0 = model di proses ini
+INFERENCE_WORKERS = parse_workers(os.getenv("INFERENCE_WORKERS", "0"))
+
+
+_background_import = None
+
+
+def start_background_import():
+    """Import TensorFlow in a daemon thread so the first page paint does not wait on it"""
+    global _background_import
+    # Dengan worker pool TensorFlow hanya dibutuhkan di proses worker
+    if _background_import is None and INFERENCE_BACKEND != "tflite" and not INFERENCE_WORKERS:
+        _background_import = threading.Thread(
+            target=importlib.import_module, args=("tensorflow",), name="tensorflow-import", daemon=True
+        )
+        _background_import.start()
+
+
+class CompiledModel:
+    """Keras model behind one traced tf.function with a fixed input signature
+
+    model.predict builds a data adapter, callbacks and a fresh step function
+    on every call, which dominates the latency of a single 128x128 image.
+    The wrapped function is traced once (batch dimension left dynamic) and
+    exposes the same predict / predict_on_batch interface as TFLiteModel.
+    """
+
+    def __init__(self, model, jit_compile=INFERENCE_XLA):
+        import tensorflow as tf
+
+        self.model = model
+        self.jit_compile = jit_compile
+        signature = [tf.TensorSpec([None, IMAGE_SIZE[1], IMAGE_SIZE[0], 3], tf.float32)]
+
+        @tf.function(input_signature=signature, jit_compile=jit_compile, reduce_retracing=True)
+        def serve(batch):
+            return model(batch, training=False)
+
+        self._serve = serve
+
+    def __getattr__(self, name):
+        # input_shape, summary(), dll. diteruskan ke model Keras aslinya
+        return getattr(self.model, name)
+
+    def predict_on_batch(self, batch):
+        """Run one batch through the compiled function, returning float probabilities"""
+        return self._serve(np.asarray(batch, dtype=np.float32)).numpy()
+
+    def predict(self, batch, verbose=0):
+        """Same call signature as keras Model.predict"""
+        return self.predict_on_batch(batch)
+
+
+def warmup(model, batch_sizes=WARMUP_BATCH_SIZES):
+    """Run dummy batches so tracing / XLA compilation happens before the first real request"""
+    with metrics.stage("warmup"):
+        for batch_size in batch_sizes:
+            model.predict_on_batch(np.zeros((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32))
+
+
+def load_model_from_path(model_path=DEFAULT_MODEL_PATH, backend=None, compiled=True, num_threads=None,
+                         workers=None):
+    """Load the model for the configured backend without any Streamlit dependency
+
+    Keras models are wrapped in CompiledModel (unless compiled=False) and
+    every backend is warmed up, so the returned model is ready to serve.
+    With workers > 0 (default INFERENCE_WORKERS) an InferencePool of that
+    many processes is returned instead, each holding its own model.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if model_path.endswith(".tflite"):
+        backend = "tflite"
+    workers = INFERENCE_WORKERS if workers is None else workers
+
+    start = time.perf_counter()
+    if workers > 0:
+        from worker_pool import InferencePool
+        model = InferencePool(model_path, workers, backend=backend)
+    elif backend == "tflite":
+        from tflite_backend import TFLiteModel
+        model = TFLiteModel(model_path if model_path.endswith(".tflite") else TFLITE_MODEL_PATH,
+                            num_threads=num_threads)
+    else:
+        # Import di dalam fungsi agar tool CLI tetap cepat untuk --help
+        import tensorflow as tf
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        model = tf.keras.models.load_model(model_path)
+        if compiled:
+            model = CompiledModel(model)
+    if workers <= 0:
+        # Worker pool sudah melakukan warm-up di setiap proses
+        warmup(model)
+
+    elapsed = time.perf_counter() - start
+    metrics.MODEL_LOAD_SECONDS.set(elapsed, backend=backend)
+    metrics.STAGE_SECONDS.observe(elapsed, stage="model_load")
+    return model
+
+
+def preprocess_image(image):
+    """Preprocess image for model prediction"""
+    with metrics.stage("preprocess"):
+        # Orientasi EXIF, channel RGB dan resize ke 128x128 (tanpa draft: gambar masih ditampilkan)
+        img = prepare_image(image, draft=False)
+        # Normalize ke 0-1 langsung sebagai float32 + batch dimension
+        return np.expand_dims(to_float32(img), axis=0)
+
+
+def interpret_prediction(prob):
+    """Map sigmoid output to (label, confidence percent)"""
+    # Binary classification dengan sigmoid
+    prob = float(prob)
+    predicted_class = 1 if prob > 0.5 else 0
+    confidence = prob if prob > 0.5 else 1 - prob
+
+    # Class 0: CORROSION, Class 1: NOCORROSION (sesuaikan dengan training Anda)
+    label = "KOROSI" if predicted_class == 0 else "TIDAK ADA KOROSI"
+
+    return label, confidence * 100
+
+
+def predict_corrosion(model, image, cascade=None):
+    """Predict if image contains corrosion (obvious cases decided by the prefilter cascade, if given)"""
+    processed_img = preprocess_image(image)
+    if cascade is not None:
+        prob = submit_batch(model, processed_img, cascade).result()[0]
+    else:
+        with metrics.stage("predict"):
+            # predict_on_batch: tanpa overhead data adapter & callbacks model.predict per gambar
+            prob = model.predict_on_batch(processed_img)[0][0]
+    label, confidence = interpret_prediction(prob)
+    metrics.count_labels([label])
+    return label, confidence
+
+
+def image_to_array(image, out=None, draft=False):
+    """Convert a PIL image to a normalized float32 (128, 128, 3) array"""
+    return to_float32(prepare_image(image, draft=draft), out=out)
+
+
+def preprocess_batch(images, draft=False):
+    """Decode and stack images into one float32 batch tensor"""
+    return BatchBuffer(len(images)).fill(images, draft=draft)
+
+
+def predict_proba(model, batch):
+    """Raw sigmoid outputs (probability of class 1) for a preprocessed batch"""
+    # predict_on_batch melewati data adapter & callbacks milik model.predict
+    with metrics.stage("predict_batch"):
+        return np.asarray(model.predict_on_batch(batch)).reshape(-1)
+
+
+def label_probabilities(probs):
+    """Interpret a batch of sigmoid outputs as (label, confidence) pairs"""
+    results = [interpret_prediction(p) for p in probs]
+    metrics.count_labels(label for label, _ in results)
+    return results
+
+
+def predict_batch(model, batch):
+    """Run one forward pass over a preprocessed batch"""
+    return label_probabilities(predict_proba(model, batch))
+
+
+def submit_batch(model, batch, cascade=None):
+    """Start predicting a batch; returns a Future of probabilities
+
+    An InferencePool copies the batch into shared memory and returns at
+    once, so callers can keep several batches in flight; any other model
+    runs synchronously. Either way `batch` may be reused after the call.
+    With a prefilter cascade only the images it cannot decide (plus a
+    small audit sample) reach the model.
+    """
+    if cascade is not None:
+        return _submit_cascade(model, batch, cascade)
+    if hasattr(model, "submit"):
+        return model.submit(batch)
+    future = Future()
+    try:
+        future.set_result(predict_proba(model, batch))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _submit_cascade(model, batch, cascade):
+    probs, audit = cascade.probabilities(batch)
+    indices = np.flatnonzero(np.isnan(probs) | audit)
+    future = Future()
+    if not len(indices):
+        future.set_result(probs)
+        return future
+
+    def merge(model_future):
+        try:
+            model_probs = np.asarray(model_future.result()).reshape(-1)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        decided = probs[indices]
+        cascade.record_audit(decided, model_probs)
+        # Gambar audit tetap memakai keputusan cascade; CNN hanya mengukur agreement
+        probs[indices] = np.where(np.isnan(decided), model_probs, decided)
+        future.set_result(probs)
+
+    # Fancy indexing menyalin, jadi batch asli tetap boleh dipakai ulang pemanggil
+    submit_batch(model, batch[indices]).add_done_callback(merge)
+    return future
+
+
+def inflight_batches(model):
+    """How many submitted batches a front-end should keep in flight"""
+    return getattr(model, "workers", 0)
+
+
+def predict_corrosion_batch(model, images, batch_size=DEFAULT_BATCH_SIZE, draft=False):
+    """Predict many images, yielding the results of each batch as it finishes"""
+    if hasattr(model, "submit_images"):
+        # Pool: gambar dipreprocess langsung ke slot shared memory, beberapa batch sekaligus
+        batch_size = min(batch_size, model.batch_size)
+        pending = deque()
+        for start in range(0, len(images), batch_size):
+            with metrics.stage("preprocess_batch"):
+                pending.append((start, model.submit_images(images[start:start + batch_size], draft=draft)))
+            if len(pending) > inflight_batches(model):
+                done_start, future = pending.popleft()
+                yield done_start, label_probabilities(future.result())
+        for done_start, future in pending:
+            yield done_start, label_probabilities(future.result())
+        return
+
+    # Satu buffer batch dipakai ulang untuk semua batch
+    buffer = BatchBuffer(batch_size)
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        with metrics.stage("preprocess_batch"):
+            batch = buffer.fill(chunk, draft=draft)
+        yield start, predict_batch(model, batch)
@@ -0,0 +1,315 @@
+"""
+HTTP inference server dengan dynamic micro-batching
+
+Request tunggal yang datang bersamaan digabung menjadi satu batch
+(dibatasi ukuran batch maksimum dan waktu tunggu maksimum) sebelum
+satu kali pemanggilan model.
+
+Contoh:
+    python inference_server.py serve --port 8000 --max-batch-size 32 --max-wait-ms 10
+    python inference_server.py serve --port 8000 --inference-workers auto
+    python inference_server.py serve --port 8000 --registry models --cache   # hot-swap versi model
+    python inference_server.py client gambar1.jpg gambar2.jpg --concurrency 16 --requests 500
+    curl http://127.0.0.1:8000/metrics   # metrik format Prometheus
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import metrics
+from cache import PredictionCache, model_version
+from inference import (
+    DEFAULT_MODEL_PATH,
+    IMAGE_SIZE,
+    INFERENCE_WORKERS,
+    image_to_array,
+    label_probabilities,
+    load_model_from_path,
+    parse_workers,
+    submit_batch,
+)
+from model_registry import MODEL_REGISTRY_DIR, ModelRegistry
+from preprocessing import ImageTooLargeError, open_image
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 10
+
+
+class MicroBatcher:
+    """Collect concurrent single-image requests into batched model calls"""
+
+    def __init__(self, model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._buffer = np.empty((max_batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, array):
+        """Queue one preprocessed image; returns a Future of (label, confidence, batch_size, cache_version)"""
+        future = Future()
+        self._queue.put((array, future))
+        return future
+
+    def _collect(self):
+        # Blok sampai ada request pertama, lalu tunggu maksimal max_wait untuk sisanya
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    @staticmethod
+    def _deliver(items, version, batch_future):
+        try:
+            results = label_probabilities(batch_future.result())
+        except Exception as e:
+            metrics.ERRORS.inc(stage="predict_batch")
+            for _, future in items:
+                future.set_exception(e)
+            return
+        for (_, future), (label, confidence) in zip(items, results):
+            future.set_result((label, confidence, len(items), version))
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            batch = self._buffer[:len(items)]
+            for i, (array, _) in enumerate(items):
+                batch[i] = array
+            # Registry: satu snapshot versi per batch, dipakai untuk prediksi DAN key cache,
+            # agar hot-swap di tengah jalan tidak menyimpan hasil di bawah versi lain
+            model = self.model.current() if isinstance(self.model, ModelRegistry) else self.model
+            version = getattr(model, "cache_version", None)
+            # Dengan worker pool batch langsung diserahkan dan batch berikutnya dikumpulkan
+            # selagi worker menghitung; tanpa pool submit_batch berjalan sinkron
+            try:
+                batch_future = submit_batch(model, batch)
+            except Exception as e:
+                batch_future = Future()
+                batch_future.set_exception(e)
+            batch_future.add_done_callback(lambda f, items=items, version=version: self._deliver(items, version, f))
+
+
+def make_handler(batcher, request_timeout, prediction_cache=None):
+    """Build the request handler class bound to one MicroBatcher"""
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                health = {"status": "ok"}
+                if isinstance(batcher.model, ModelRegistry):
+                    health["model"] = batcher.model.current().describe()
+                self._send_json(200, health)
+            elif self.path == "/metrics":
+                body = metrics.REGISTRY.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            start = time.perf_counter()
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length)
+
+            if prediction_cache is not None:
+                # Lookup memakai versi aktif saat ini; hasil baru disimpan di bawah versi yang memprediksi
+                model = batcher.model.current() if isinstance(batcher.model, ModelRegistry) else batcher.model
+                version = getattr(model, "cache_version", None)
+                cached = prediction_cache.get_prediction(data, version)
+                metrics.count_cache("prediction", cached is not None)
+                if cached is not None:
+                    self._send_json(200, {
+                        "label": cached[0],
+                        "confidence": round(cached[1], 2),
+                        "batch_size": 0,
+                        "cached": True,
+                        "model_version": version,
+                        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                    })
+                    return
+
+            # Decode di thread request agar paralel; hanya forward pass yang di-batch
+            try:
+                with metrics.stage("decode"), open_image(data) as image:
+                    array = image_to_array(image, draft=True)
+            except ImageTooLargeError as e:
+                metrics.ERRORS.inc(stage="decode")
+                self._send_json(413, {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.ERRORS.inc(stage="decode")
+                self._send_json(400, {"error": f"gambar tidak valid: {e}"})
+                return
+
+            try:
+                with metrics.stage("batch_wait"):
+                    label, confidence, batch_size, version = batcher.submit(array).result(timeout=request_timeout)
+            except Exception as e:
+                metrics.ERRORS.inc(stage="predict")
+                self._send_json(500, {"error": str(e)})
+                return
+
+            if prediction_cache is not None:
+                prediction_cache.set_prediction(data, label, confidence, version)
+
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="request")
+            self._send_json(200, {
+                "label": label,
+                "confidence": round(confidence, 2),
+                "batch_size": batch_size,
+                "cached": False,
+                "model_version": version,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+
+        def log_message(self, format, *args):
+            # Log per-request dimatikan agar tidak membebani hot path
+            pass
+
+    return InferenceHandler
+
+
+def serve(args):
+    if args.registry:
+        print(f"🔄 Loading model registry: {args.registry}")
+        model = ModelRegistry(args.registry, workers=args.inference_workers).start()
+    else:
+        print(f"🔄 Loading model: {args.model}")
+        model = load_model_from_path(args.model, workers=args.inference_workers)
+    if args.inference_workers:
+        args.max_batch_size = min(args.max_batch_size, model.batch_size)
+    batcher = MicroBatcher(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    prediction_cache = None
+    if args.cache:
+        prediction_cache = PredictionCache(None if args.registry else model_version(args.model))
+
+    handler = make_handler(batcher, args.timeout, prediction_cache)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"🚀 Server berjalan di http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms, "
+          f"{args.inference_workers or 1} proses inferensi)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def run_client(args):
+    import requests
+
+    payloads = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            payloads.append(f.read())
+
+    url = args.url.rstrip("/") + "/predict"
+    session_local = threading.local()
+
+    def send(i):
+        # Satu session per thread agar koneksi keep-alive dipakai ulang
+        if not hasattr(session_local, "session"):
+            session_local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session_local.session.post(url, data=payloads[i % len(payloads)],
+                                                  headers={"Content-Type": "application/octet-stream"})
+            status, body = response.status_code, response.json()
+        except (requests.RequestException, ValueError) as e:
+            status, body = 0, {"error": str(e)}
+        latency = (time.perf_counter() - start) * 1000
+        return latency, status, body
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, status, _ in results if status == 200]
+    batch_sizes = [body["batch_size"] for _, status, body in results if status == 200 and not body["cached"]]
+    errors = len(results) - len(latencies)
+
+    print(f"📊 {len(results)} request, concurrency {args.concurrency}")
+    print(f"   Throughput     : {len(results) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"   Latency p50    : {np.percentile(latencies, 50):.1f} ms")
+        print(f"   Latency p99    : {np.percentile(latencies, 99):.1f} ms")
+        print(f"   Cache hit      : {len(latencies) - len(batch_sizes)}")
+        if batch_sizes:
+            print(f"   Rata-rata batch: {sum(batch_sizes) / len(batch_sizes):.1f}")
+    print(f"   Error          : {errors}")
+    return 0 if errors == 0 else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP inference server deteksi korosi")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Jalankan server inferensi")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path model Keras")
+    serve_parser.add_argument("--registry", default=MODEL_REGISTRY_DIR,
+                              help="Direktori registry model berversi (hot-swap; menggantikan --model)")
+    serve_parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    serve_parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    serve_parser.add_argument("--timeout", type=float, default=30.0, help="Timeout per request (detik)")
+    serve_parser.add_argument("--cache", action="store_true", help="Gunakan cache prediksi bersama (memori + SQLite)")
+    serve_parser.add_argument("--inference-workers", type=parse_workers, default=INFERENCE_WORKERS,
+                              help="Jumlah proses inferensi (auto = jumlah core, 0 = satu proses)")
+
+    client_parser = subparsers.add_parser("client", help="Kirim request uji ke server")
+    client_parser.add_argument("images", nargs="+", help="Gambar yang dikirim (bergiliran)")
+    client_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    client_parser.add_argument("--concurrency", type=int, default=8)
+    client_parser.add_argument("--requests", type=int, default=100)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+    return run_client(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Load generator offline untuk alur deteksi + analisis mendalam
+
+Setiap virtual user menjalankan alur yang sama dengan aplikasi:
+decode gambar -> deteksi korosi -> (sebagian) encode payload + Gemini.
+Gemini dilayani stand-in HTTP lokal (gemini_stub.py) lewat SDK asli,
+sehingga kapasitas bisa diukur tanpa jaringan atau biaya API.
+
+Contoh:
+    python loadtest.py --concurrency 8 --duration 60
+    python loadtest.py --images dataset/test --concurrency 16 --flows 500 --analysis-ratio 0.3
+    python loadtest.py --detect-url http://127.0.0.1:8000 --gemini-endpoint http://127.0.0.1:8089
+    python loadtest.py --latency-ms 1500 --distribution lognormal --error-rate 0.02 --output hasil_load.json
+    python loadtest.py --stream --latency-ms 1500 --chars-per-sec 250   # ukur time-to-first-token
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from gemini_stub import add_behavior_args, behavior_from_args, start_server
+
+STAGES = ("detect", "payload", "ttft", "analysis", "flow")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DURATION = 30.0
+DEFAULT_SAMPLES = 8
+DEFAULT_TIMEOUT = 60.0
+
+
+def load_samples(images_dir=None, count=DEFAULT_SAMPLES):
+    """Raw image bytes to cycle through: files from images_dir or synthetic 12 MP JPEGs"""
+    if images_dir:
+        from batch_scan import iter_image_paths
+        samples = []
+        for path in iter_image_paths(images_dir):
+            with open(path, "rb") as f:
+                samples.append(f.read())
+            if len(samples) >= count:
+                break
+        if not samples:
+            raise ValueError(f"Tidak ada gambar di {images_dir}")
+        return samples
+
+    from preprocessing import make_sample_jpeg
+    samples = []
+    for seed in range(count):
+        buffer = io.BytesIO()
+        make_sample_jpeg(buffer, (4000, 3000), seed=seed)
+        samples.append(buffer.getvalue())
+    return samples
+
+
+class Recorder:
+    """Thread-safe collection of per-stage latencies and errors"""
+
+    def __init__(self):
+        self.latencies = {stage: [] for stage in STAGES}
+        self.errors = {stage: {} for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.latencies[stage].append(seconds * 1000)
+
+    def error(self, stage, error):
+        # Kelompokkan per kode/jenis error, bukan per pesan lengkap
+        kind = str(error).split(" ", 1)[0] if str(error)[:3].isdigit() else type(error).__name__
+        with self._lock:
+            self.errors[stage][kind] = self.errors[stage].get(kind, 0) + 1
+
+    def report(self, elapsed):
+        stages = {}
+        for stage in STAGES:
+            samples = self.latencies[stage]
+            failed = sum(self.errors[stage].values())
+            attempts = len(samples) + failed
+            if not attempts:
+                continue
+            stats = {
+                "ok": len(samples),
+                "errors": failed,
+                "error_rate": round(failed / attempts, 4),
+                "error_kinds": self.errors[stage],
+                "throughput_per_sec": round(len(samples) / elapsed, 2),
+            }
+            if samples:
+                for q in (50, 90, 99):
+                    stats[f"p{q}_ms"] = round(float(np.percentile(samples, q)), 1)
+                stats["max_ms"] = round(max(samples), 1)
+            stages[stage] = stats
+        return {"elapsed_seconds": round(elapsed, 2), "stages": stages}
+
+
+def make_detector(model_path=None, detect_url=None):
+    """Return detect(image_bytes) -> (image, label, confidence) for in-process or HTTP detection"""
+    from preprocessing import open_image
+
+    if detect_url:
+        import requests
+        url = detect_url.rstrip("/") + "/predict"
+        session_local = threading.local()
+
+        def detect_http(image_bytes):
+            if not hasattr(session_local, "session"):
+                session_local.session = requests.Session()
+            response = session_local.session.post(url, data=image_bytes,
+                                                  headers={"Content-Type": "application/octet-stream"})
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code} {response.text[:100]}")
+            body = response.json()
+            return open_image(image_bytes), body["label"], body["confidence"]
+        return detect_http
+
+    from inference import load_model_from_path, predict_corrosion
+    if model_path is None:
+        from benchmark import SYNTHETIC_MODEL_PATH, build_synthetic_model
+        model_path = SYNTHETIC_MODEL_PATH
+        if not os.path.exists(model_path):
+            print("🔧 Membuat model sintetis...", file=sys.stderr)
+            build_synthetic_model(model_path)
+    print(f"🔄 Loading model: {model_path}", file=sys.stderr)
+    model = load_model_from_path(model_path)
+
+    def detect_local(image_bytes):
+        # Sama dengan mode gambar tunggal: satu model dipakai bersama semua sesi
+        image = open_image(image_bytes)
+        label, confidence = predict_corrosion(model, image)
+        return image, label, confidence
+    return detect_local
+
+
+def run_flow(detect, samples, recorder, analysis_ratio, timeout, rng, stream=False):
+    """One user interaction: detection, then the deep analysis for a fraction of users"""
+    from ai_analysis import generate_analysis, stream_analysis
+    from payload import optimize_image
+
+    flow_start = time.perf_counter()
+    image_bytes = samples[rng.randrange(len(samples))]
+    try:
+        start = time.perf_counter()
+        image, label, confidence = detect(image_bytes)
+        recorder.record("detect", time.perf_counter() - start)
+    except Exception as e:
+        recorder.error("detect", e)
+        recorder.error("flow", e)
+        return
+
+    if rng.random() < analysis_ratio:
+        start = time.perf_counter()
+        payload = optimize_image(image)
+        recorder.record("payload", time.perf_counter() - start)
+        try:
+            start = time.perf_counter()
+            if stream:
+                # Seperti aplikasi: teks dikonsumsi per chunk, token pertama dicatat terpisah
+                for i, _ in enumerate(stream_analysis(image, label, confidence, payload=payload, timeout=timeout)):
+                    if i == 0:
+                        recorder.record("ttft", time.perf_counter() - start)
+            else:
+                generate_analysis(image, label, confidence, payload=payload, timeout=timeout)
+            recorder.record("analysis", time.perf_counter() - start)
+        except Exception as e:
+            recorder.error("analysis", e)
+            recorder.error("flow", e)
+            return
+    recorder.record("flow", time.perf_counter() - flow_start)
+
+
+def run(detect, samples, concurrency=DEFAULT_CONCURRENCY, duration=DEFAULT_DURATION, flows=None,
+        analysis_ratio=1.0, timeout=DEFAULT_TIMEOUT, seed=0, stream=False):
+    """Drive flows at a fixed concurrency until duration elapses or flows are done"""
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    counter = iter(range(flows)) if flows else None
+    counter_lock = threading.Lock()
+    completed = [0]
+
+    def next_flow():
+        with counter_lock:
+            if counter is not None:
+                return next(counter, None) is not None
+            return time.perf_counter() < deadline
+
+    def user(index):
+        rng = random.Random(seed + index)
+        while next_flow():
+            run_flow(detect, samples, recorder, analysis_ratio, timeout, rng, stream)
+            with counter_lock:
+                completed[0] += 1
+                done = completed[0]
+            if index == 0:
+                print(f"\r🔄 {done} alur selesai", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="virtual-user") as executor:
+        list(executor.map(user, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+
+    report = recorder.report(elapsed)
+    report["concurrency"] = concurrency
+    report["analysis_ratio"] = analysis_ratio
+    report["stream"] = stream
+    return report
+
+
+def print_report(report):
+    print(f"📊 Load test: concurrency {report['concurrency']}, {report['elapsed_seconds']:.1f} detik, "
+          f"analysis ratio {report['analysis_ratio']:.0%}")
+    if "gemini_calls" in report:
+        analyses = report["stages"].get("analysis", {})
+        print(f"🧪 Request ke stand-in: {report['gemini_calls']} "
+              f"(untuk {analyses.get('ok', 0) + analyses.get('errors', 0)} analisis, termasuk retry SDK)")
+    print(f"{'stage':<10}{'ok':>7}{'/s':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'error':>8}")
+    for stage, stats in report["stages"].items():
+        latency = "".join(f"{stats.get(key, float('nan')):>10.1f}" for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        print(f"{stage:<10}{stats['ok']:>7}{stats['throughput_per_sec']:>8.2f}{latency}{stats['error_rate']:>8.1%}")
+        if stats["error_kinds"]:
+            print(f"{'':<10}   error: {stats['error_kinds']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test offline alur deteksi + analisis Gemini")
+    parser.add_argument("--images", help="Direktori gambar contoh (default: JPEG sintetis 12 MP)")
+    parser.add_argument("--model", help="Path model (default: model MobileNetV2 sintetis)")
+    parser.add_argument("--detect-url", help="Pakai inference_server.py untuk deteksi, bukan model in-process")
+    parser.add_argument("--gemini-endpoint", help="Stand-in Gemini yang sudah berjalan (default: dijalankan otomatis)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Jumlah virtual user")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Durasi uji (detik)")
+    parser.add_argument("--flows", type=int, help="Jumlah alur total (menggantikan --duration)")
+    parser.add_argument("--analysis-ratio", type=float, default=1.0,
+                        help="Fraksi alur yang meminta analisis mendalam")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Timeout request Gemini (detik)")
+    parser.add_argument("--stream", action="store_true", help="Pakai streaming seperti aplikasi (ukur time-to-first-token)")
+    parser.add_argument("-o", "--output", help="Simpan laporan sebagai JSON")
+    add_behavior_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from ai_analysis import configure_api
+    endpoint = args.gemini_endpoint
+    behavior = None
+    if endpoint is None:
+        behavior = behavior_from_args(args)
+        server = start_server(behavior, port=0)
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"🧪 Gemini stand-in di {endpoint}", file=sys.stderr)
+    # Key palsu: request hanya menuju stand-in lokal
+    configure_api("stub", endpoint=endpoint)
+
+    samples = load_samples(args.images)
+    detect = make_detector(args.model, args.detect_url)
+    report = run(detect, samples, args.concurrency, args.duration, args.flows, args.analysis_ratio, args.timeout,
+                 seed=args.seed or 0, stream=args.stream)
+    report["gemini_endpoint"] = endpoint
+    if behavior is not None:
+        # Termasuk retry otomatis SDK untuk 429/503
+        report["gemini_calls"] = behavior.calls
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Laporan disimpan ke {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
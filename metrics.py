@@ -0,0 +1,249 @@
+"""
+Instrumentasi ringan: histogram latency per stage, counter dan gauge
+
+Metrik disimpan per proses (dipakai bersama semua sesi Streamlit) dan
+bisa diekspor dalam format teks Prometheus, lewat endpoint /metrics di
+inference_server.py atau exporter opsional (METRICS_PORT) untuk app.
+Biaya di hot path: satu perf_counter, satu bisect dan satu lock.
+"""
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Bucket latency (detik) dari lookup cache sub-ms sampai round-trip Gemini puluhan detik
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in sorted(self.values().items()):
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    """Value that can be set to anything (e.g. model load time)"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+
+class _Timer:
+    """Context manager observing elapsed seconds into a histogram (cheaper than @contextmanager)"""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in seconds, one series per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [count per bucket (+Inf di akhir), sum, count]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        """{labels: (bucket_counts, sum, count)} copy for reporting"""
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, counts):
+        """Estimate a quantile from bucket counts (linear within a bucket, like histogram_quantile)"""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", key + (("le", le),), cumulative
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "corrosion_stage_seconds", "Latency per pipeline stage (decode, preprocess, predict, gemini, ...)"))
+PREDICTIONS = REGISTRY.register(Counter("corrosion_predictions_total", "Predicted images per label"))
+CACHE_REQUESTS = REGISTRY.register(Counter("corrosion_cache_requests_total", "Cache lookups per cache and result"))
+ERRORS = REGISTRY.register(Counter("corrosion_errors_total", "Errors per pipeline stage"))
+MODEL_LOAD_SECONDS = REGISTRY.register(Gauge("corrosion_model_load_seconds", "Duration of the last model load"))
+MODEL_SWAPS = REGISTRY.register(Counter("corrosion_model_swaps_total", "Model registry versions switched in or rejected"))
+SHADOW_PREDICTIONS = REGISTRY.register(Counter(
+    "corrosion_shadow_predictions_total", "Images compared against the shadow model (agree, disagree, skipped)"))
+PREFILTER = REGISTRY.register(Counter(
+    "corrosion_prefilter_total", "Images labelled by the prefilter cascade (corroded, clean) or sent to the CNN (ambiguous)"))
+PREFILTER_AUDIT = REGISTRY.register(Counter(
+    "corrosion_prefilter_audit_total", "Prefilter decisions re-checked by the CNN (agree, disagree)"))
+NEAR_DUPLICATES = REGISTRY.register(Counter(
+    "corrosion_near_duplicate_lookups_total", "Uploads matched to a near-identical earlier image (match) or indexed (new)"))
+NEAR_DUPLICATE_REUSES = REGISTRY.register(Counter(
+    "corrosion_near_duplicate_reuses_total", "Predictions and AI reports reused from a near-identical image"))
+
+
+def stage(name):
+    """Context manager timing one pipeline stage"""
+    return STAGE_SECONDS.time(stage=name)
+
+
+def count_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def count_labels(labels):
+    for label in labels:
+        PREDICTIONS.inc(label=label)
+
+
+def totals_by(counter, label):
+    """Sum a counter's series per value of one label"""
+    totals = {}
+    for key, value in counter.values().items():
+        name = dict(key).get(label, "")
+        totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def cache_hit_rates():
+    """{cache: (hits, lookups)} for the status panel"""
+    rates = {}
+    for key, value in CACHE_REQUESTS.values().items():
+        labels = dict(key)
+        hits, total = rates.get(labels["cache"], (0, 0))
+        rates[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+    return rates
+
+
+def stage_summary():
+    """Per-stage rows (count, mean, p50, p95 in ms) for the status panel"""
+    rows = []
+    for key, (counts, total, count) in sorted(STAGE_SECONDS.snapshot().items()):
+        if not count:
+            continue
+        rows.append({
+            "Stage": dict(key).get("stage", ""),
+            "Jumlah": count,
+            "Rata-rata (ms)": round(total / count * 1000, 1),
+            "p50 (ms)": round(STAGE_SECONDS.quantile(0.5, counts) * 1000, 1),
+            "p95 (ms)": round(STAGE_SECONDS.quantile(0.95, counts) * 1000, 1),
+        })
+    return rows
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread; returns the server or None when port is 0"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-exporter").start()
+    return server
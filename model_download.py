@@ -0,0 +1,281 @@
+"""
+Downloader model bersama untuk app.py dan app_cloud.py
+
+- HTTP range request paralel dengan buffer besar
+- Resume setelah terputus (progress per segmen disimpan di file .state)
+- Verifikasi SHA-256; tanpa checksum, signature format file (.keras/.h5/.tflite)
+  atau ukuran minimum dicek agar halaman error/kuota tidak ter-install
+- Cache lokal per ETag
+- Install atomik (rename) agar worker lain tidak membaca file setengah jadi
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from cache import CACHE_DIR
+
+MODEL_CACHE_DIR = os.path.join(CACHE_DIR, "models")
+DEFAULT_CONNECTIONS = 4
+BUFFER_SIZE = 1024 * 1024
+# Progress disimpan ke .state paling sering tiap interval ini
+STATE_SAVE_INTERVAL = 1.0
+# (offset, magic bytes) per ekstensi, dicek bila MODEL_SHA256 tidak diset
+MODEL_SIGNATURES = {
+    ".keras": (0, b"PK\x03\x04"),
+    ".h5": (0, b"\x89HDF\r\n\x1a\n"),
+    ".tflite": (4, b"TFL3"),
+}
+# Format tanpa signature: file lebih kecil dari ini dianggap download gagal
+MIN_MODEL_SIZE = 10_000_000
+
+
+class ChecksumError(Exception):
+    """Downloaded file does not match the expected SHA-256"""
+
+
+class InvalidModelError(Exception):
+    """Downloaded file is not a model file (e.g. an HTML error or quota page)"""
+
+
+class FileLock:
+    """Cross-process exclusive lock on a lock file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        try:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except ImportError:
+            import msvcrt
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_model_file(path, dest):
+    """Raise InvalidModelError unless path looks like a model in dest's format"""
+    signature = MODEL_SIGNATURES.get(os.path.splitext(dest)[1].lower())
+    if signature is None:
+        size = os.path.getsize(path)
+        if size < MIN_MODEL_SIZE:
+            raise InvalidModelError(f"File terlalu kecil ({size / (1024 * 1024):.2f} MB), download mungkin gagal")
+        return
+    offset, magic = signature
+    with open(path, "rb") as f:
+        head = f.read(max(offset + len(magic), 16))
+    if head[offset:offset + len(magic)] != magic:
+        raise InvalidModelError(f"Bukan file model {os.path.splitext(dest)[1]} "
+                                f"(awal file: {head[:16]!r}), download mungkin gagal")
+
+
+def _discard(part_path):
+    os.remove(part_path)
+    if os.path.exists(part_path + ".state"):
+        os.remove(part_path + ".state")
+
+
+def probe(url, session):
+    """Resolve redirects and return (final_url, size, etag, accepts_ranges)"""
+    response = session.head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    size = int(response.headers.get("Content-Length", 0)) or None
+    etag = response.headers.get("ETag", "").strip('"') or None
+    accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return response.url, size, etag, accepts_ranges
+
+
+def cache_key(url, size, etag):
+    """Cache directory name; ETag when the server sends one, otherwise URL + size"""
+    identity = etag or f"{url}|{size}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+def _split(size, connections):
+    step = -(-size // connections)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def _load_state(state_path, segments):
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        if [tuple(s) for s in state["segments"]] == segments:
+            return state["done"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return [0] * len(segments)
+
+
+def _save_state(state_path, segments, done):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"segments": segments, "done": done}, f)
+    os.replace(tmp_path, state_path)
+
+
+def _download_ranges(url, part_path, size, connections, session, progress_callback):
+    """Fill part_path with parallel range requests, resuming from the .state file"""
+    segments = _split(size, connections)
+    state_path = part_path + ".state"
+    done = _load_state(state_path, segments)
+
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        done = [0] * len(segments)
+
+    lock = threading.Lock()
+    last_save = [time.monotonic()]
+
+    def fetch(index):
+        start, end = segments[index]
+        offset = start + done[index]
+        if offset >= end:
+            return
+        headers = {"Range": f"bytes={offset}-{end - 1}"}
+        with session.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code != 206:
+                raise IOError(f"Server tidak mendukung range request (HTTP {response.status_code})")
+            with open(part_path, "r+b") as f:
+                f.seek(offset)
+                for chunk in response.iter_content(chunk_size=BUFFER_SIZE):
+                    f.write(chunk)
+                    with lock:
+                        done[index] += len(chunk)
+                        if time.monotonic() - last_save[0] > STATE_SAVE_INTERVAL:
+                            f.flush()
+                            _save_state(state_path, segments, done)
+                            last_save[0] = time.monotonic()
+        if done[index] != end - start:
+            raise IOError(f"Segmen {index} tidak lengkap ({done[index]}/{end - start} bytes)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            pending = {executor.submit(fetch, i) for i in range(len(segments))}
+            # Progress dilaporkan dari thread pemanggil (aman untuk Streamlit)
+            while pending:
+                finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                if progress_callback:
+                    progress_callback(sum(done), size)
+    finally:
+        with lock:
+            _save_state(state_path, segments, done)
+
+
+def _download_stream(url, part_path, session, progress_callback):
+    """Single-stream download, resuming with a Range header when possible"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            offset = 0
+        total = int(response.headers.get("Content-Length", 0)) + offset or None
+        with open(part_path, "r+b" if offset else "wb") as f:
+            f.seek(offset)
+            downloaded = offset
+            for chunk in response.iter_content(chunk_size=BUFFER_SIZE):
+                f.write(chunk)
+                downloaded += len(chunk)
+                if progress_callback:
+                    progress_callback(downloaded, total)
+
+
+def _install(src, dest):
+    """Copy src next to dest, then atomically rename it into place"""
+    tmp_path = f"{dest}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def download_model(url, dest, sha256=None, connections=DEFAULT_CONNECTIONS, cache_dir=MODEL_CACHE_DIR,
+                   progress_callback=None):
+    """Download url to dest (resumable, parallel, verified) and return dest
+
+    progress_callback(downloaded_bytes, total_bytes_or_None) is always called
+    from the calling thread. Without sha256 the file is checked against the
+    signature of dest's format (or MIN_MODEL_SIZE) instead.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    session = requests.Session()
+    final_url, size, etag, accepts_ranges = probe(url, session)
+
+    entry_dir = os.path.join(cache_dir, cache_key(url, size, etag))
+    os.makedirs(entry_dir, exist_ok=True)
+    cached_path = os.path.join(entry_dir, "model")
+    part_path = cached_path + ".part"
+
+    # Hanya satu proses yang mengunduh; proses lain menunggu lalu memakai cache
+    with FileLock(os.path.join(entry_dir, "lock")):
+        if os.path.exists(cached_path):
+            # File di cache rusak: unduh ulang
+            if sha256 and sha256_file(cached_path) != sha256.lower():
+                os.remove(cached_path)
+            elif not sha256:
+                try:
+                    check_model_file(cached_path, dest)
+                except InvalidModelError:
+                    os.remove(cached_path)
+
+        if not os.path.exists(cached_path):
+            if size and accepts_ranges and connections > 1:
+                _download_ranges(final_url, part_path, size, connections, session, progress_callback)
+            else:
+                _download_stream(final_url, part_path, session, progress_callback)
+
+            if size and os.path.getsize(part_path) != size:
+                raise IOError(f"Ukuran file tidak sesuai ({os.path.getsize(part_path)} != {size} bytes)")
+            if sha256:
+                actual = sha256_file(part_path)
+                if actual != sha256.lower():
+                    _discard(part_path)
+                    raise ChecksumError(f"SHA-256 tidak cocok: {actual} != {sha256}")
+            else:
+                try:
+                    check_model_file(part_path, dest)
+                except InvalidModelError:
+                    _discard(part_path)
+                    raise
+
+            os.replace(part_path, cached_path)
+            if os.path.exists(part_path + ".state"):
+                os.remove(part_path + ".state")
+
+        _install(cached_path, dest)
+    return dest
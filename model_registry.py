@@ -0,0 +1,539 @@
+"""
+Registry model berversi dengan hot-swap tanpa restart
+
+Layout direktori registry (MODEL_REGISTRY_DIR):
+    models/
+        v1.keras
+        v2.keras
+        v3.tflite
+        ACTIVE      <- versi yang dilayani (tanpa file ini: versi terbaru)
+        SHADOW      <- versi pembanding untuk shadow mode (opsional)
+
+ModelRegistry dipakai seperti model biasa (predict_on_batch / predict).
+Watcher di background memeriksa registry setiap MODEL_REGISTRY_POLL
+detik; versi baru dimuat, di-warm-up dan divalidasi di thread watcher,
+di luar jalur request, lalu referensi model ditukar secara atomik.
+Batch yang sedang berjalan selesai dengan model lama. Versi yang gagal
+dimuat/divalidasi ditolak dan model lama tetap melayani. Dengan
+MODEL_VALIDATION_DIR setiap versi yang dimuat (aktif maupun shadow)
+juga dibandingkan dengan versi aktif pada gambar contoh tersebut.
+
+Shadow mode: setiap batch juga dijalankan pada versi SHADOW di thread
+terpisah (hasilnya tidak pernah dipakai). Ketidaksesuaian label dan
+latency kedua versi dicatat ke SHADOW_LOG (JSONL) dan metrics.
+
+Contoh:
+    python model_registry.py add saved_model_retrained.keras --version v4
+    python model_registry.py validate v4
+    python model_registry.py shadow v4          # bandingkan v4 dengan versi aktif
+    python model_registry.py report             # ringkasan shadow log
+    python model_registry.py promote v4
+    python model_registry.py shadow --off
+    python model_registry.py list
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from cache import CACHE_DIR, file_hash
+from inference import IMAGE_SIZE, image_to_array, load_model_from_path
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "")
+MODEL_REGISTRY_POLL = float(os.getenv("MODEL_REGISTRY_POLL", 10))
+# Gambar contoh untuk membandingkan versi baru dengan versi aktif sebelum ditukar
+MODEL_VALIDATION_DIR = os.getenv("MODEL_VALIDATION_DIR", "")
+# Agreement label minimum terhadap versi aktif (0 = hanya dicatat)
+MODEL_MIN_AGREEMENT = float(os.getenv("MODEL_MIN_AGREEMENT", 0))
+SHADOW_LOG = os.getenv("SHADOW_LOG", os.path.join(CACHE_DIR, "shadow.jsonl"))
+
+MODEL_EXTENSIONS = (".keras", ".tflite")
+ACTIVE_FILE = "ACTIVE"
+SHADOW_FILE = "SHADOW"
+VALIDATION_IMAGES = 64
+# Model lama (worker pool) ditutup setelah jeda ini agar batch yang masih berjalan selesai
+RETIRE_SECONDS = 30.0
+# Batch shadow yang menunggu; lebih dari ini dilewati agar shadow tidak menumpuk di belakang traffic
+SHADOW_MAX_PENDING = 4
+
+
+def list_versions(root):
+    """{version: path} of the model files in a registry directory, oldest first"""
+    entries = []
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return {}
+    for name in names:
+        version, ext = os.path.splitext(name)
+        # Nama diawali titik = file sementara yang masih disalin
+        if ext in MODEL_EXTENSIONS and not name.startswith("."):
+            path = os.path.join(root, name)
+            entries.append((os.stat(path).st_mtime_ns, version, path))
+    return {version: path for _, version, path in sorted(entries)}
+
+
+def read_pointer(root, name):
+    """Version named in the ACTIVE / SHADOW file, or None"""
+    try:
+        with open(os.path.join(root, name), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(root, name, version):
+    """Atomically point ACTIVE / SHADOW at a version (None removes the pointer)"""
+    path = os.path.join(root, name)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(temp_path, path)
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_validation_batch(directory=MODEL_VALIDATION_DIR, limit=VALIDATION_IMAGES):
+    """Preprocessed float32 batch of up to limit images from directory, or None"""
+    if not directory:
+        return None
+    from batch_scan import iter_image_paths
+    from preprocessing import open_image
+
+    arrays = []
+    for path in iter_image_paths(directory):
+        try:
+            with open_image(path) as image:
+                arrays.append(image_to_array(image, draft=True))
+        except Exception as e:
+            print(f"⚠️  Gambar validasi dilewati {path}: {e}", file=sys.stderr)
+        if len(arrays) >= limit:
+            break
+    return np.stack(arrays) if arrays else None
+
+
+def validate_model(model, reference=None, batch=None, min_agreement=0.0):
+    """Check a freshly loaded model before it serves; returns label agreement with reference (or None)
+
+    Raises ValueError when the output is not one probability per image or
+    the agreement on the validation batch is below min_agreement.
+    """
+    probe = np.random.default_rng(0).random((4, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    probs = np.asarray(model.predict_on_batch(probe))
+    if probs.shape not in ((4,), (4, 1)):
+        raise ValueError(f"output berbentuk {probs.shape}, seharusnya (N, 1)")
+    if not np.all(np.isfinite(probs)) or probs.min() < 0 or probs.max() > 1:
+        raise ValueError("output bukan probabilitas 0-1")
+
+    if reference is None or batch is None:
+        return None
+    new = np.asarray(model.predict_on_batch(batch)).reshape(-1) > 0.5
+    old = np.asarray(reference.predict_on_batch(batch)).reshape(-1) > 0.5
+    agreement = float(np.mean(new == old))
+    if agreement < min_agreement:
+        raise ValueError(f"agreement {agreement:.1%} dengan versi aktif di bawah minimum {min_agreement:.1%}")
+    return agreement
+
+
+class LoadedVersion:
+    """One registry version loaded in memory"""
+
+    def __init__(self, version, path, stamp, model):
+        self.version = version
+        self.path = path
+        self.stamp = stamp
+        self.model = model
+        # Key cache prediksi: nama versi + hash file, agar nama yang dipakai ulang tidak membaca hasil lama
+        self.cache_version = f"{version}-{file_hash(path)[:16]}"
+
+
+class ServingModel:
+    """The active version (optionally mirrored to a shadow version) behind the model interface
+
+    Swapped as a whole, so one call always sees a consistent active/shadow
+    pair. Batches submitted asynchronously to a worker pool (submit) go
+    straight to the active pool and are not mirrored.
+    """
+
+    def __init__(self, active, shadow=None, mirror=None):
+        self.active = active
+        self.shadow = shadow
+        self._mirror = mirror
+        self.version = active.version
+        self.cache_version = active.cache_version
+
+    def __getattr__(self, name):
+        # submit / batch_size / workers milik worker pool ikut diteruskan
+        return getattr(self.active.model, name)
+
+    def predict_on_batch(self, batch):
+        if self.shadow is None:
+            return self.active.model.predict_on_batch(batch)
+        start = time.perf_counter()
+        probs = self.active.model.predict_on_batch(batch)
+        # Salin batch: pemanggil boleh memakai ulang buffernya setelah kembali
+        self._mirror(self, np.array(batch, dtype=np.float32), np.asarray(probs).reshape(-1),
+                     time.perf_counter() - start)
+        return probs
+
+    def predict(self, batch, verbose=0):
+        """Same call signature as keras Model.predict"""
+        return self.predict_on_batch(batch)
+
+    def describe(self):
+        return self.version + (f" (shadow {self.shadow.version})" if self.shadow else "")
+
+
+class ModelRegistry:
+    """Versioned model files with background hot-swap, usable wherever a model is expected"""
+
+    def __init__(self, root=MODEL_REGISTRY_DIR, backend=None, workers=None, poll_seconds=MODEL_REGISTRY_POLL,
+                 validation_dir=MODEL_VALIDATION_DIR, min_agreement=MODEL_MIN_AGREEMENT, shadow_log=SHADOW_LOG):
+        self.root = root
+        self.backend = backend
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.min_agreement = min_agreement
+        self.shadow_log = shadow_log
+        self._validation = load_validation_batch(validation_dir)
+        self._serving = None
+        self._loaded = {}
+        self._rejected = {}
+        self._retired = []
+        self._refresh_lock = threading.Lock()
+        self._shadow_lock = threading.Lock()
+        self._shadow_pending = 0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-shadow")
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refresh()
+        if self._serving is None:
+            raise RuntimeError(f"Tidak ada versi model yang valid di registry {root}")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._serving, name)
+
+    def current(self):
+        """The ServingModel in use right now (stays consistent even if a swap follows)"""
+        return self._serving
+
+    def predict_on_batch(self, batch):
+        return self._serving.predict_on_batch(batch)
+
+    def predict(self, batch, verbose=0):
+        """Same call signature as keras Model.predict"""
+        return self._serving.predict_on_batch(batch)
+
+    def _load(self, version, path, reference=None):
+        """LoadedVersion for version, loading and validating it when new or changed; None if rejected"""
+        if path is None:
+            if self._rejected.get(version) != "missing":
+                print(f"⚠️  Versi model {version} tidak ada di {self.root}", file=sys.stderr)
+                self._rejected[version] = "missing"
+            return None
+        stamp = file_stamp(path)
+        loaded = self._loaded.get(version)
+        if loaded is not None and loaded.stamp == stamp:
+            return loaded
+        if self._rejected.get(version) == stamp:
+            return None
+
+        print(f"🔄 Memuat model {version} ({path})...", file=sys.stderr)
+        start = time.perf_counter()
+        model = None
+        try:
+            model = load_model_from_path(path, self.backend, workers=self.workers)
+            agreement = validate_model(model, reference.model if reference else None, self._validation,
+                                       self.min_agreement if reference else 0.0)
+            loaded = LoadedVersion(version, path, stamp, model)
+        except Exception as e:
+            self._rejected[version] = stamp
+            metrics.MODEL_SWAPS.inc(result="rejected")
+            metrics.ERRORS.inc(stage="model_swap")
+            print(f"❌ Model {version} ditolak: {type(e).__name__}: {e}", file=sys.stderr)
+            if hasattr(model, "close"):
+                model.close()
+            return None
+
+        self._loaded[version] = loaded
+        note = f", agreement {agreement:.1%} dengan {reference.version}" if agreement is not None else ""
+        print(f"✅ Model {version} siap dalam {time.perf_counter() - start:.1f} s{note}", file=sys.stderr)
+        return loaded
+
+    def refresh(self):
+        """Load, validate and switch in changed ACTIVE / SHADOW versions; returns True when serving changed
+
+        Runs on the watcher thread (or the caller's thread at startup); the
+        request path only ever reads the current ServingModel reference.
+        A rejected version is not retried until its file changes.
+        """
+        with self._refresh_lock:
+            versions = list_versions(self.root)
+            active_name = read_pointer(self.root, ACTIVE_FILE) or next(reversed(versions), None)
+            shadow_name = read_pointer(self.root, SHADOW_FILE)
+            serving = self._serving
+            if active_name is None:
+                return False
+
+            active = self._load(active_name, versions.get(active_name), serving.active if serving else None)
+            if active is None:
+                if serving is None:
+                    return False
+                # Versi baru ditolak: model lama tetap dilayani
+                active = serving.active
+            shadow = None
+            if shadow_name and shadow_name != active.version:
+                shadow = self._load(shadow_name, versions.get(shadow_name), active)
+
+            if serving is not None and serving.active is active and serving.shadow is shadow:
+                return False
+            # Satu assignment: request berikutnya langsung memakai pasangan baru
+            self._serving = ServingModel(active, shadow, self._mirror)
+            in_use = {active.version: active}
+            if shadow is not None:
+                in_use[shadow.version] = shadow
+            for old in (serving.active, serving.shadow) if serving else ():
+                if old is not None and in_use.get(old.version) is not old and hasattr(old.model, "close"):
+                    self._retired.append((time.monotonic() + RETIRE_SECONDS, old.model))
+            self._loaded = in_use
+
+            metrics.MODEL_SWAPS.inc(result="switched")
+            previous = f" (sebelumnya {serving.describe()})" if serving else ""
+            print(f"🔁 Model aktif: {self._serving.describe()}{previous}", file=sys.stderr)
+            return True
+
+    def _close_retired(self, force=False):
+        now = time.monotonic()
+        keep = []
+        for deadline, model in self._retired:
+            if force or deadline <= now:
+                model.close()
+            else:
+                keep.append((deadline, model))
+        self._retired = keep
+
+    def _mirror(self, serving, batch, probs, active_seconds):
+        """Queue a shadow prediction for a batch the active model just served"""
+        with self._shadow_lock:
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                metrics.SHADOW_PREDICTIONS.inc(len(batch), result="skipped")
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._run_shadow, serving, batch, probs, active_seconds)
+
+    def _run_shadow(self, serving, batch, probs, active_seconds):
+        try:
+            start = time.perf_counter()
+            shadow_probs = np.asarray(serving.shadow.model.predict_on_batch(batch)).reshape(-1)
+            shadow_seconds = time.perf_counter() - start
+        except Exception as e:
+            metrics.ERRORS.inc(stage="shadow_predict")
+            print(f"⚠️  Prediksi shadow {serving.shadow.version} gagal: {e}", file=sys.stderr)
+            return
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= 1
+
+        metrics.STAGE_SECONDS.observe(active_seconds, stage="shadow_active")
+        metrics.STAGE_SECONDS.observe(shadow_seconds, stage="shadow_candidate")
+        disagreements = np.flatnonzero((probs > 0.5) != (shadow_probs > 0.5))
+        metrics.SHADOW_PREDICTIONS.inc(len(batch) - len(disagreements), result="agree")
+        if len(disagreements):
+            metrics.SHADOW_PREDICTIONS.inc(len(disagreements), result="disagree")
+
+        record = {
+            "time": round(time.time(), 3),
+            "active": serving.active.version,
+            "shadow": serving.shadow.version,
+            "images": len(batch),
+            "active_ms": round(active_seconds * 1000, 2),
+            "shadow_ms": round(shadow_seconds * 1000, 2),
+            "disagreements": [
+                {"index": int(i), "active_prob": round(float(probs[i]), 4),
+                 "shadow_prob": round(float(shadow_probs[i]), 4)}
+                for i in disagreements
+            ],
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.shadow_log)), exist_ok=True)
+            # Satu thread shadow: baris JSONL tidak pernah saling menimpa
+            with open(self.shadow_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            metrics.ERRORS.inc(stage="shadow_log")
+            print(f"⚠️  Shadow log tidak bisa ditulis: {e}", file=sys.stderr)
+
+    def start(self):
+        """Watch the registry from a daemon thread (no-op when already started or poll_seconds is 0)"""
+        if self._thread is None and self.poll_seconds > 0:
+            self._thread = threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+                self._close_retired()
+            except Exception as e:
+                metrics.ERRORS.inc(stage="model_swap")
+                print(f"⚠️  Watcher registry model: {type(e).__name__}: {e}", file=sys.stderr)
+
+    def close(self):
+        """Stop the watcher, finish queued shadow batches and close pooled models"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._shadow_executor.shutdown(wait=True)
+        self._close_retired(force=True)
+        for loaded in self._loaded.values():
+            if hasattr(loaded.model, "close"):
+                loaded.model.close()
+
+
+def shadow_report(path=SHADOW_LOG):
+    """Per (active, shadow) pair: images, disagreements and batch latency of both versions"""
+    pairs = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            stats = pairs.setdefault((record["active"], record["shadow"]), {
+                "batches": 0, "images": 0, "disagreements": 0, "active_ms": [], "shadow_ms": []})
+            stats["batches"] += 1
+            stats["images"] += record["images"]
+            stats["disagreements"] += len(record["disagreements"])
+            stats["active_ms"].append(record["active_ms"])
+            stats["shadow_ms"].append(record["shadow_ms"])
+    return pairs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Registry model berversi (hot-swap & shadow mode)")
+    parser.add_argument("--registry", default=MODEL_REGISTRY_DIR or "models", help="Direktori registry model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Daftar versi model")
+    add_parser = subparsers.add_parser("add", help="Salin file model ke registry sebagai versi baru")
+    add_parser.add_argument("path")
+    add_parser.add_argument("--version", help="Nama versi (default: nama file)")
+    add_parser.add_argument("--activate", action="store_true", help="Langsung jadikan versi aktif")
+    promote_parser = subparsers.add_parser("promote", help="Jadikan versi aktif (juga untuk rollback)")
+    promote_parser.add_argument("version")
+    shadow_parser = subparsers.add_parser("shadow", help="Jalankan versi ini sebagai shadow")
+    shadow_parser.add_argument("version", nargs="?")
+    shadow_parser.add_argument("--off", action="store_true", help="Matikan shadow mode")
+    validate_parser = subparsers.add_parser("validate", help="Muat dan validasi versi tanpa mengaktifkannya")
+    validate_parser.add_argument("version")
+    report_parser = subparsers.add_parser("report", help="Ringkasan shadow log")
+    report_parser.add_argument("--log", default=SHADOW_LOG)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    root = args.registry
+    versions = list_versions(root)
+
+    if args.command == "list":
+        active = read_pointer(root, ACTIVE_FILE) or next(reversed(versions), None)
+        shadow = read_pointer(root, SHADOW_FILE)
+        if not versions:
+            print(f"ℹ️ Registry {root} masih kosong")
+        for version, path in versions.items():
+            marker = " [ACTIVE]" if version == active else " [SHADOW]" if version == shadow else ""
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(path)))
+            print(f"{version:<24}{os.path.getsize(path) / 1024 ** 2:>8.1f} MB  {modified}{marker}")
+        return 0
+
+    if args.command == "add":
+        ext = os.path.splitext(args.path)[1]
+        if ext not in MODEL_EXTENSIONS:
+            print(f"❌ Format model harus salah satu dari {MODEL_EXTENSIONS}", file=sys.stderr)
+            return 1
+        version = args.version or os.path.splitext(os.path.basename(args.path))[0]
+        if version in versions:
+            print(f"❌ Versi {version} sudah ada", file=sys.stderr)
+            return 1
+        os.makedirs(root, exist_ok=True)
+        # Disalin ke nama sementara lalu di-rename, agar watcher tidak pernah melihat file setengah jadi
+        temp_path = os.path.join(root, f".{version}{ext}.tmp")
+        shutil.copyfile(args.path, temp_path)
+        os.replace(temp_path, os.path.join(root, version + ext))
+        print(f"✅ Versi {version} ditambahkan")
+        if args.activate:
+            write_pointer(root, ACTIVE_FILE, version)
+            print(f"🔁 Versi aktif: {version}")
+        return 0
+
+    if args.command == "promote":
+        if args.version not in versions:
+            print(f"❌ Versi {args.version} tidak ada di {root}", file=sys.stderr)
+            return 1
+        write_pointer(root, ACTIVE_FILE, args.version)
+        print(f"🔁 Versi aktif: {args.version} (diterapkan watcher dalam ±{MODEL_REGISTRY_POLL:g} s)")
+        return 0
+
+    if args.command == "shadow":
+        if args.off or not args.version:
+            write_pointer(root, SHADOW_FILE, None)
+            print("⏹️ Shadow mode dimatikan")
+            return 0
+        if args.version not in versions:
+            print(f"❌ Versi {args.version} tidak ada di {root}", file=sys.stderr)
+            return 1
+        write_pointer(root, SHADOW_FILE, args.version)
+        print(f"👥 Shadow: {args.version}")
+        return 0
+
+    if args.command == "validate":
+        if args.version not in versions:
+            print(f"❌ Versi {args.version} tidak ada di {root}", file=sys.stderr)
+            return 1
+        active = read_pointer(root, ACTIVE_FILE) or next(reversed(versions), None)
+        batch = load_validation_batch()
+        reference = None
+        if batch is not None and active not in (None, args.version):
+            reference = load_model_from_path(versions[active])
+        start = time.perf_counter()
+        try:
+            model = load_model_from_path(versions[args.version])
+            load_seconds = time.perf_counter() - start
+            agreement = validate_model(model, reference, batch, MODEL_MIN_AGREEMENT if reference else 0.0)
+        except Exception as e:
+            print(f"❌ Versi {args.version} tidak valid: {type(e).__name__}: {e}", file=sys.stderr)
+            return 1
+        note = f", agreement {agreement:.1%} dengan {active}" if agreement is not None else ""
+        print(f"✅ Versi {args.version} valid (load + warm-up {load_seconds:.1f} s{note})")
+        return 0
+
+    if not os.path.exists(args.log):
+        print(f"ℹ️ Belum ada shadow log di {args.log}")
+        return 1
+    print(f"{'aktif':<16}{'shadow':<16}{'gambar':>8}{'beda':>7}{'rate':>8}{'p50 aktif':>11}{'p50 shadow':>12}{'selisih':>10}")
+    for (active, shadow), stats in shadow_report(args.log).items():
+        active_p50 = float(np.percentile(stats["active_ms"], 50))
+        shadow_p50 = float(np.percentile(stats["shadow_ms"], 50))
+        rate = stats["disagreements"] / stats["images"] if stats["images"] else 0.0
+        print(f"{active:<16}{shadow:<16}{stats['images']:>8}{stats['disagreements']:>7}{rate:>8.2%}"
+              f"{active_p50:>9.1f}ms{shadow_p50:>10.1f}ms{shadow_p50 - active_p50:>+8.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Index near-duplicate (perceptual hash) untuk foto burst
+
+Foto burst / foto ulang dari posisi yang hampir sama menghasilkan byte
+berbeda, sehingga cache prediksi & laporan (kunci SHA-256) selalu miss.
+Index ini memetakan gambar ke gambar "kanonik" yang hampir identik:
+- pHash 64-bit: DCT 2D dari grayscale 32x32, 8x8 koefisien frekuensi
+  rendah dibandingkan dengan mediannya
+- signature warna: rata-rata RGB per sel 2x2 dari thumbnail yang sama.
+  pHash buta warna (tekstur karat oranye dan cat abu-abu bisa berjarak 0),
+  padahal warna adalah sinyal utama korosi; kecocokan baru diterima bila
+  jarak Hamming DAN jarak warna sama-sama di bawah ambang
+- lookup jarak Hamming dengan multi-index hashing: hash dipecah menjadi
+  (jarak maks + 1) potongan bit; menurut prinsip pigeonhole setiap hash
+  dalam jarak tersebut identik pada minimal satu potongan, sehingga
+  kandidat cukup diambil dari tabel dict per potongan
+- hanya gambar kanonik yang dimasukkan ke index, agar rantai foto yang
+  berubah sedikit demi sedikit tidak terus menempel ke grup yang sama
+
+Index disimpan di SQLite (dipakai bersama oleh semua sesi dan proses);
+entri baru dari proses lain ikut terbaca pada lookup berikutnya.
+
+Contoh:
+    NEAR_DUPLICATE_DISTANCE=6 streamlit run app.py
+    python near_duplicates.py groups /data/survey_drone/tangki_03 --distance 6
+    python near_duplicates.py stats
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from cache import CACHE_DIR
+
+# Jarak Hamming maksimum (bit dari 64) agar dua foto dianggap sama; 0 = nonaktif
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", 0))
+# Selisih maksimum rata-rata kanal RGB (0-255) per sel 2x2 agar dua foto dianggap sama
+NEAR_DUPLICATE_COLOR_DISTANCE = int(os.getenv("NEAR_DUPLICATE_COLOR_DISTANCE", 24))
+NEAR_DUPLICATE_DB = os.getenv("NEAR_DUPLICATE_DB", os.path.join(CACHE_DIR, "phash.sqlite"))
+HASH_BITS = 64
+HASH_SIZE = 8
+DCT_SIZE = 32
+COLOR_GRID = 2
+# Di atas ini setiap potongan bit terlalu kecil untuk menyaring kandidat
+MAX_DISTANCE = 16
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix: dct(x) = M @ x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def image_signature(image):
+    """(64-bit DCT perceptual hash as an int, colour signature bytes) of a PIL image
+
+    An unloaded JPEG is decoded in draft mode at 1/8 scale, which mutates
+    the image: pass a separately opened copy if it is displayed later.
+    """
+    if image.format == "JPEG":
+        image.draft("RGB", (DCT_SIZE * 2, DCT_SIZE * 2))
+    # reducing_gap: reduce() blok-rata-rata dulu, resize mahal hanya pada gambar kecil
+    small = image.resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR, reducing_gap=2.0).convert("RGB")
+    pixels = np.asarray(small.convert("L"), dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low)
+    phash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    cell = DCT_SIZE // COLOR_GRID
+    cells = np.asarray(small, dtype=np.float32).reshape(COLOR_GRID, cell, COLOR_GRID, cell, 3).mean(axis=(1, 3))
+    return phash, np.rint(cells).astype(np.uint8).tobytes()
+
+
+def perceptual_hash(image):
+    """64-bit DCT perceptual hash (pHash) of a PIL image, as an int"""
+    return image_signature(image)[0]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def color_distance(a, b):
+    """Largest per-cell, per-channel difference between two colour signatures"""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes for Hamming-radius lookups"""
+
+    def __init__(self, max_distance):
+        if not 0 < max_distance <= MAX_DISTANCE:
+            raise ValueError(f"max_distance harus 1..{MAX_DISTANCE}")
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        self._chunks = [(HASH_BITS * i // chunks, HASH_BITS * (i + 1) // chunks) for i in range(chunks)]
+        self._tables = [{} for _ in self._chunks]
+        self._size = 0
+
+    def _parts(self, value):
+        for (lo, hi), table in zip(self._chunks, self._tables):
+            yield table, (value >> lo) & ((1 << (hi - lo)) - 1)
+
+    def add(self, value, item):
+        for table, part in self._parts(value):
+            table.setdefault(part, []).append((value, item))
+        self._size += 1
+
+    def search(self, value, accept=None):
+        """(distance, item) of the closest stored hash within max_distance, or None
+
+        accept(item), if given, must also hold for a candidate to match.
+        """
+        best = None
+        for table, part in self._parts(value):
+            for candidate, item in table.get(part, ()):
+                distance = hamming(value, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    if accept is None or accept(item):
+                        best = (distance, item)
+        return best
+
+    def __len__(self):
+        return self._size
+
+
+class NearDuplicateIndex:
+    """Persistent pHash + colour index mapping an image to the content hash of a near-identical canonical image"""
+
+    def __init__(self, max_distance=NEAR_DUPLICATE_DISTANCE, path=NEAR_DUPLICATE_DB,
+                 max_color_distance=NEAR_DUPLICATE_COLOR_DISTANCE):
+        self.path = path
+        self.index = HashIndex(max_distance)
+        self.max_color_distance = max_color_distance
+        self._canonical = set()
+        self._last_id = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # phash disimpan hex: 64-bit unsigned tidak muat di INTEGER SQLite
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS phashes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phash TEXT NOT NULL,
+                content_hash TEXT NOT NULL UNIQUE,
+                created_at REAL NOT NULL
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(phashes)")]
+        if "colors" not in columns:
+            self._conn.execute("ALTER TABLE phashes ADD COLUMN colors TEXT")
+        with self._lock:
+            self._sync()
+
+    @property
+    def max_distance(self):
+        return self.index.max_distance
+
+    def _sync(self):
+        # Ambil entri yang ditambahkan proses lain sejak lookup terakhir
+        rows = self._conn.execute(
+            "SELECT id, phash, content_hash, colors FROM phashes WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for row_id, phash, digest, colors in rows:
+            if digest not in self._canonical:
+                self._canonical.add(digest)
+                # Entri lama tanpa signature warna hanya cocok lewat content hash yang persis sama
+                if colors:
+                    self.index.add(int(phash, 16), (digest, bytes.fromhex(colors)))
+            self._last_id = row_id
+
+    def _accept(self, colors):
+        return lambda item: color_distance(colors, item[1]) <= self.max_color_distance
+
+    def resolve(self, image, digest):
+        """Return (cache key, distance): a near-duplicate's content hash, or (digest, None) for a new image
+
+        image is hashed only when digest is not already a canonical image;
+        see perceptual_hash for the draft-mode caveat.
+        """
+        with self._lock:
+            self._sync()
+            if digest in self._canonical:
+                return digest, None
+        phash, colors = image_signature(image)
+        with self._lock:
+            self._sync()
+            match = self.index.search(phash, self._accept(colors))
+            if match is not None:
+                distance, (canonical, _) = match
+                return canonical, distance
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO phashes (phash, content_hash, created_at, colors) VALUES (?, ?, ?, ?)",
+                (f"{phash:016x}", digest, time.time(), colors.hex()),
+            )
+            if cursor.rowcount:
+                self._canonical.add(digest)
+                self.index.add(phash, (digest, colors))
+        return digest, None
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def group_images(paths, max_distance, max_color_distance=NEAR_DUPLICATE_COLOR_DISTANCE):
+    """Group image files by near-duplicate canonical image; returns (groups, seconds per hash)"""
+    from preprocessing import open_image
+    index = HashIndex(max_distance)
+    groups = {}
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            phash, colors = image_signature(open_image(f.read()))
+        match = index.search(phash, lambda item: color_distance(colors, item[1]) <= max_color_distance)
+        if match is None:
+            index.add(phash, (path, colors))
+            groups[path] = [path]
+        else:
+            groups[match[1][0]].append(path)
+    return groups, (time.perf_counter() - start) / max(len(paths), 1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index near-duplicate (perceptual hash) foto inspeksi")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    groups_parser = subparsers.add_parser("groups", help="Kelompokkan gambar di direktori yang hampir identik")
+    groups_parser.add_argument("images", help="Direktori gambar")
+    groups_parser.add_argument("--distance", type=int, default=NEAR_DUPLICATE_DISTANCE or 6,
+                               help="Jarak Hamming maksimum (bit dari 64)")
+    groups_parser.add_argument("--color-distance", type=int, default=NEAR_DUPLICATE_COLOR_DISTANCE,
+                               help="Selisih maksimum rata-rata RGB per sel 2x2 (0-255)")
+    groups_parser.add_argument("--show", type=int, default=10, help="Jumlah grup terbesar yang ditampilkan")
+    stats_parser = subparsers.add_parser("stats", help="Ukuran index yang dipakai aplikasi")
+    stats_parser.add_argument("--db", default=NEAR_DUPLICATE_DB)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == "stats":
+        if not os.path.exists(args.db):
+            print(f"❌ Index tidak ditemukan: {args.db}", file=sys.stderr)
+            return 1
+        conn = sqlite3.connect(args.db)
+        count, first, last = conn.execute("SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM phashes").fetchone()
+        print(f"📇 {count} gambar kanonik di {args.db}")
+        if count:
+            print(f"   {time.strftime('%Y-%m-%d %H:%M', time.localtime(first))} - "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}")
+        return 0
+
+    from batch_scan import iter_image_paths
+    paths = sorted(iter_image_paths(args.images))
+    if not paths:
+        print(f"❌ Tidak ada gambar di {args.images}", file=sys.stderr)
+        return 1
+    groups, seconds = group_images(paths, args.distance, args.color_distance)
+    duplicates = len(paths) - len(groups)
+    print(f"📊 {len(paths)} gambar -> {len(groups)} grup pada jarak <= {args.distance} bit, "
+          f"warna <= {args.color_distance} "
+          f"({duplicates} near-duplicate, {duplicates / len(paths):.0%}), {seconds * 1000:.1f} ms/gambar")
+    for canonical, members in sorted(groups.items(), key=lambda item: -len(item[1]))[:args.show]:
+        if len(members) < 2:
+            break
+        print(f"   {len(members):>4}  {os.path.relpath(canonical, args.images)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
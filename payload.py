@@ -0,0 +1,136 @@
+"""
+Optimizer payload gambar untuk request Gemini
+
+Gambar diperkecil ke sisi maksimum, lalu di-encode sebagai JPEG atau WebP
+dengan kualitas tertinggi yang masih muat di byte budget. Hasil encode
+dibandingkan dengan estimasi PNG lossless full-resolution (cara lama)
+untuk menampilkan penghematan ukuran, waktu encode dan waktu upload.
+"""
+import io
+import os
+import time
+
+from PIL import Image, ImageOps, features
+
+from preprocessing import normalize_channels
+
+PAYLOAD_MAX_SIDE = int(os.getenv("PAYLOAD_MAX_SIDE", 1536))
+PAYLOAD_MAX_BYTES = int(os.getenv("PAYLOAD_MAX_BYTES", 400 * 1024))
+PAYLOAD_FORMATS = tuple(os.getenv("PAYLOAD_FORMATS", "webp,jpeg").lower().split(","))
+# Bandwidth upload yang diasumsikan untuk estimasi waktu upload
+UPLINK_MBPS = float(os.getenv("UPLINK_MBPS", 10))
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+# Kualitas dicari dalam langkah 5 agar binary search cukup 3-4 encode per format
+QUALITY_STEP = 5
+# Jika kualitas minimum pun melebihi budget, sisi gambar diperkecil dengan faktor ini
+DOWNSCALE_STEP = 0.75
+# PNG baseline diestimasi dari crop tengah 1/PNG_SAMPLE_FACTOR per sisi
+PNG_SAMPLE_FACTOR = 4
+
+
+class Payload:
+    """Encoded image plus the numbers shown in the UI"""
+
+    def __init__(self, data, format, size, quality, encode_seconds, baseline_bytes, baseline_seconds):
+        self.data = data
+        self.format = format
+        self.size = size
+        self.quality = quality
+        self.encode_seconds = encode_seconds
+        self.baseline_bytes = baseline_bytes
+        self.baseline_seconds = baseline_seconds
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    def part(self):
+        """Gemini inline image part"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def upload_seconds(self, num_bytes, uplink_mbps=UPLINK_MBPS):
+        return num_bytes * 8 / (uplink_mbps * 1e6)
+
+    def savings(self, uplink_mbps=UPLINK_MBPS):
+        """(encode_seconds_saved, upload_seconds_saved) versus the full-size PNG"""
+        upload_saved = self.upload_seconds(self.baseline_bytes - len(self.data), uplink_mbps)
+        return self.baseline_seconds - self.encode_seconds, upload_saved
+
+
+def available_formats(formats=PAYLOAD_FORMATS):
+    """Requested formats this Pillow build can encode"""
+    return [f for f in formats if f == "jpeg" or (f == "webp" and features.check("webp"))]
+
+
+def encode(image, format, quality):
+    buffer = io.BytesIO()
+    if format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=2)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def best_quality(image, format, max_bytes):
+    """Binary-search the highest quality that fits max_bytes; (quality, data) or None"""
+    low, high = 0, (MAX_QUALITY - MIN_QUALITY) // QUALITY_STEP
+    best = None
+    while low <= high:
+        step = (low + high + 1) // 2
+        quality = MIN_QUALITY + step * QUALITY_STEP
+        data = encode(image, format, quality)
+        if len(data) <= max_bytes:
+            best = (quality, data)
+            low = step + 1
+        else:
+            high = step - 1
+    return best
+
+
+def estimate_png_baseline(image):
+    """Estimate (bytes, seconds) of the old full-resolution PNG encode from a center crop"""
+    # Crop (bukan thumbnail) menjaga detail piksel sehingga rasio kompresi PNG serupa
+    width, height = image.width // PNG_SAMPLE_FACTOR, image.height // PNG_SAMPLE_FACTOR
+    if min(width, height) < 16:
+        sample, factor = image, 1
+    else:
+        left, top = (image.width - width) // 2, (image.height - height) // 2
+        sample = image.crop((left, top, left + width, top + height))
+        factor = image.width * image.height / (width * height)
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    sample.save(buffer, format="PNG")
+    return int(len(buffer.getvalue()) * factor), (time.perf_counter() - start) * factor
+
+
+def optimize_image(image, max_side=PAYLOAD_MAX_SIDE, max_bytes=PAYLOAD_MAX_BYTES, formats=PAYLOAD_FORMATS):
+    """Downscale and encode image as the best JPEG/WebP payload under max_bytes"""
+    image = normalize_channels(ImageOps.exif_transpose(image))
+    baseline_bytes, baseline_seconds = estimate_png_baseline(image)
+
+    start = time.perf_counter()
+    formats = available_formats(formats) or ["jpeg"]
+    scale = min(1.0, max_side / max(image.size))
+    while True:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        work = image.resize(size, Image.LANCZOS, reducing_gap=3.0) if size != image.size else image
+        # Format dengan kualitas tertinggi yang muat budget menang; seri -> yang lebih kecil
+        candidates = []
+        for format in formats:
+            result = best_quality(work, format, max_bytes)
+            if result is not None:
+                candidates.append((result[0], -len(result[1]), format, result[1]))
+        if candidates or max(size) <= 64:
+            break
+        scale *= DOWNSCALE_STEP
+
+    if candidates:
+        quality, _, format, data = max(candidates)
+    else:
+        # Gambar kecil yang tetap tidak muat: kirim JPEG kualitas minimum
+        quality, format = MIN_QUALITY, "jpeg"
+        data = encode(work, format, quality)
+    return Payload(data, format, work.size, quality, time.perf_counter() - start, baseline_bytes, baseline_seconds)
@@ -0,0 +1,325 @@
+"""
+Prefilter warna/tekstur (cascade) di depan CNN
+
+Fitur dihitung dengan NumPy tervektorisasi pada thumbnail 64x64 dari
+input model 128x128 yang memang sudah dibuat untuk CNN (tanpa decode
+tambahan):
+- rust_fraction: fraksi piksel dengan hue merah-oranye-coklat (HSV)
+  yang cukup jenuh, yaitu massa histogram hue pada bin karat
+- texture: rata-rata gradien absolut kecerahan (karat kasar, cat mulus)
+
+Gambar yang jelas berkarat (rust_fraction & texture tinggi) atau jelas
+bersih (keduanya rendah) langsung diberi label; sisanya diteruskan ke
+CNN. Threshold dikalibrasi terhadap output CNN sehingga agreement pada
+gambar yang dilewati >= target, dengan skip rate sebesar mungkin.
+
+Contoh:
+    python prefilter.py calibrate dataset/train --target-agreement 0.99
+    python prefilter.py evaluate dataset/test
+    PREFILTER=1 streamlit run app.py
+    python batch_scan.py /data/survey_drone --output hasil.csv --prefilter
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import metrics
+
+PREFILTER = os.getenv("PREFILTER", "0").lower() in ("1", "true", "yes")
+PREFILTER_CONFIG = os.getenv("PREFILTER_CONFIG", "prefilter.json")
+# Fraksi gambar yang diputuskan prefilter tapi tetap dicek CNN, untuk metrik agreement live
+PREFILTER_AUDIT_RATE = float(os.getenv("PREFILTER_AUDIT_RATE", 0.02))
+
+FEATURES = ("rust_fraction", "texture")
+# Hue karat (derajat): merah sampai oranye-coklat, termasuk merah yang melingkar di dekat 360
+RUST_HUE_MAX = 40.0
+RUST_HUE_WRAP = 345.0
+RUST_MIN_SATURATION = 0.35
+RUST_MIN_VALUE = 0.12
+RUST_MAX_VALUE = 0.9
+# Fitur dihitung pada setiap piksel ke-2 (64x64 dari input 128x128)
+THUMBNAIL_STRIDE = 2
+DEFAULT_TARGET_AGREEMENT = 0.99
+# Region keputusan harus berisi minimal sekian gambar kalibrasi
+DEFAULT_MIN_IMAGES = 20
+HOLDOUT_FRACTION = 0.2
+
+
+def extract_features(batch):
+    """(N, 2) float32 [rust_fraction, texture] for a float32 (N, H, W, 3) batch in 0-1"""
+    # Thumbnail 64x64 lewat stride (view, tanpa salinan) dari input model 128x128
+    batch = np.asarray(batch, dtype=np.float32)[:, ::THUMBNAIL_STRIDE, ::THUMBNAIL_STRIDE]
+    r, g, b = batch[..., 0], batch[..., 1], batch[..., 2]
+    delta = r - np.minimum(g, b)
+    # Hue karat tanpa menghitung hue penuh: R kanal tertinggi, lalu
+    # hue <= RUST_HUE_MAX  <=>  G - B <= delta * RUST_HUE_MAX / 60
+    # hue >= RUST_HUE_WRAP <=>  B - G <= delta * (360 - RUST_HUE_WRAP) / 60
+    rust = ((r >= g) & (r >= b) & (delta > 0)
+            & (g - b <= delta * (RUST_HUE_MAX / 60)) & (b - g <= delta * ((360 - RUST_HUE_WRAP) / 60))
+            & (delta >= RUST_MIN_SATURATION * r) & (r >= RUST_MIN_VALUE) & (r <= RUST_MAX_VALUE))
+
+    value = batch.max(axis=-1)
+    texture = (np.abs(np.diff(value, axis=1)).mean(axis=(1, 2)) + np.abs(np.diff(value, axis=2)).mean(axis=(1, 2))) / 2
+    return np.stack([rust.mean(axis=(1, 2)), texture], axis=1).astype(np.float32)
+
+
+def corroded_labels(probs):
+    """True where the CNN output means KOROSI (class 0, see interpret_prediction)"""
+    return np.asarray(probs).reshape(-1) <= 0.5
+
+
+class Cascade:
+    """Calibrated thresholds that label obvious images and leave the rest to the CNN"""
+
+    def __init__(self, config, audit_rate=PREFILTER_AUDIT_RATE, seed=None):
+        self.config = config
+        self.corroded = config.get("corroded")
+        self.clean = config.get("clean")
+        self.audit_rate = audit_rate
+        self._rng = np.random.default_rng(seed)
+        rules = json.dumps({"corroded": self.corroded, "clean": self.clean}, sort_keys=True)
+        # Bagian key cache / store: hasil berubah bila threshold berubah
+        self.version = "prefilter-" + hashlib.sha256(rules.encode("utf-8")).hexdigest()[:8]
+
+    def decide(self, features):
+        """Pseudo-probabilities from features (NaN = ambiguous, send to the CNN)
+
+        A decided image gets the calibrated agreement of its side as
+        confidence, expressed like a sigmoid output so interpret_prediction
+        maps it to the same label/confidence format as the CNN.
+        """
+        probs = np.full(len(features), np.nan, dtype=np.float32)
+        rust, texture = features[:, 0], features[:, 1]
+        if self.corroded:
+            mask = (rust >= self.corroded["min_rust"]) & (texture >= self.corroded["min_texture"])
+            probs[mask] = 1 - self.corroded["agreement"]
+        if self.clean:
+            mask = (rust <= self.clean["max_rust"]) & (texture <= self.clean["max_texture"]) & np.isnan(probs)
+            probs[mask] = self.clean["agreement"]
+        return probs
+
+    def probabilities(self, batch):
+        """(probs, audit) for a preprocessed batch; audit marks decided images to check with the CNN anyway"""
+        with metrics.stage("prefilter"):
+            probs = self.decide(extract_features(batch))
+        decided = ~np.isnan(probs)
+        corroded = int(np.count_nonzero(probs[decided] < 0.5))
+        for result, count in (("corroded", corroded), ("clean", int(decided.sum()) - corroded),
+                              ("ambiguous", len(probs) - int(decided.sum()))):
+            if count:
+                metrics.PREFILTER.inc(count, result=result)
+        audit = decided & (self._rng.random(len(probs)) < self.audit_rate)
+        return probs, audit
+
+    def record_audit(self, probs, cnn_probs):
+        """Count agreement between cascade decisions and the CNN on audited images"""
+        decided = ~np.isnan(probs)
+        if not decided.any():
+            return
+        agree = int(np.count_nonzero(corroded_labels(probs[decided]) == corroded_labels(cnn_probs[decided])))
+        metrics.PREFILTER_AUDIT.inc(agree, result="agree")
+        if agree < decided.sum():
+            metrics.PREFILTER_AUDIT.inc(int(decided.sum()) - agree, result="disagree")
+
+
+def calibrated_for(config, model_version):
+    """Whether a calibration was fit to model_version (a model_version() string or a registry cache_version)"""
+    calibrated = config.get("model_version")
+    # cache_version registry = "<versi>-<hash file>", kalibrasi menyimpan hash file saja
+    return bool(calibrated) and (model_version == calibrated or model_version.endswith(f"-{calibrated}"))
+
+
+def load_cascade(path=PREFILTER_CONFIG, model_version=None):
+    """Cascade from a calibration file, or None (with a warning) when it is missing or stale
+
+    With model_version (the serving model's version) a calibration fit to
+    another CNN is disabled: its thresholds would no longer agree with it.
+    """
+    if not os.path.exists(path):
+        print(f"⚠️  Prefilter dinonaktifkan: kalibrasi {path} belum ada (python prefilter.py calibrate ...)",
+              file=sys.stderr)
+        return None
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if model_version is not None and not calibrated_for(config, model_version):
+        print(f"⚠️  Prefilter dinonaktifkan: {path} dikalibrasi untuk model {config.get('model_version')}, "
+              f"bukan {model_version} (kalibrasi ulang: python prefilter.py calibrate ...)", file=sys.stderr)
+        return None
+    return Cascade(config)
+
+
+def _best_region(rust, texture, targets, side, target_agreement, min_images, steps):
+    """Widest threshold pair whose region agrees with the CNN label at least target_agreement"""
+    rust_grid = np.unique(np.quantile(rust, np.linspace(0, 1, steps + 1)))
+    texture_grid = np.unique(np.quantile(texture, np.linspace(0, 1, 11)))
+    best = None
+    for rust_threshold in rust_grid:
+        rust_mask = rust >= rust_threshold if side == "corroded" else rust <= rust_threshold
+        for texture_threshold in texture_grid:
+            mask = rust_mask & (texture >= texture_threshold if side == "corroded" else texture <= texture_threshold)
+            count = int(mask.sum())
+            if count < min_images or (best is not None and count <= best[0]):
+                continue
+            agreement = float(targets[mask].mean())
+            if agreement >= target_agreement:
+                best = (count, float(rust_threshold), float(texture_threshold), agreement)
+    if best is None:
+        return None
+    _, rust_threshold, texture_threshold, agreement = best
+    if side == "corroded":
+        return {"min_rust": rust_threshold, "min_texture": texture_threshold, "agreement": round(agreement, 4)}
+    return {"max_rust": rust_threshold, "max_texture": texture_threshold, "agreement": round(agreement, 4)}
+
+
+def calibrate(features, cnn_probs, target_agreement=DEFAULT_TARGET_AGREEMENT, min_images=DEFAULT_MIN_IMAGES, steps=40):
+    """Thresholds for both sides from features and CNN outputs of the same images
+
+    A side whose best region cannot reach target_agreement (or holds fewer
+    than min_images) is disabled, so those images always go to the CNN.
+    """
+    corroded = corroded_labels(cnn_probs)
+    rust, texture = features[:, 0], features[:, 1]
+    return {
+        "features": list(FEATURES),
+        "target_agreement": target_agreement,
+        "corroded": _best_region(rust, texture, corroded, "corroded", target_agreement, min_images, steps),
+        "clean": _best_region(rust, texture, ~corroded, "clean", target_agreement, min_images, steps),
+    }
+
+
+def evaluate(cascade, features, cnn_probs):
+    """Skip rate and agreement with the CNN of a cascade on labelled features"""
+    probs = cascade.decide(features)
+    decided = ~np.isnan(probs)
+    skipped = int(decided.sum())
+    agree = int(np.count_nonzero(corroded_labels(probs[decided]) == corroded_labels(cnn_probs)[decided]))
+    return {
+        "images": len(probs),
+        "skipped": skipped,
+        "skip_rate": round(skipped / len(probs), 4) if len(probs) else 0.0,
+        "agreement": round(agree / skipped, 4) if skipped else None,
+        "corroded_skipped": int(np.count_nonzero(probs[decided] < 0.5)),
+        "clean_skipped": int(np.count_nonzero(probs[decided] > 0.5)),
+    }
+
+
+def collect(model, paths, batch_size=32, limit=None):
+    """Features, CNN probabilities and per-image seconds of both stages for image files"""
+    from inference import image_to_array, predict_proba
+    from preprocessing import open_image
+
+    features, probs = [], []
+    prefilter_seconds = cnn_seconds = 0.0
+    chunk = []
+
+    def flush():
+        nonlocal prefilter_seconds, cnn_seconds
+        batch = np.stack(chunk)
+        start = time.perf_counter()
+        features.append(extract_features(batch))
+        prefilter_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        probs.append(predict_proba(model, batch))
+        cnn_seconds += time.perf_counter() - start
+        chunk.clear()
+
+    for i, path in enumerate(paths):
+        if limit and i >= limit:
+            break
+        try:
+            with open_image(path) as image:
+                # Sama dengan batch scanner (draft decode)
+                chunk.append(image_to_array(image, draft=True))
+        except Exception as e:
+            print(f"\n⚠️  Dilewati {path}: {e}", file=sys.stderr)
+            continue
+        if len(chunk) == batch_size:
+            flush()
+            print(f"\r🔄 {sum(len(f) for f in features)} gambar", end="", file=sys.stderr, flush=True)
+    if chunk:
+        flush()
+    print(file=sys.stderr)
+    if not features:
+        raise ValueError("Tidak ada gambar yang bisa dibaca")
+    features, probs = np.concatenate(features), np.concatenate(probs)
+    return features, probs, prefilter_seconds / len(probs), cnn_seconds / len(probs)
+
+
+def print_evaluation(title, stats):
+    agreement = f"{stats['agreement']:.2%}" if stats["agreement"] is not None else "-"
+    print(f"{title}: {stats['images']} gambar, dilewati {stats['skipped']} ({stats['skip_rate']:.1%}: "
+          f"{stats['corroded_skipped']} korosi, {stats['clean_skipped']} bersih), agreement dengan CNN {agreement}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kalibrasi & evaluasi prefilter warna/tekstur")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("calibrate", "Kalibrasi threshold terhadap output CNN"),
+                            ("evaluate", "Skip rate & agreement threshold saat ini terhadap CNN")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("images", help="Direktori gambar (rekursif)")
+        sub.add_argument("--model", help="Path model (default: DEFAULT_MODEL_PATH)")
+        sub.add_argument("--config", default=PREFILTER_CONFIG, help="File threshold (JSON)")
+        sub.add_argument("--limit", type=int, help="Maksimum jumlah gambar")
+    calibrate_parser = subparsers.choices["calibrate"]
+    calibrate_parser.add_argument("--target-agreement", type=float, default=DEFAULT_TARGET_AGREEMENT,
+                                  help="Agreement minimum dengan CNN pada gambar yang dilewati")
+    calibrate_parser.add_argument("--min-images", type=int, default=DEFAULT_MIN_IMAGES,
+                                  help="Minimum gambar kalibrasi per region keputusan")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from batch_scan import iter_image_paths
+    from cache import model_version
+    from inference import DEFAULT_MODEL_PATH, load_model_from_path
+
+    model_path = args.model or DEFAULT_MODEL_PATH
+    if args.command == "evaluate" and not os.path.exists(args.config):
+        print(f"❌ Kalibrasi {args.config} tidak ditemukan", file=sys.stderr)
+        return 1
+    print(f"🔄 Loading model: {model_path}", file=sys.stderr)
+    model = load_model_from_path(model_path, workers=0)
+    features, probs, prefilter_seconds, cnn_seconds = collect(model, iter_image_paths(args.images), limit=args.limit)
+    print(f"⏱️ Per gambar: prefilter {prefilter_seconds * 1000:.2f} ms vs CNN {cnn_seconds * 1000:.2f} ms")
+
+    if args.command == "evaluate":
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+        if not calibrated_for(config, model_version(model_path)):
+            print("⚠️  Threshold dikalibrasi untuk versi model lain; kalibrasi ulang disarankan", file=sys.stderr)
+        print_evaluation("📊 Evaluasi", evaluate(Cascade(config), features, probs))
+        return 0
+
+    # Kalibrasi pada 80% gambar, skip rate & agreement dilaporkan pada 20% sisanya
+    order = np.random.default_rng(0).permutation(len(probs))
+    holdout = order[:int(len(order) * HOLDOUT_FRACTION)]
+    train = order[len(holdout):]
+    config = calibrate(features[train], probs[train], args.target_agreement, args.min_images)
+    config["model_version"] = model_version(model_path)
+    config["calibration"] = evaluate(Cascade(config), features[train], probs[train])
+    config["holdout"] = evaluate(Cascade(config), features[holdout], probs[holdout]) if len(holdout) else None
+    for side in ("corroded", "clean"):
+        if config[side] is None:
+            print(f"ℹ️ Sisi {side}: tidak ada region dengan agreement >= {args.target_agreement:.1%}; selalu ke CNN")
+    print_evaluation("📊 Kalibrasi", config["calibration"])
+    if config["holdout"]:
+        print_evaluation("📊 Holdout  ", config["holdout"])
+    skip_rate = (config["holdout"] or config["calibration"])["skip_rate"]
+    print(f"💡 Estimasi biaya per gambar: {prefilter_seconds * 1000 + (1 - skip_rate) * cnn_seconds * 1000:.2f} ms "
+          f"(tanpa prefilter {cnn_seconds * 1000:.2f} ms)")
+
+    with open(args.config, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    print(f"📄 Threshold disimpan ke {args.config}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
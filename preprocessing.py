@@ -0,0 +1,199 @@
+"""
+Engine preprocessing gambar untuk model (hemat alokasi, sadar decode)
+
+- JPEG draft mode: decode langsung pada skala DCT 1/2, 1/4 atau 1/8
+- Skala uint8 -> float32 langsung ke buffer batch yang dialokasikan sekali
+- Normalisasi orientasi EXIF dan channel (RGBA, grayscale, palette, CMYK, 16-bit)
+- Guard decompression bomb sebelum piksel di-decode
+
+Benchmark (legacy preprocess_image vs engine):
+    python preprocessing.py benchmark --size 4000x3000 --images 20
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_SIZE = (128, 128)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 100_000_000))
+SCALE = np.float32(1.0 / 255.0)
+
+# Samakan batas bawaan Pillow agar DecompressionBombError konsisten dengan guard di bawah
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class ImageTooLargeError(ValueError):
+    """Image dimensions exceed MAX_IMAGE_PIXELS (possible decompression bomb)"""
+
+
+def check_image_size(image, max_pixels=MAX_IMAGE_PIXELS):
+    """Reject oversized images using only the header, before decoding pixels"""
+    pixels = image.width * image.height
+    if pixels > max_pixels:
+        raise ImageTooLargeError(
+            f"Gambar terlalu besar: {image.width}x{image.height} ({pixels / 1e6:.0f} MP, batas {max_pixels / 1e6:.0f} MP)"
+        )
+
+
+def open_image(source):
+    """Open a path, bytes or file-like object lazily and apply the size guard"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    check_image_size(image)
+    return image
+
+
+def normalize_channels(image):
+    """Convert any mode to RGB; transparent areas are composited on white"""
+    if image.mode == "RGB":
+        return image
+    if image.mode in ("I;16", "I;16B", "I;16L", "I"):
+        # 16-bit grayscale (PNG 16-bit sering dibuka sebagai mode "I"): ambil 8 bit teratas, bukan clip ke 255
+        array = np.asarray(image).astype(np.uint32)
+        shift = 8 if image.mode.startswith("I;16") or array.max() < 65536 else 24
+        array = (array >> shift).astype(np.uint8)
+        return Image.fromarray(array).convert("RGB")
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert("RGB")
+    return image.convert("RGB")
+
+
+def prepare_image(image, size=IMAGE_SIZE, draft=True):
+    """Decode, orient, normalize channels and resize an image to the model size
+
+    With draft=True an unloaded JPEG is decoded at a reduced DCT scale; only
+    use it on images that are not displayed afterwards, since draft mutates
+    the image object in place.
+    """
+    check_image_size(image)
+    if draft and image.format == "JPEG":
+        # Minta skala 2x ukuran target agar resize akhir tetap tajam
+        image.draft("RGB", (size[0] * 2, size[1] * 2))
+    image = ImageOps.exif_transpose(image)
+    image = normalize_channels(image)
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return image
+
+
+def to_float32(image, out=None):
+    """Scale a prepared uint8 RGB image to float32 [0, 1], writing into out if given"""
+    pixels = np.asarray(image, dtype=np.uint8)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    # Satu pass uint8 -> float32 tanpa array float64 sementara
+    np.multiply(pixels, SCALE, out=out, dtype=np.float32)
+    return out
+
+
+class BatchBuffer:
+    """Preallocated float32 batch tensor reused across batches"""
+
+    def __init__(self, capacity, size=IMAGE_SIZE):
+        self.size = size
+        self.array = np.empty((capacity, size[1], size[0], 3), dtype=np.float32)
+
+    def fill(self, images, draft=True):
+        """Preprocess images into the buffer and return a view of the filled rows"""
+        if len(images) > len(self.array):
+            self.array = np.empty((len(images), self.size[1], self.size[0], 3), dtype=np.float32)
+        for i, image in enumerate(images):
+            to_float32(prepare_image(image, self.size, draft=draft), out=self.array[i])
+        return self.array[:len(images)]
+
+
+def legacy_preprocess(image):
+    """Original preprocess_image (full decode, float64) kept as the benchmark baseline"""
+    img = image.resize(IMAGE_SIZE)
+    img_array = np.array(img)
+    img_array = img_array / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def engine_preprocess(image):
+    """Engine path used by batch callers: draft decode + fused float32 scaling"""
+    return np.expand_dims(to_float32(prepare_image(image, draft=True)), axis=0)
+
+
+PREPROCESSORS = {"legacy": legacy_preprocess, "engine": engine_preprocess}
+
+
+def make_sample_jpeg(path, size, seed=0):
+    """Write a noisy synthetic camera-sized JPEG"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+    Image.fromarray(small).resize(size, Image.BILINEAR).save(path, format="JPEG", quality=90)
+
+
+def _run_preprocessor(name, paths, result_queue):
+    from tflite_backend import peak_rss_mb, rss_growth_mb
+    preprocess = PREPROCESSORS[name]
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    for path in paths:
+        with open_image(path) as image:
+            preprocess(image)
+    elapsed = time.perf_counter() - start
+    result_queue.put({
+        "ms_per_image": elapsed * 1000 / len(paths),
+        "peak_rss_mb": rss_growth_mb(baseline),
+    })
+
+
+def benchmark(size=(4000, 3000), images=20):
+    """Latency and peak RSS growth per preprocessor, each in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(images):
+            path = os.path.join(tmp_dir, f"sample_{i}.jpg")
+            make_sample_jpeg(path, size, seed=i)
+            paths.append(path)
+        for name in PREPROCESSORS:
+            result_queue = context.Queue()
+            process = context.Process(target=_run_preprocessor, args=(name, paths, result_queue))
+            process.start()
+            report[name] = result_queue.get()
+            process.join()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Engine preprocessing gambar")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("benchmark", help="Bandingkan preprocess lama vs engine")
+    bench.add_argument("--size", default="4000x3000", help="Ukuran JPEG sintetis (WxH)")
+    bench.add_argument("--images", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from tflite_backend import format_mb
+    args = parse_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    report = benchmark(size, args.images)
+
+    print(f"📊 Preprocess {args.images} JPEG {size[0]}x{size[1]}")
+    print(f"{'':<8}{'ms/gambar':>12}{'peak RSS (MB)':>16}")
+    for name, result in report.items():
+        print(f"{name:<8}{result['ms_per_image']:>12.1f}{format_mb(result['peak_rss_mb'], 16)}")
+    legacy, engine = report["legacy"], report["engine"]
+    print(f"⚡ Speedup: {legacy['ms_per_image'] / engine['ms_per_image']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
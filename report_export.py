@@ -0,0 +1,368 @@
+"""
+Export massal hasil inspeksi (CSV, JSONL, HTML berhalaman) sebagai stream
+
+Input: output batch_scan.py (CSV/JSONL) dan opsional laporan Gemini dari
+gemini_executor.py. Setiap record berisi label, confidence, laporan AI
+(bila ada) dan thumbnail (JPEG kecil sebagai data URI base64). Record ditulis satu
+per satu, sehingga memori tetap datar untuk kampanye 100.000+ gambar:
+- thumbnail dibuat di thread pool dengan jendela terbatas (draft decode)
+- laporan Gemini di-index per path di SQLite sementara (di disk), bukan dict
+- HTML ditulis per halaman; hanya satu halaman yang ditahan di memori
+- ZIP ditulis langsung ke file / stdout saat record diproses, bukan
+  dirakit di RAM. Thumbnail tidak disimpan sebagai file terpisah: zipfile
+  menyimpan metadata setiap member di memori sampai arsip ditutup
+  (±500 byte per member), jadi jumlah member hanya sebanyak halaman
+
+Isi export (direktori atau .zip):
+    hasil.csv, hasil.jsonl, laporan/index.html, laporan/page-0001.html, ...
+
+Contoh:
+    python report_export.py hasil.jsonl --reports laporan.jsonl --output kampanye.zip
+    python report_export.py hasil.csv --output kampanye/ --formats csv,html --page-size 200
+    python report_export.py hasil.jsonl --output - --thumbnail-size 0 > kampanye.zip
+"""
+import argparse
+import base64
+import csv
+import html
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from batch_scan import iter_decoded, open_writer
+from preprocessing import normalize_channels, open_image
+
+FORMATS = ("csv", "jsonl", "html")
+EXPORT_FIELDS = ["path", "label", "confidence", "error", "report", "report_error", "thumbnail"]
+DEFAULT_PAGE_SIZE = 100
+THUMBNAIL_SIZE = 128
+THUMBNAIL_QUALITY = 70
+COPY_CHUNK = 1024 * 1024
+
+PAGE_STYLE = """
+body{font-family:sans-serif;margin:24px;color:#222}
+table{border-collapse:collapse;width:100%}
+td,th{border-bottom:1px solid #ddd;padding:6px;vertical-align:top;text-align:left}
+img{max-width:128px;max-height:128px}
+.korosi{color:#c0392b;font-weight:bold}
+.bersih{color:#27ae60;font-weight:bold}
+.report{white-space:pre-wrap;max-width:720px}
+nav{margin:12px 0}
+"""
+
+
+def make_thumbnail(source, size=THUMBNAIL_SIZE):
+    """JPEG thumbnail (longest side = size) of an image path or raw bytes, as a data URI"""
+    with open_image(source) as image:
+        if image.format == "JPEG":
+            # Draft decode: gambar 12 MP cukup di-decode pada skala 1/8
+            image.draft("RGB", (size * 2, size * 2))
+        image = normalize_channels(ImageOps.exif_transpose(image))
+    image.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def iter_results(path):
+    """Yield result rows from a batch_scan.py CSV or JSONL output"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+class ReportLookup:
+    """Gemini reports from gemini_executor.py output, indexed by path in a temporary on-disk SQLite table"""
+
+    def __init__(self, path):
+        # "" = database sementara SQLite: di-spill ke disk, dihapus saat ditutup
+        self._conn = sqlite3.connect("")
+        self._conn.execute("CREATE TABLE reports (path TEXT PRIMARY KEY, report TEXT, error TEXT)")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO reports VALUES (?, ?, ?)",
+            ((row["path"], row.get("report", ""), row.get("error", "")) for row in iter_results(path)),
+        )
+        self.count = self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def get(self, path):
+        """(report, error) for path, or None"""
+        return self._conn.execute("SELECT report, error FROM reports WHERE path = ?", (path,)).fetchone()
+
+    def close(self):
+        self._conn.close()
+
+
+class DirectorySink:
+    """Export files written into a directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self._streams = []
+        os.makedirs(path, exist_ok=True)
+
+    def _target(self, name):
+        target = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return target
+
+    def stream(self, name):
+        """Text file for a member written row by row (CSV/JSONL)"""
+        f = open(self._target(name), "w", newline="", encoding="utf-8")
+        self._streams.append(f)
+        return f
+
+    def write(self, name, data):
+        with open(self._target(name), "wb") as f:
+            f.write(data)
+
+    def close(self):
+        for f in self._streams:
+            f.close()
+
+
+class ZipSink:
+    """Export files written into a ZIP archive as they are produced (path, file or unseekable stream)
+
+    zipfile allows only one open member at a time, so the row-by-row
+    members (CSV/JSONL) are spooled to temporary files and copied into the
+    archive on close; HTML pages go in directly.
+    """
+
+    def __init__(self, target):
+        self.zip = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._spooled = []
+
+    def stream(self, name):
+        f = tempfile.TemporaryFile("w+", newline="", encoding="utf-8")
+        self._spooled.append((name, f))
+        return f
+
+    def write(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        for name, f in self._spooled:
+            f.seek(0)
+            # force_zip64: ukuran member belum diketahui saat header ditulis (bisa > 2 GB)
+            with self.zip.open(name, "w", force_zip64=True) as member:
+                for chunk in iter(lambda: f.read(COPY_CHUNK), ""):
+                    member.write(chunk.encode("utf-8"))
+            f.close()
+        self.zip.close()
+
+
+def open_sink(output):
+    """ZipSink for "-" (stdout) or a .zip path, otherwise a DirectorySink"""
+    if output == "-":
+        return ZipSink(sys.stdout.buffer)
+    if output.lower().endswith(".zip"):
+        return ZipSink(output)
+    return DirectorySink(output)
+
+
+class HtmlReport:
+    """Paginated HTML report written page by page: laporan/index.html plus laporan/page-NNNN.html"""
+
+    def __init__(self, sink, page_size=DEFAULT_PAGE_SIZE, title="Laporan Inspeksi Korosi"):
+        self.sink = sink
+        self.page_size = page_size
+        self.title = title
+        self.pages = []
+        self._rows = []
+        self._written = 0
+
+    @staticmethod
+    def page_name(number):
+        return f"page-{number:04d}.html"
+
+    def add(self, row):
+        self._rows.append(row)
+        # Halaman ditulis saat record berikutnya datang, agar link "berikutnya" hanya ada bila perlu
+        if len(self._rows) > self.page_size:
+            self._write_page(self._rows[:self.page_size], has_next=True)
+            self._rows = self._rows[self.page_size:]
+
+    def _write_page(self, rows, has_next):
+        number = len(self.pages) + 1
+        first = self._written + 1
+        self._written += len(rows)
+        corroded = sum(1 for row in rows if row["label"] == "KOROSI")
+        self.pages.append((number, len(rows), corroded))
+
+        links = ['<a href="index.html">Ringkasan</a>']
+        if number > 1:
+            links.append(f'<a href="{self.page_name(number - 1)}">&larr; Sebelumnya</a>')
+        if has_next:
+            links.append(f'<a href="{self.page_name(number + 1)}">Berikutnya &rarr;</a>')
+        nav = f"<nav>{' | '.join(links)}</nav>"
+
+        parts = [self._head(f"{self.title} - halaman {number}"), nav,
+                 "<table><tr><th>#</th><th>Gambar</th><th>File</th><th>Hasil</th><th>Laporan AI</th></tr>"]
+        for offset, row in enumerate(rows):
+            thumbnail = f'<img src="{row["thumbnail"]}">' if row["thumbnail"] else ""
+            if row["error"]:
+                result = f'❌ {html.escape(str(row["error"]))}'
+            else:
+                css = "korosi" if row["label"] == "KOROSI" else "bersih"
+                result = f'<span class="{css}">{html.escape(str(row["label"]))}</span><br>{row["confidence"]}%'
+            report = row["report"] or row["report_error"]
+            if report:
+                report = f'<details><summary>Lihat laporan</summary><div class="report">{html.escape(report)}</div></details>'
+            parts.append(f"<tr><td>{first + offset}</td><td>{thumbnail}</td><td>{html.escape(str(row['path']))}</td>"
+                         f"<td>{result}</td><td>{report}</td></tr>")
+        parts.append(f"</table>{nav}</body></html>")
+        self.sink.write(f"laporan/{self.page_name(number)}", "\n".join(parts).encode("utf-8"))
+
+    def _head(self, title):
+        return (f'<!DOCTYPE html><html lang="id"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+                f"<style>{PAGE_STYLE}</style></head><body><h1>{html.escape(title)}</h1>")
+
+    def close(self, stats):
+        if self._rows or not self.pages:
+            self._write_page(self._rows, has_next=False)
+        parts = [self._head(self.title),
+                 f"<p>{stats['images']} gambar: {stats['corroded']} korosi, {stats['errors']} error, "
+                 f"{stats['reports']} laporan AI. Dibuat {time.strftime('%Y-%m-%d %H:%M')}.</p>",
+                 "<table><tr><th>Halaman</th><th>Gambar</th><th>Korosi</th></tr>"]
+        first = 1
+        for number, count, corroded in self.pages:
+            parts.append(f'<tr><td><a href="{self.page_name(number)}">{number}</a></td>'
+                         f"<td>{first}-{first + count - 1}</td><td>{corroded}</td></tr>")
+            first += count
+        parts.append("</table></body></html>")
+        self.sink.write("laporan/index.html", "\n".join(parts).encode("utf-8"))
+
+
+def export_records(records, sink, formats=FORMATS, page_size=DEFAULT_PAGE_SIZE, thumbnail_size=THUMBNAIL_SIZE,
+                   workers=4, progress_callback=None):
+    """Stream records into sink as CSV/JSONL rows, HTML pages and thumbnails; returns stats
+
+    records are dicts with path, label, confidence and optionally error,
+    report, report_error and source (bytes to build the thumbnail from
+    instead of reading path). The caller closes the sink.
+    """
+    writers = [open_writer(sink.stream(f"hasil.{fmt}"), fmt, EXPORT_FIELDS) for fmt in ("csv", "jsonl") if fmt in formats]
+    report = HtmlReport(sink, page_size) if "html" in formats else None
+    stats = {"images": 0, "corroded": 0, "errors": 0, "reports": 0, "thumbnails": 0}
+    start_time = time.perf_counter()
+
+    def render(record):
+        thumbnail = None
+        if thumbnail_size and not record.get("error"):
+            try:
+                thumbnail = make_thumbnail(record.get("source") or record["path"], thumbnail_size)
+            except Exception:
+                # File hilang / rusak sejak scan: record tetap diexport tanpa thumbnail
+                pass
+        return record, thumbnail
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as executor:
+        # Jendela terbatas: hanya thumbnail yang sedang dibuat yang ada di memori
+        for record, thumbnail in iter_decoded(records, executor, max_inflight=workers * 4, decode=render):
+            stats["images"] += 1
+            confidence = record.get("confidence")
+            row = {
+                "path": record["path"],
+                "label": record.get("label") or "",
+                "confidence": round(float(confidence), 2) if confidence not in (None, "") else "",
+                "error": record.get("error") or "",
+                "report": record.get("report") or "",
+                "report_error": record.get("report_error") or "",
+                "thumbnail": "",
+            }
+            if thumbnail is not None:
+                row["thumbnail"] = thumbnail
+                stats["thumbnails"] += 1
+            for write_row in writers:
+                write_row(row)
+            if report is not None:
+                report.add(row)
+
+            stats["errors"] += bool(row["error"])
+            stats["corroded"] += row["label"] == "KOROSI"
+            stats["reports"] += bool(row["report"])
+            if progress_callback is not None:
+                progress_callback(stats)
+
+    if report is not None:
+        report.close(stats)
+    stats["seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+def parse_formats(value):
+    formats = tuple(part.strip() for part in value.lower().split(",") if part.strip())
+    unknown = set(formats) - set(FORMATS)
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"format harus kombinasi dari {','.join(FORMATS)}")
+    return formats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export massal hasil inspeksi (CSV, JSONL, HTML berhalaman)")
+    parser.add_argument("results", help="Output batch_scan.py (.csv atau .jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="Direktori, file .zip, atau - (ZIP ke stdout)")
+    parser.add_argument("--reports", help="Output JSONL gemini_executor.py (laporan AI per path)")
+    parser.add_argument("--formats", type=parse_formats, default=FORMATS, help="Mis. csv,jsonl,html (default: semua)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Jumlah gambar per halaman HTML")
+    parser.add_argument("--thumbnail-size", type=int, default=THUMBNAIL_SIZE, help="Sisi terpanjang thumbnail (0 = tanpa)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Jumlah thread pembuat thumbnail")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.results):
+        print(f"❌ File hasil tidak ditemukan: {args.results}", file=sys.stderr)
+        return 1
+
+    reports = None
+    if args.reports:
+        reports = ReportLookup(args.reports)
+        print(f"🤖 {reports.count} laporan AI di-index", file=sys.stderr)
+
+    def records():
+        for row in iter_results(args.results):
+            found = reports.get(row["path"]) if reports is not None else None
+            if found is not None:
+                row["report"], row["report_error"] = found
+            yield row
+
+    def report_progress(stats):
+        if stats["images"] % 100 == 0:
+            elapsed = time.perf_counter() - start
+            print(f"\r📦 {stats['images']} record diexport ({stats['images'] / elapsed:.0f}/s)",
+                  end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    sink = open_sink(args.output)
+    try:
+        stats = export_records(records(), sink, args.formats, args.page_size, args.thumbnail_size, args.workers,
+                               progress_callback=report_progress)
+    finally:
+        sink.close()
+        if reports is not None:
+            reports.close()
+    print(file=sys.stderr)
+    print(f"✅ {stats['images']} record ({stats['corroded']} korosi, {stats['errors']} error, "
+          f"{stats['reports']} laporan AI, {stats['thumbnails']} thumbnail) dalam {stats['seconds']:.1f} detik",
+          file=sys.stderr)
+    if args.output != "-":
+        print(f"📄 Export disimpan ke {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
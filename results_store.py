@@ -0,0 +1,211 @@
+"""
+Penyimpanan hasil inspeksi (SQLite) untuk riwayat dan re-scan inkremental
+
+Setiap gambar dicatat per (path, versi model) bersama aset, hash isi,
+ukuran/mtime file, label, confidence dan waktu scan. batch_scan.py
+memakainya untuk melewati file yang tidak berubah:
+- ukuran + mtime sama dengan catatan -> hasil lama dipakai tanpa membaca file
+- isi (SHA-256) sudah pernah diprediksi model yang sama -> tanpa decode/prediksi
+
+Contoh:
+    python results_store.py summary
+    python results_store.py summary --asset tangki_03
+    python results_store.py history /data/survey_drone/tangki_03/IMG_0001.jpg
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from cache import CACHE_DIR
+
+RESULTS_DB = os.getenv("RESULTS_DB", os.path.join(CACHE_DIR, "results.sqlite"))
+RESULT_FIELDS = ("asset", "path", "content_hash", "model_version", "label", "confidence", "error",
+                 "size", "mtime_ns", "scanned_at")
+
+
+def asset_for(path, root):
+    """Asset name of a file: its top-level folder under the scan root (or the root itself)"""
+    relative = os.path.relpath(path, root)
+    parts = relative.split(os.sep)
+    if len(parts) > 1:
+        return parts[0]
+    return os.path.basename(os.path.abspath(root))
+
+
+class ResultsStore:
+    """SQLite table of inspection results, one row per (path, model_version)"""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL: aplikasi / laporan bisa membaca selagi batch scanner menulis
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                asset TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content_hash TEXT,
+                model_version TEXT NOT NULL,
+                label TEXT,
+                confidence REAL,
+                error TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                scanned_at REAL NOT NULL,
+                PRIMARY KEY (path, model_version)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_hash ON results (content_hash, model_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_asset ON results (asset, model_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_model ON results (model_version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_scanned ON results (scanned_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS scans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                root TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                images INTEGER,
+                skipped INTEGER,
+                errors INTEGER
+            )
+        """)
+
+    def known_files(self, model_version, root):
+        """{absolute path: (size, mtime_ns, label, confidence, error)} already recorded under root"""
+        prefix = os.path.join(os.path.abspath(root), "")
+        # Range pada primary key (path) alih-alih LIKE, agar index tetap terpakai
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, label, confidence, error FROM results "
+                "WHERE path >= ? AND path < ? AND model_version = ?",
+                (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1), model_version),
+            ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def find_by_hash(self, content_hash, model_version):
+        """(label, confidence, error) recorded for identical content under this model, or None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT label, confidence, error FROM results WHERE content_hash = ? AND model_version = ? LIMIT 1",
+                (content_hash, model_version),
+            ).fetchone()
+
+    def record(self, rows):
+        """Insert or replace result dicts (keys: RESULT_FIELDS; scanned_at defaults to now) in one transaction"""
+        now = time.time()
+        values = [
+            (row["asset"], os.path.abspath(row["path"]), row.get("content_hash"), row["model_version"],
+             row.get("label"), row.get("confidence"), row.get("error"), row.get("size"), row.get("mtime_ns"),
+             row.get("scanned_at", now))
+            for row in rows
+        ]
+        if not values:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO results ({', '.join(RESULT_FIELDS)}) VALUES ({', '.join('?' * len(RESULT_FIELDS))})",
+                    values,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def start_scan(self, root, model_version):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO scans (root, model_version, started_at) VALUES (?, ?, ?)",
+                (os.path.abspath(root), model_version, time.time()),
+            )
+            return cursor.lastrowid
+
+    def finish_scan(self, scan_id, stats):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE scans SET finished_at = ?, images = ?, skipped = ?, errors = ? WHERE id = ?",
+                (time.time(), stats["images"], stats.get("skipped", 0), stats["errors"], scan_id),
+            )
+
+    def history(self, path):
+        """All recorded results of one file (every model version), newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RESULT_FIELDS)} FROM results WHERE path = ? ORDER BY scanned_at DESC",
+                (os.path.abspath(path),),
+            ).fetchall()
+        return [dict(zip(RESULT_FIELDS, row)) for row in rows]
+
+    def summary(self, asset=None):
+        """Per (asset, model_version): image count, corroded count, errors and last scan time"""
+        query = ("SELECT asset, model_version, COUNT(*), SUM(label = 'KOROSI'), SUM(error IS NOT NULL AND error != ''), "
+                 "MAX(scanned_at) FROM results")
+        params = ()
+        if asset:
+            query += " WHERE asset = ?"
+            params = (asset,)
+        query += " GROUP BY asset, model_version ORDER BY asset, MAX(scanned_at) DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"asset": row[0], "model_version": row[1], "images": row[2], "corroded": row[3] or 0,
+             "errors": row[4] or 0, "last_scan": row[5]}
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)) if timestamp else "-"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Riwayat hasil inspeksi korosi")
+    parser.add_argument("--db", default=RESULTS_DB, help="File SQLite hasil inspeksi")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="Ringkasan per aset dan versi model")
+    summary_parser.add_argument("--asset", help="Hanya aset ini")
+    history_parser = subparsers.add_parser("history", help="Riwayat hasil satu file")
+    history_parser.add_argument("path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"❌ Database hasil tidak ditemukan: {args.db}", file=sys.stderr)
+        return 1
+    store = ResultsStore(args.db)
+
+    if args.command == "summary":
+        rows = store.summary(args.asset)
+        print(f"{'aset':<24}{'model':<18}{'gambar':>8}{'korosi':>8}{'error':>7}  scan terakhir")
+        for row in rows:
+            print(f"{row['asset']:<24}{row['model_version']:<18}{row['images']:>8}{row['corroded']:>8}"
+                  f"{row['errors']:>7}  {format_time(row['last_scan'])}")
+        return 0
+
+    rows = store.history(args.path)
+    if not rows:
+        print(f"ℹ️ Belum ada hasil untuk {args.path}")
+        return 1
+    for row in rows:
+        result = row["error"] or f"{row['label']} ({row['confidence']:.2f}%)"
+        print(f"{format_time(row['scanned_at'])}  model {row['model_version']}  {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
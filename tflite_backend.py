@@ -0,0 +1,290 @@
+"""
+Backend inferensi TFLite (dynamic-range / full-int8) untuk node CPU
+
+Contoh:
+    python tflite_backend.py convert --mode dynamic
+    python tflite_backend.py convert --mode int8 --calibration-dir dataset/train
+    python tflite_backend.py compare --data-dir dataset/test --tflite saved_model.tflite
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from inference import DEFAULT_MODEL_PATH, IMAGE_SIZE, image_to_array, interpret_prediction
+
+DEFAULT_TFLITE_PATH = "saved_model.tflite"
+CALIBRATION_SAMPLES = 200
+
+
+def _load_interpreter_class():
+    """Prefer the standalone LiteRT runtime, fall back to the one bundled in TensorFlow"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """Keras-compatible wrapper so predict_corrosion can use a TFLite model"""
+
+    def __init__(self, model_path=DEFAULT_TFLITE_PATH, num_threads=None):
+        Interpreter = _load_interpreter_class()
+        self.model_path = model_path
+        self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        # Interpreter tidak thread-safe, sedangkan Streamlit melayani banyak sesi
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input["index"], [batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3])
+            self._interpreter.allocate_tensors()
+            self._input = self._interpreter.get_input_details()[0]
+            self._output = self._interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict_on_batch(self, batch):
+        """Run one batch through the interpreter, returning float probabilities"""
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            self._resize(len(batch))
+
+            if self._input["dtype"] != np.float32:
+                # Model full-int8: kuantisasi input sesuai scale/zero point
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(self._input["dtype"])
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(self._input["dtype"])
+
+            self._interpreter.set_tensor(self._input["index"], batch)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def predict(self, batch, verbose=0):
+        """Same call signature as keras Model.predict"""
+        return self.predict_on_batch(batch)
+
+
+def iter_image_files(data_dir):
+    """Yield image files under data_dir in a stable order"""
+    for root, _, files in sorted(os.walk(data_dir)):
+        for name in sorted(files):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                yield os.path.join(root, name)
+
+
+def load_image_array(path):
+    with Image.open(path) as image:
+        return image_to_array(image)
+
+
+def convert(keras_path=DEFAULT_MODEL_PATH, output_path=DEFAULT_TFLITE_PATH, mode="dynamic", calibration_dir=None):
+    """Convert the saved Keras model to a quantized TFLite flatbuffer"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == "int8":
+        if not calibration_dir:
+            raise ValueError("Mode int8 membutuhkan --calibration-dir untuk representative dataset")
+        paths = list(iter_image_files(calibration_dir))[:CALIBRATION_SAMPLES]
+        if not paths:
+            raise ValueError(f"Tidak ada gambar kalibrasi di {calibration_dir}")
+
+        def representative_dataset():
+            for path in paths:
+                yield [np.expand_dims(load_image_array(path), axis=0)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    tflite_model = converter.convert()
+
+    # Tulis ke file sementara lalu rename agar tidak ada file setengah jadi
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB, or None when it cannot be measured"""
+    # VmHWM di-reset saat exec, berbeda dengan ru_maxrss yang diwarisi dari parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows tidak punya modul resource; psutil (opsional) memberi peak working set
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss dalam byte di macOS, dalam KB di Linux/BSD
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def rss_growth_mb(baseline):
+    """Peak RSS growth in MB since a peak_rss_mb() baseline, or None when unmeasurable"""
+    peak = peak_rss_mb()
+    return None if peak is None or baseline is None else peak - baseline
+
+
+def format_mb(value, width):
+    """Right-aligned MB value with one decimal, or n/a"""
+    return f"{'n/a':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+def _load_and_report_rss(backend, path, result_queue):
+    # Dijalankan di proses terpisah agar pengukuran memori tiap backend tidak tercampur
+    baseline = peak_rss_mb()
+    if backend == "tflite":
+        model = TFLiteModel(path)
+    else:
+        import tensorflow as tf
+        model = tf.keras.models.load_model(path)
+    model.predict_on_batch(np.zeros((1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32))
+    result_queue.put(rss_growth_mb(baseline))
+
+
+def measure_load_memory(backend, path):
+    """Peak RSS growth (MB) of loading a model and running one inference"""
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_load_and_report_rss, args=(backend, path, result_queue))
+    process.start()
+    rss_mb = result_queue.get()
+    process.join()
+    return rss_mb
+
+
+def measure_latency(model, batch_size, repeats=20):
+    """Mean per-image latency (ms) for the given batch size"""
+    batch = np.random.default_rng(0).random((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    model.predict_on_batch(batch)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_on_batch(batch)
+    return (time.perf_counter() - start) * 1000 / (repeats * batch_size)
+
+
+def compare(keras_path, tflite_path, data_dir, batch_size=32):
+    """Accuracy parity plus latency/memory report of TFLite vs the float Keras model"""
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(keras_path)
+    tflite_model = TFLiteModel(tflite_path)
+
+    paths = list(iter_image_files(data_dir))
+    if not paths:
+        raise ValueError(f"Tidak ada gambar di {data_dir}")
+
+    agree = 0
+    prob_diffs = []
+    for start in range(0, len(paths), batch_size):
+        batch = np.stack([load_image_array(p) for p in paths[start:start + batch_size]])
+        keras_probs = np.asarray(keras_model.predict_on_batch(batch))[:, 0]
+        tflite_probs = np.asarray(tflite_model.predict_on_batch(batch))[:, 0]
+        for kp, tp in zip(keras_probs, tflite_probs):
+            agree += interpret_prediction(kp)[0] == interpret_prediction(tp)[0]
+            prob_diffs.append(abs(float(kp) - float(tp)))
+
+    return {
+        "images": len(paths),
+        "label_agreement": agree / len(paths) * 100,
+        "mean_prob_diff": float(np.mean(prob_diffs)),
+        "max_prob_diff": float(np.max(prob_diffs)),
+        "size_mb": {
+            "keras": os.path.getsize(keras_path) / (1024 * 1024),
+            "tflite": os.path.getsize(tflite_path) / (1024 * 1024),
+        },
+        "latency_ms": {
+            "keras": {bs: measure_latency(keras_model, bs) for bs in (1, batch_size)},
+            "tflite": {bs: measure_latency(tflite_model, bs) for bs in (1, batch_size)},
+        },
+        "rss_mb": {
+            "keras": measure_load_memory("keras", keras_path),
+            "tflite": measure_load_memory("tflite", tflite_path),
+        },
+    }
+
+
+def print_report(report):
+    print("=" * 50)
+    print("📊 Keras vs TFLite Comparison")
+    print("=" * 50)
+    print(f"Gambar uji            : {report['images']}")
+    print(f"Kesesuaian label      : {report['label_agreement']:.2f}%")
+    print(f"Selisih prob rata-rata: {report['mean_prob_diff']:.4f} (max {report['max_prob_diff']:.4f})")
+    print()
+    print(f"{'':<22}{'Keras':>12}{'TFLite':>12}")
+    print(f"{'Ukuran file (MB)':<22}{report['size_mb']['keras']:>12.2f}{report['size_mb']['tflite']:>12.2f}")
+    print(f"{'Peak RSS load (MB)':<22}{format_mb(report['rss_mb']['keras'], 12)}{format_mb(report['rss_mb']['tflite'], 12)}")
+    for bs in report["latency_ms"]["keras"]:
+        label = f"Latency/img bs={bs} (ms)"
+        print(f"{label:<22}{report['latency_ms']['keras'][bs]:>12.2f}{report['latency_ms']['tflite'][bs]:>12.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Konversi dan evaluasi backend TFLite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="Konversi model Keras ke TFLite")
+    convert_parser.add_argument("--keras", default=DEFAULT_MODEL_PATH, help="Path model Keras")
+    convert_parser.add_argument("--output", default=DEFAULT_TFLITE_PATH, help="Path output .tflite")
+    convert_parser.add_argument("--mode", choices=["dynamic", "int8"], default="dynamic")
+    convert_parser.add_argument("--calibration-dir", help="Folder gambar untuk kalibrasi int8")
+
+    compare_parser = subparsers.add_parser("compare", help="Bandingkan akurasi, latency dan memori")
+    compare_parser.add_argument("--keras", default=DEFAULT_MODEL_PATH, help="Path model Keras")
+    compare_parser.add_argument("--tflite", default=DEFAULT_TFLITE_PATH, help="Path model TFLite")
+    compare_parser.add_argument("--data-dir", required=True, help="Folder gambar held-out")
+    compare_parser.add_argument("--batch-size", type=int, default=32)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "convert":
+        output = convert(args.keras, args.output, args.mode, args.calibration_dir)
+        print(f"✅ Model TFLite ({args.mode}) disimpan: {output} ({os.path.getsize(output) / (1024 * 1024):.2f} MB)")
+        return 0
+
+    print_report(compare(args.keras, args.tflite, args.data_dir, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
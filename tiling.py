@@ -0,0 +1,107 @@
+"""
+Inferensi tiled untuk gambar resolusi tinggi (drone 20-40 MP)
+
+Gambar dipotong menjadi window 128x128 yang saling tumpang tindih,
+semua tile diklasifikasi dalam batch besar, lalu probabilitas korosi
+per tile dirakit menjadi heatmap per region.
+"""
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from inference import IMAGE_SIZE, predict_proba
+from preprocessing import check_image_size, normalize_channels
+
+# Sisi terpanjang gambar kerja; 40 MP diperkecil dulu agar jumlah tile tetap ratusan
+DEFAULT_MAX_SIDE = 2048
+DEFAULT_OVERLAP = 0.25
+DEFAULT_TILE_BATCH = 256
+# Heatmap diakumulasi pada resolusi 1/HEATMAP_SCALE dari gambar kerja
+HEATMAP_SCALE = 8
+
+
+def tile_positions(length, tile, stride):
+    """Start offsets along one axis; the last tile is aligned to the edge"""
+    if length <= tile:
+        return np.array([0])
+    positions = np.arange(0, length - tile + 1, stride)
+    if positions[-1] != length - tile:
+        positions = np.append(positions, length - tile)
+    return positions
+
+
+def prepare_work_image(image, max_side=DEFAULT_MAX_SIDE):
+    """RGB copy of the image downscaled so its longest side is at most max_side"""
+    check_image_size(image)
+    image = normalize_channels(ImageOps.exif_transpose(image))
+    scale = min(1.0, max_side / max(image.size))
+    if scale < 1.0:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+    # Gambar lebih kecil dari satu tile diperbesar agar minimal 1 tile penuh
+    if image.width < IMAGE_SIZE[0] or image.height < IMAGE_SIZE[1]:
+        image = image.resize((max(image.width, IMAGE_SIZE[0]), max(image.height, IMAGE_SIZE[1])), Image.BILINEAR)
+    return image
+
+
+def predict_tiles(model, image, max_side=DEFAULT_MAX_SIDE, overlap=DEFAULT_OVERLAP, batch_size=DEFAULT_TILE_BATCH):
+    """Classify overlapping tiles; returns (work_image, heatmap, stats)
+
+    heatmap holds the mean corrosion probability (0-1) per region at
+    1/HEATMAP_SCALE of the work image resolution.
+    """
+    start_time = time.perf_counter()
+    work_image = prepare_work_image(image, max_side)
+    pixels = np.asarray(work_image)
+    height, width = pixels.shape[:2]
+    tile = IMAGE_SIZE[0]
+    stride = max(1, int(tile * (1 - overlap)))
+
+    ys = tile_positions(height, tile, stride)
+    xs = tile_positions(width, tile, stride)
+    grid_y, grid_x = np.meshgrid(ys, xs, indexing="ij")
+    origins = np.stack([grid_y.ravel(), grid_x.ravel()], axis=1)
+
+    # View semua window tanpa menyalin; tile hanya disalin per batch
+    windows = np.lib.stride_tricks.sliding_window_view(pixels, (tile, tile), axis=(0, 1))
+    batch = np.empty((min(batch_size, len(origins)), tile, tile, 3), dtype=np.float32)
+    probs = np.empty(len(origins), dtype=np.float32)
+
+    for start in range(0, len(origins), batch_size):
+        chunk = origins[start:start + batch_size]
+        out = batch[:len(chunk)]
+        # windows[y, x] berbentuk (3, tile, tile) -> transpose ke (tile, tile, 3)
+        np.multiply(windows[chunk[:, 0], chunk[:, 1]].transpose(0, 2, 3, 1), 1.0 / 255.0, out=out)
+        # Output model = probabilitas kelas 1 (TIDAK ADA KOROSI)
+        probs[start:start + len(chunk)] = 1.0 - predict_proba(model, out)
+
+    # Rata-rata probabilitas tile yang tumpang tindih per region
+    heat_h, heat_w = -(-height // HEATMAP_SCALE), -(-width // HEATMAP_SCALE)
+    heat_sum = np.zeros((heat_h, heat_w), dtype=np.float32)
+    heat_count = np.zeros((heat_h, heat_w), dtype=np.float32)
+    cell = tile // HEATMAP_SCALE
+    for (y, x), prob in zip(origins // HEATMAP_SCALE, probs):
+        heat_sum[y:y + cell, x:x + cell] += prob
+        heat_count[y:y + cell, x:x + cell] += 1
+    heatmap = np.divide(heat_sum, heat_count, out=np.zeros_like(heat_sum), where=heat_count > 0)
+
+    stats = {
+        "tiles": len(origins),
+        "work_size": (width, height),
+        "max_prob": float(probs.max()),
+        "corroded_area": float((heatmap > 0.5).mean() * 100),
+        "seconds": time.perf_counter() - start_time,
+    }
+    return work_image, heatmap, stats
+
+
+def render_heatmap_overlay(work_image, heatmap, alpha=0.55):
+    """Overlay the heatmap on the work image (transparent = clean, red = corrosion)"""
+    heat = np.clip(heatmap, 0.0, 1.0)
+    rgba = np.zeros(heat.shape + (4,), dtype=np.uint8)
+    # Gradasi kuning -> merah sesuai probabilitas korosi
+    rgba[..., 0] = 255
+    rgba[..., 1] = (220 * (1.0 - heat)).astype(np.uint8)
+    rgba[..., 3] = (255 * alpha * heat).astype(np.uint8)
+    overlay = Image.fromarray(rgba).resize(work_image.size, Image.BILINEAR)
+    return Image.alpha_composite(work_image.convert("RGBA"), overlay).convert("RGB")
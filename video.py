@@ -0,0 +1,295 @@
+"""
+Inspeksi video dan sekuens frame (rekaman robot crawler)
+
+Frame di-decode sebagai stream, diambil setiap `stride` frame, frame yang
+hampir identik dengan frame sebelumnya dibuang dengan cek selisih murah,
+lalu sisanya diprediksi per batch. Output: timeline probabilitas korosi.
+
+Input video (.mp4, .avi, ...) membutuhkan OpenCV (opsional):
+    pip install opencv-python-headless
+
+Contoh:
+    python video.py inspeksi.mp4 --output timeline.csv --stride 5
+    python video.py /data/frames --output timeline.jsonl --fps 30
+    python video.py rekaman.gif --output timeline.csv --stride 1 --dedup-threshold 0
+    python video.py inspeksi.mp4 --output timeline.csv --inference-workers auto
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PIL import ImageSequence
+
+from batch_scan import iter_image_paths, open_writer
+from inference import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MODEL_PATH,
+    IMAGE_SIZE,
+    INFERENCE_WORKERS,
+    inflight_batches,
+    interpret_prediction,
+    load_model_from_path,
+    parse_workers,
+    submit_batch,
+)
+from preprocessing import BatchBuffer, open_image, prepare_image
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+DEFAULT_STRIDE = int(os.getenv("VIDEO_FRAME_STRIDE", 5))
+# Rata-rata selisih absolut (skala 0-255) di bawah nilai ini dianggap frame duplikat
+DEFAULT_DEDUP_THRESHOLD = float(os.getenv("VIDEO_DEDUP_THRESHOLD", 2.0))
+# FPS yang diasumsikan untuk direktori frame tanpa timestamp
+DEFAULT_SEQUENCE_FPS = 30.0
+# Sidik frame untuk dedup: grayscale 32x32 dari frame 128x128
+SIGNATURE_BLOCK = 4
+DEFAULT_PREFETCH = 64
+TIMELINE_FIELDS = ["frame", "time", "probability", "label", "duplicate"]
+
+
+def _load_cv2():
+    try:
+        import cv2
+    except ImportError as e:
+        raise ImportError("Input video membutuhkan OpenCV: pip install opencv-python-headless") from e
+    return cv2
+
+
+def iter_video_frames(path, stride=DEFAULT_STRIDE):
+    """Yield (frame_index, seconds, fps, frame) from a video file via OpenCV
+
+    Skipped frames are only grabbed (no color conversion or resize); kept
+    frames are downscaled to the model size before leaving the decoder.
+    """
+    cv2 = _load_cv2()
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"Video tidak bisa dibuka: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_SEQUENCE_FPS
+    index = 0
+    try:
+        while True:
+            if index % stride:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                small = cv2.resize(frame, IMAGE_SIZE, interpolation=cv2.INTER_AREA)
+                yield index, index / fps, fps, np.ascontiguousarray(small[..., ::-1])
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_sequence_frames(source, stride=DEFAULT_STRIDE, fps=DEFAULT_SEQUENCE_FPS):
+    """Yield (frame_index, seconds, fps, frame) from an image directory or animated image"""
+    if os.path.isdir(source):
+        for index, path in enumerate(iter_image_paths(source)):
+            if index % stride == 0:
+                with open_image(path) as image:
+                    yield index, index / fps, fps, np.asarray(prepare_image(image, draft=True))
+        return
+
+    with open_image(source) as image:
+        durations = []
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            # Timestamp GIF/WebP dari durasi per frame (ms) bila tersedia
+            durations.append(frame.info.get("duration") or 1000 / fps)
+            if index % stride == 0:
+                seconds = (sum(durations) - durations[-1]) / 1000
+                frame_fps = 1000 / durations[-1]
+                yield index, seconds, frame_fps, np.asarray(prepare_image(frame.copy(), draft=False))
+
+
+def iter_frames(source, stride=DEFAULT_STRIDE, fps=DEFAULT_SEQUENCE_FPS):
+    """Pick the frame reader for a video file, animated image or frame directory"""
+    if not os.path.isdir(source) and source.lower().endswith(VIDEO_EXTENSIONS):
+        return iter_video_frames(source, stride)
+    return iter_sequence_frames(source, stride, fps)
+
+
+def prefetch(frames, size=DEFAULT_PREFETCH):
+    """Decode frames in a background thread so decoding overlaps the model"""
+    buffer = queue.Queue(maxsize=size)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in frames:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(done)
+        except Exception as e:
+            buffer.put(e)
+
+    thread = threading.Thread(target=produce, daemon=True, name="video-decode")
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def frame_signature(frame):
+    """Cheap grayscale thumbnail used for the duplicate check"""
+    height, width = frame.shape[0] // SIGNATURE_BLOCK, frame.shape[1] // SIGNATURE_BLOCK
+    blocks = frame[:height * SIGNATURE_BLOCK, :width * SIGNATURE_BLOCK]
+    return blocks.reshape(height, SIGNATURE_BLOCK, width, SIGNATURE_BLOCK, 3).mean(axis=(1, 3, 4), dtype=np.float32)
+
+
+def inspect_frames(model, frames, write_row, batch_size=DEFAULT_BATCH_SIZE,
+                   dedup_threshold=DEFAULT_DEDUP_THRESHOLD, progress_callback=None, stride=1):
+    """Predict sampled frames in batches and stream timeline rows to write_row
+
+    Dropped duplicates reuse the probability of the frame they matched.
+    progress_callback(stats) is called after every batch. stride is the
+    sampling stride of frames, used for the covered video duration.
+    """
+    stats = {"sampled": 0, "predicted": 0, "duplicates": 0, "corroded": 0, "max_probability": 0.0,
+             "video_seconds": 0.0}
+    start_time = time.perf_counter()
+    buffer = BatchBuffer(batch_size)
+    pending = []
+    # Batch yang sudah dikirim ke model (beberapa sekaligus bila memakai worker pool)
+    submitted = deque()
+    last_signature = None
+    carried_prob = None
+
+    def submit():
+        count = sum(1 for row in pending if not row["duplicate"])
+        future = submit_batch(model, buffer.array[:count]) if count else None
+        submitted.append((list(pending), future))
+        pending.clear()
+
+    def finish(rows, future):
+        nonlocal carried_prob
+        probs = future.result() if future is not None else []
+        slot = 0
+        for row in rows:
+            if not row["duplicate"]:
+                carried_prob = float(probs[slot])
+                slot += 1
+            label, _ = interpret_prediction(carried_prob)
+            # Output model = probabilitas kelas 1 (TIDAK ADA KOROSI)
+            probability = 1.0 - carried_prob
+            write_row({"frame": row["frame"], "time": round(row["time"], 3), "probability": round(probability, 4),
+                       "label": label, "duplicate": row["duplicate"]})
+            if label == "KOROSI":
+                stats["corroded"] += 1
+            stats["max_probability"] = max(stats["max_probability"], probability)
+        if progress_callback:
+            progress_callback(stats)
+
+    def flush(limit):
+        while len(submitted) > limit:
+            finish(*submitted.popleft())
+
+    for index, seconds, fps, frame in frames:
+        stats["sampled"] += 1
+        # Setiap frame sampel mewakili stride frame sumber
+        stats["video_seconds"] = seconds + stride / fps
+        signature = frame_signature(frame)
+        duplicate = (last_signature is not None and dedup_threshold > 0
+                     and float(np.abs(signature - last_signature).mean()) < dedup_threshold)
+        if duplicate:
+            stats["duplicates"] += 1
+        else:
+            # Dibandingkan dengan frame terakhir yang diprediksi, agar drift lambat tetap terdeteksi
+            last_signature = signature
+            np.multiply(frame, np.float32(1.0 / 255.0), out=buffer.array[stats["predicted"] % batch_size],
+                        dtype=np.float32)
+            stats["predicted"] += 1
+        pending.append({"frame": index, "time": seconds, "duplicate": duplicate})
+        if not duplicate and stats["predicted"] % batch_size == 0:
+            submit()
+            flush(inflight_batches(model))
+
+    if pending:
+        submit()
+    flush(0)
+    stats["seconds"] = time.perf_counter() - start_time
+    stats["realtime_factor"] = stats["video_seconds"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def inspect_video(model, source, write_row, stride=DEFAULT_STRIDE, batch_size=DEFAULT_BATCH_SIZE,
+                  dedup_threshold=DEFAULT_DEDUP_THRESHOLD, fps=DEFAULT_SEQUENCE_FPS, progress_callback=None):
+    """Inspect a video file, animated image or frame directory; returns stats"""
+    frames = prefetch(iter_frames(source, stride, fps))
+    return inspect_frames(model, frames, write_row, batch_size, dedup_threshold, progress_callback, stride)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspeksi korosi pada video / sekuens frame")
+    parser.add_argument("source", help=f"File video {VIDEO_EXTENSIONS}, gambar animasi atau direktori frame")
+    parser.add_argument("-o", "--output", required=True, help="File timeline (.csv atau .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Format output (default: dari ekstensi file)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path model Keras / TFLite")
+    parser.add_argument("--stride", type=int, default=DEFAULT_STRIDE, help="Ambil setiap N frame")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_DEDUP_THRESHOLD,
+                        help="Selisih rata-rata minimum (0-255) agar frame tidak dianggap duplikat; 0 = nonaktif")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Ukuran batch model")
+    parser.add_argument("--fps", type=float, default=DEFAULT_SEQUENCE_FPS, help="FPS untuk direktori frame")
+    parser.add_argument("--inference-workers", type=parse_workers, default=INFERENCE_WORKERS,
+                        help="Jumlah proses inferensi (auto = jumlah core, 0 = satu proses)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = args.format or ("jsonl" if args.output.lower().endswith(".jsonl") else "csv")
+
+    if not os.path.exists(args.source):
+        print(f"❌ Input tidak ditemukan: {args.source}", file=sys.stderr)
+        return 1
+
+    print(f"🔄 Loading model: {args.model}", file=sys.stderr)
+    model = load_model_from_path(args.model, workers=args.inference_workers)
+    if args.inference_workers:
+        args.batch_size = min(args.batch_size, model.batch_size)
+
+    def report(stats):
+        elapsed = time.perf_counter() - start
+        print(f"\r🎞️ {stats['sampled']} frame ({stats['duplicates']} duplikat, "
+              f"{stats['video_seconds'] / elapsed:.1f}x realtime)", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    try:
+        with open(args.output, "w", newline="", encoding="utf-8") as output:
+            write_row = open_writer(output, fmt, TIMELINE_FIELDS)
+            stats = inspect_video(model, args.source, write_row, args.stride, args.batch_size,
+                                  args.dedup_threshold, args.fps, progress_callback=report)
+    except ImportError as e:
+        print(f"\n❌ {e}", file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+
+    print(f"✅ Selesai: {stats['sampled']} frame diambil, {stats['predicted']} diprediksi, "
+          f"{stats['duplicates']} duplikat, {stats['corroded']} frame korosi", file=sys.stderr)
+    print(f"⏱️ {stats['video_seconds']:.1f} detik rekaman dalam {stats['seconds']:.1f} detik "
+          f"({stats['realtime_factor']:.1f}x realtime)", file=sys.stderr)
+    print(f"📄 Timeline disimpan ke {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Pool proses inferensi dengan batch lewat shared memory
+
+Satu proses Python hanya memakai satu interpreter (dan st.cache_resource
+menyimpan satu model per proses). InferencePool menjalankan N proses
+worker yang masing-masing memuat model; batch yang sudah dipreprocess
+ditulis ke slot di satu blok shared memory, sehingga yang lewat antar
+proses hanya (slot, jumlah gambar) - array tidak pernah di-pickle.
+
+Pool memakai interface yang sama dengan model Keras/TFLite
+(predict_on_batch / predict) ditambah submit() yang mengembalikan Future,
+sehingga front-end bisa menjaga beberapa batch tetap berjalan sekaligus.
+
+Aktifkan dengan INFERENCE_WORKERS=auto (jumlah core) atau angka, atau
+flag --inference-workers di batch_scan.py, video.py dan inference_server.py.
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from inference import DEFAULT_BATCH_SIZE, IMAGE_SIZE, available_cpus, image_to_array, load_model_from_path
+
+# Cek worker yang mati setiap interval ini selagi menunggu hasil
+HEALTH_CHECK_SECONDS = 1.0
+
+
+def _attach(name):
+    """Attach to a shared memory block created by the parent process"""
+    # Worker spawn berbagi resource tracker dengan parent, jadi blok hanya di-unlink sekali (oleh parent)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(model_path, backend, num_threads, input_name, output_name, slots, batch_size, tasks, results):
+    """Worker process: load the model once, then run batches from shared memory slots"""
+    input_block, output_block = _attach(input_name), _attach(output_name)
+    inputs = np.ndarray((slots, batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32, buffer=input_block.buf)
+    outputs = np.ndarray((slots, batch_size), dtype=np.float32, buffer=output_block.buf)
+    try:
+        model = load_model_from_path(model_path, backend, num_threads=num_threads, workers=0)
+    except Exception as e:
+        results.put(("failed", os.getpid(), f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", os.getpid(), None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, count = task
+        try:
+            outputs[slot, :count] = np.asarray(model.predict_on_batch(inputs[slot, :count])).reshape(-1)
+            results.put(("done", slot, None))
+        except Exception as e:
+            results.put(("done", slot, f"{type(e).__name__}: {e}"))
+
+    del inputs, outputs
+    input_block.close()
+    output_block.close()
+
+
+class InferencePool:
+    """N inference processes fed through shared-memory batch slots
+
+    Each slot holds one batch of up to batch_size images; a slot is owned
+    by the caller from acquire until its result has been copied out, so
+    at most `slots` batches are in flight (backpressure for producers).
+    """
+
+    def __init__(self, model_path, workers=None, batch_size=DEFAULT_BATCH_SIZE, backend=None, slots=None):
+        self.model_path = model_path
+        self.workers = workers or available_cpus()
+        self.batch_size = batch_size
+        # Dua slot per worker: satu dihitung, satu sedang diisi producer
+        self.slots = slots or self.workers * 2
+        # Bagi core antar worker agar thread intra-op tidak saling berebut
+        num_threads = max(1, available_cpus() // self.workers)
+
+        self._input_block = shared_memory.SharedMemory(
+            create=True, size=self.slots * batch_size * IMAGE_SIZE[1] * IMAGE_SIZE[0] * 3 * 4)
+        self._output_block = shared_memory.SharedMemory(create=True, size=self.slots * batch_size * 4)
+        self.inputs = np.ndarray((self.slots, batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32,
+                                 buffer=self._input_block.buf)
+        self.outputs = np.ndarray((self.slots, batch_size), dtype=np.float32, buffer=self._output_block.buf)
+
+        self._free = queue.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._broken = None
+
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(model_path, backend, num_threads, self._input_block.name, self._output_block.name,
+                      self.slots, batch_size, self._tasks, self._results),
+                name=f"inference-worker-{i}",
+                daemon=True,
+            )
+            for i in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        atexit.register(self.close)
+
+        try:
+            self._wait_ready()
+        except Exception:
+            self.close()
+            raise
+        self._collector = threading.Thread(target=self._collect, name="inference-pool-results", daemon=True)
+        self._collector.start()
+
+    def _wait_ready(self):
+        ready = 0
+        while ready < self.workers:
+            try:
+                kind, _, error = self._results.get(timeout=HEALTH_CHECK_SECONDS)
+            except queue.Empty:
+                if any(not p.is_alive() for p in self._processes):
+                    raise RuntimeError("Worker inferensi berhenti saat memuat model")
+                continue
+            if kind == "failed":
+                raise RuntimeError(f"Worker inferensi gagal memuat model: {error}")
+            ready += 1
+
+    def _collect(self):
+        """Resolve futures as workers report finished slots"""
+        while not self._closed:
+            try:
+                _, slot, error = self._results.get(timeout=HEALTH_CHECK_SECONDS)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead and not self._closed:
+                    self._fail_all(RuntimeError(f"Worker inferensi berhenti: {', '.join(dead)}"))
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                future, count = self._pending.pop(slot)
+            if error is None:
+                # Salin hasil dulu; setelah slot dilepas isinya bisa ditimpa batch lain
+                future.set_result(self.outputs[slot, :count].copy())
+            else:
+                future.set_exception(RuntimeError(error))
+            self._free.put(slot)
+
+    def _fail_all(self, error):
+        with self._lock:
+            self._broken = error
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(error)
+
+    def acquire(self):
+        """Reserve a free slot (blocks while all slots are in flight); returns its index"""
+        if self._broken is not None:
+            raise self._broken
+        if self._closed:
+            raise RuntimeError("InferencePool sudah ditutup")
+        return self._free.get()
+
+    def submit_slot(self, slot, count):
+        """Send the first count images of a filled slot to the workers; returns a Future of probabilities"""
+        future = Future()
+        with self._lock:
+            if self._broken is not None:
+                self._free.put(slot)
+                raise self._broken
+            self._pending[slot] = (future, count)
+        self._tasks.put((slot, count))
+        return future
+
+    def submit(self, batch):
+        """Copy a preprocessed batch (<= batch_size images) into shared memory and queue it"""
+        count = len(batch)
+        if count > self.batch_size:
+            raise ValueError(f"Batch {count} melebihi kapasitas slot {self.batch_size}")
+        slot = self.acquire()
+        self.inputs[slot, :count] = batch
+        return self.submit_slot(slot, count)
+
+    def submit_images(self, images, draft=False):
+        """Preprocess PIL images straight into a shared memory slot and queue the batch"""
+        count = len(images)
+        if count > self.batch_size:
+            raise ValueError(f"Batch {count} melebihi kapasitas slot {self.batch_size}")
+        slot = self.acquire()
+        try:
+            for i, image in enumerate(images):
+                image_to_array(image, out=self.inputs[slot, i], draft=draft)
+        except Exception:
+            self._free.put(slot)
+            raise
+        return self.submit_slot(slot, count)
+
+    def predict_on_batch(self, batch):
+        """Blocking prediction with the Keras (N, 1) output shape; large batches are split across workers"""
+        futures = [self.submit(batch[start:start + self.batch_size]) for start in range(0, len(batch), self.batch_size)]
+        return np.concatenate([future.result() for future in futures]).reshape(-1, 1)
+
+    def predict(self, batch, verbose=0):
+        """Same call signature as keras Model.predict"""
+        return self.predict_on_batch(batch)
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._fail_all(RuntimeError("InferencePool sudah ditutup"))
+        del self.inputs, self.outputs
+        for block in (self._input_block, self._output_block):
+            block.close()
+            block.unlink()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False